@@ -2,6 +2,7 @@ from flask_restx import Api
 from flask import Blueprint
 from .main.controller.arrangements_controller import api as arrangements_ns
 from .main.controller.user_controller import api as user_ns
+from .main.controller.replicate_controller import api as replicate_ns
 
 blueprint = Blueprint('api', __name__, url_prefix="/api")
 authorizations = {
@@ -24,3 +25,4 @@ api = Api(
 
 api.add_namespace(arrangements_ns)
 api.add_namespace(user_ns)
+api.add_namespace(replicate_ns)
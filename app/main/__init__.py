@@ -1,12 +1,32 @@
 import os
+import tempfile
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from .service.disk_cache import CachedStorage
 from .service.s3_storage_service import S3Storage
-from .controller.websocket_controller import sock
+from .util import metrics
+from .util.response_cache import ResponseCache
+from .util.shared_store import get_redis
 
 app = Flask(__name__)
 db = SQLAlchemy()
-s3_storage = S3Storage()
+s3_storage = CachedStorage(
+    S3Storage(),
+    os.getenv('STORAGE_CACHE_DIR', os.path.join(tempfile.gettempdir(), f'harmonia-storage-{os.getuid()}')),
+    int(os.getenv('STORAGE_CACHE_MAX_MB', 1024)) * 1024 * 1024
+)
+response_cache = ResponseCache(
+    max_size=int(os.getenv('RESPONSE_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('RESPONSE_CACHE_TTL', 30)),
+    shared_store=get_redis()
+)
+
+metrics.Gauge('harmonia_storage_cache', 'Storage disk cache statistics', ('stat',),
+              function=lambda: {(stat,): value for stat, value in s3_storage.stats().items()})
+metrics.Gauge('harmonia_response_cache', 'Response cache statistics', ('stat',),
+              function=lambda: {(stat,): value for stat, value in response_cache.stats().items()})
+
+from .controller.websocket_controller import sock  # noqa: E402
 
 
 def create_app() -> Flask:
@@ -14,5 +34,6 @@ def create_app() -> Flask:
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("SQLALCHEMY_DATABASE_URI")
     sock.init_app(app)
     db.init_app(app)
+    metrics.init_app(app)
 
     return app
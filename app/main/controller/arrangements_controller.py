@@ -1,25 +1,69 @@
-from concurrent.futures import ThreadPoolExecutor
-from io import BytesIO
-from flask import request, send_file
+import json
+import math
+import os
+import uuid
+from flask import Response, redirect, request, send_file, stream_with_context
 from flask_restx import Resource, reqparse
-from .. import s3_storage
+from .. import response_cache, s3_storage
 from ..model.arrangement_status import ArrangementStatus
-from ..util import converter
+from ..util import converter, storage_keys
+from ..util.tags import normalize_tags
 from ..util.decorator import require_access_token
+from ..util.http import attachment
 from ..util.dto import ArrangementDTO
-from ..service.database import arrangement_service, user_service
-from ..service import vk_api_service, audio_to_video_service
+from ..service.database import arrangement_service, counter_service, job_service, user_service, share_job_service
+from ..service import audio_mixer, rendition_service, share_service
 from ..controller import websocket_controller
 
 api = ArrangementDTO().api
 create_arrangement = ArrangementDTO().create_arrangement
 create_arrangement_response = ArrangementDTO().create_arrangement_response
+create_arrangement_from_upload = ArrangementDTO().create_arrangement_from_upload
+drums_upload = ArrangementDTO().drums_upload
 single_arrangement = ArrangementDTO().arrangement
 rename_arrangement = ArrangementDTO().rename_arrangement
 arrangements_list = ArrangementDTO().arrangements_list
+arrangements_summary = ArrangementDTO().arrangements_summary
+bulk_ids = ArrangementDTO().bulk_ids
+bulk_response = ArrangementDTO().bulk_response
 upload_video = ArrangementDTO().upload_video
+upload_video_response = ArrangementDTO().upload_video_response
+share_job = ArrangementDTO().share_job
 
-executor = ThreadPoolExecutor(max_workers=5)
+download_mode = os.getenv('DOWNLOAD_MODE', 'stream')
+download_url_expires = int(os.getenv('DOWNLOAD_URL_EXPIRES', 300))
+drums_upload_max_bytes = int(os.getenv('DRUMS_UPLOAD_MAX_MB', 50)) * 1024 * 1024
+drums_upload_url_expires = int(os.getenv('DRUMS_UPLOAD_URL_EXPIRES', 600))
+bulk_max_ids = int(os.getenv('BULK_MAX_IDS', 1000))
+
+
+def _flag(value):
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def _conditional(user_id, load):
+    version = response_cache.version(user_id)
+    etag = response_cache.etag(user_id, version, request.full_path)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    result = response_cache.get(user_id, version, request.full_path)
+    if result is None:
+        result = load()
+        if result[1] != 200:
+            return result
+        response_cache.set(user_id, version, request.full_path, result)
+
+    return result[0], result[1], {'ETag': f'"{etag}"'}
+
+
+def _bulk_ids():
+    ids = (request.get_json(silent=True) or {}).get('ids')
+    if not isinstance(ids, list) or not ids or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return None
+    return list(dict.fromkeys(ids))
 
 
 @api.route('/create')
@@ -46,20 +90,76 @@ class CreateArrangement(Resource):
         tags = request.form.get('tags')
         bpm = float(request.form.get('bpm'))
 
-        data = {"user_id": user_id, "name": name, "tags": tags, "bpm": bpm}
+        drums_file_name = f"drums_{uuid.uuid4().hex}"
+        try:
+            s3_storage.upload(file.stream, drums_file_name)
+        except Exception as e:
+            return {'error': f'Error uploading drums: {e}'}, 500
+
+        data = {"user_id": user_id, "name": name, "tags": tags, "bpm": bpm, "drums_file_name": drums_file_name}
 
         result = arrangement_service.add_arrangement(data)
 
         if result[1] == 201:
-            websocket_controller.data_updated(user_id)
-            arrangement_id = int(result[0]['id'])
-            drums_bytes = bytes(file.read())
-            executor.submit(arrangement_service.create_music,
-                            arrangement_id=arrangement_id,
-                            drums_bytes=drums_bytes,
-                            bpm=bpm,
-                            tags=tags,
-                            websocket_status_update_handler=lambda: websocket_controller.data_updated(user_id))
+            websocket_controller.arrangement_created(user_id, result[0]['arrangement'])
+
+        return result
+
+
+@api.route('/upload_url')
+class DrumsUploadUrl(Resource):
+    @api.doc(description='Get a presigned URL to upload a drums file to storage', security='access_token')
+    @api.response(200, 'Success', model=drums_upload)
+    @require_access_token
+    def post(self, user_id):
+        key = f"drums_{user_id}_{uuid.uuid4().hex}"
+        try:
+            upload = s3_storage.presigned_post(key, drums_upload_max_bytes, drums_upload_url_expires)
+        except Exception as e:
+            return {'error': f'Error creating upload URL: {e}'}, 500
+
+        return {'key': key, 'url': upload['url'], 'fields': upload['fields'],
+                'expires_in': drums_upload_url_expires, 'max_size': drums_upload_max_bytes}, 200
+
+
+@api.route('/create_from_upload')
+class CreateArrangementFromUpload(Resource):
+    @api.doc(description='Create an arrangement from a drums file uploaded with a presigned URL',
+             security='access_token')
+    @api.expect(create_arrangement_from_upload)
+    @api.response(201, 'Success', model=create_arrangement_response)
+    @require_access_token
+    def post(self, user_id):
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict) or not isinstance(body.get('key'), str) \
+                or not body['key'].startswith(f"drums_{user_id}_"):
+            return {'error': 'Invalid upload key'}, 400
+        elif not isinstance(body.get('name'), str) or not isinstance(body.get('tags'), str):
+            return {'error': 'Name and tags are required'}, 400
+
+        key = body['key']
+        try:
+            bpm = float(body.get('bpm'))
+        except (TypeError, ValueError):
+            return {'error': 'Invalid bpm'}, 400
+        if not math.isfinite(bpm) or bpm <= 0:
+            return {'error': 'Invalid bpm'}, 400
+
+        if job_service.has_job_for_drums(key):
+            return {'error': 'Upload has already been used'}, 409
+
+        size = s3_storage.size(key)
+        if not size:
+            return {'error': 'Uploaded drums file not found'}, 400
+        elif size > drums_upload_max_bytes:
+            return {'error': 'Uploaded drums file is too large'}, 413
+
+        data = {"user_id": user_id, "name": body['name'], "tags": body['tags'], "bpm": bpm, "drums_file_name": key}
+
+        result = arrangement_service.add_arrangement(data)
+
+        if result[1] == 201:
+            websocket_controller.arrangement_created(user_id, result[0]['arrangement'])
 
         return result
 
@@ -68,15 +168,25 @@ class CreateArrangement(Resource):
 class ArrangementsList(Resource):
     @api.doc(description='Get an arrangements list', security='access_token',
              params={'page': {'description': 'Number of page', 'type': 'integer'},
+                     'cursor': {'description': 'Page cursor from next/prev links, empty for the first page. '
+                                               'Switches to cursor pagination', 'type': 'string'},
+                     'with_count': {'description': 'Include the total count in cursor pagination',
+                                    'type': 'boolean'},
                      'search_query': {'description': 'Search query', 'type': 'string'},
+                     'tags': {'description': 'Only arrangements with all of these tags (list separated by commas)',
+                              'type': 'string'},
                      'status': {'description': 'Arrangement status (list separated by commas)', 'type': 'string'}})
     @api.response(200, 'Success', model=arrangements_list)
     @require_access_token
     def get(self, user_id):
+        return _conditional(user_id, lambda: self._get(user_id))
+
+    def _get(self, user_id):
         page = request.args.get('page', 1, type=int)
         search_query = request.args.get('search_query', '', type=str)
         status_string = request.args.get('status', '', type=str)
         status = [ArrangementStatus(s.upper()) for s in status_string.split(',') if status_string != '']
+        tag_filter = normalize_tags(request.args.get('tags', '', type=str))
         try:
             try:
                 if user_service.get_user(user_id) is None:
@@ -84,18 +194,71 @@ class ArrangementsList(Resource):
             except Exception as e:
                 return {'error': str(e)}, 400
 
-            arrangements = arrangement_service.get_user_arrangements(user_id, page, search_query, status)
+            if 'cursor' in request.args:
+                return arrangement_service.get_user_arrangements_after(
+                    user_id, request.args.get('cursor'), search_query, status, tag_filter,
+                    request.args.get('with_count', False, type=_flag))
+
+            arrangements = arrangement_service.get_user_arrangements(user_id, page, search_query, status, tag_filter)
             return arrangements
         except Exception as e:
             return {'error': str(e)}, 400
 
 
+@api.route('/summary')
+class ArrangementsSummary(Resource):
+    @api.doc(description='Get the number of arrangements by status', security='access_token')
+    @api.response(200, 'Success', model=arrangements_summary)
+    @require_access_token
+    def get(self, user_id):
+        return _conditional(user_id, lambda: counter_service.get_summary(user_id))
+
+
+@api.route('/bulk_get')
+class BulkGetArrangements(Resource):
+    @api.doc(description='Get several arrangements by ID', security='access_token')
+    @api.expect(bulk_ids)
+    @api.response(200, 'Success', model=bulk_response)
+    @require_access_token
+    def post(self, user_id):
+        ids = _bulk_ids()
+        if ids is None:
+            return {'error': 'ids must be a non-empty list of integers'}, 400
+        elif len(ids) > bulk_max_ids:
+            return {'error': f'At most {bulk_max_ids} ids are allowed'}, 400
+
+        return arrangement_service.get_arrangements(ids, user_id)
+
+
+@api.route('/bulk_delete')
+class BulkDeleteArrangements(Resource):
+    @api.doc(description='Delete several arrangements by ID', security='access_token')
+    @api.expect(bulk_ids)
+    @api.response(200, 'Success', model=bulk_response)
+    @require_access_token
+    def post(self, user_id):
+        ids = _bulk_ids()
+        if ids is None:
+            return {'error': 'ids must be a non-empty list of integers'}, 400
+        elif len(ids) > bulk_max_ids:
+            return {'error': f'At most {bulk_max_ids} ids are allowed'}, 400
+
+        result = arrangement_service.delete_arrangements(ids, user_id)
+        if result[1] == 200:
+            for arrangement_id in result[0]['deleted']:
+                websocket_controller.arrangement_deleted(user_id, arrangement_id)
+        return result
+
+
 @api.route('/<int:arrangement_id>')
 class Arrangement(Resource):
     @api.doc(description='Get a single arrangement', security='access_token')
     @api.response(200, 'Success', model=single_arrangement)
     @require_access_token
     def get(self, user_id, arrangement_id):
+        return _conditional(user_id, lambda: self._get(user_id, arrangement_id))
+
+    def _get(self, user_id, arrangement_id):
         try:
             arrangement = arrangement_service.get_arrangement(arrangement_id)
 
@@ -113,34 +276,45 @@ class Arrangement(Resource):
     @api.expect(rename_arrangement)
     @require_access_token
     def patch(self, user_id, arrangement_id):
-        arrangement = arrangement_service.get_arrangement(arrangement_id)
-
-        if arrangement and arrangement.user_id == user_id:
-            arrangement.name = request.json.get('name')
-            return arrangement_service.update_arrangement(arrangement)
-        elif arrangement:
-            return {'error': 'Access denied'}, 403
-
-        return {'error': 'Arrangement not found'}, 404
+        result = arrangement_service.rename_arrangement(arrangement_id, user_id, request.json.get('name'))
+        if result[1] == 200:
+            websocket_controller.arrangement_renamed(user_id, result[0]['arrangement'])
+        return result
 
     @api.doc(description='Delete an arrangement', security='access_token')
     @api.response(200, 'Success')
     @require_access_token
     def delete(self, user_id, arrangement_id):
-        arrangement = arrangement_service.get_arrangement(arrangement_id)
+        result = arrangement_service.delete_arrangement(arrangement_id, user_id)
+        if result[1] == 200:
+            websocket_controller.arrangement_deleted(user_id, arrangement_id)
+        return result
 
-        if arrangement and arrangement.user_id == user_id:
-            return arrangement_service.delete_arrangement(arrangement_id)
-        elif arrangement:
-            return {'error': 'Access denied'}, 403
 
-        return {'error': 'Arrangement not found'}, 404
+@api.route('/retry/<int:arrangement_id>')
+class RetryArrangement(Resource):
+    @api.doc(description='Resume a failed arrangement from its last completed stage', security='access_token')
+    @api.response(202, 'Generation resumed')
+    @api.response(409, 'The arrangement has not failed')
+    @require_access_token
+    def post(self, user_id, arrangement_id):
+        result = arrangement_service.retry_arrangement(arrangement_id, user_id)
+        if result[1] == 202:
+            websocket_controller.arrangement_resumed(user_id, result[0]['arrangement'])
+        return result
 
 
 @api.route('/file/<int:arrangement_id>')
 class ArrangementFile(Resource):
-    @api.doc(description='Get an arrangement file', produces=['application/octet-stream'], security='access_token')
+    @api.doc(description='Get an arrangement file. The format is picked from the Accept header unless '
+                         'the format parameter is given', security='access_token',
+             produces=['application/octet-stream', 'audio/ogg', 'audio/mpeg', 'audio/flac'],
+             params={'redirect': 'Redirect to a short-lived storage URL instead of streaming the file',
+                     'format': 'Audio format: wav, opus, mp3 or flac'})
     @api.response(200, 'File received')
+    @api.response(206, 'Partial content')
+    @api.response(302, 'Redirect to the file')
+    @api.response(304, 'Not modified')
     @require_access_token
     def get(self, user_id, arrangement_id):
         arrangement = arrangement_service.get_arrangement(arrangement_id)
@@ -150,29 +324,102 @@ class ArrangementFile(Resource):
         elif arrangement.user_id != user_id:
             return {'error': 'Access denied'}, 403
 
-        file_name = arrangement.file_name
-        arrangement_name = arrangement.name
-
-        if not file_name:
+        if not arrangement.file_name:
             return {"message": "File not found."}, 404
 
-        file_data = s3_storage.get(file_name)
-        if not file_data:
-            return {"message": "File content is empty or not found."}, 404
-        byte_io = BytesIO(file_data)
-        byte_io.seek(0)
-        return send_file(
-            byte_io,
-            as_attachment=True,
-            download_name=arrangement_name,
-            mimetype='application/octet-stream'
+        audio_format = request.args.get('format') or rendition_service.negotiate(request.accept_mimetypes)
+        if audio_format not in rendition_service.available_formats():
+            return {'error': f'Unsupported format {audio_format}'}, 400
+
+        for candidate in dict.fromkeys([audio_format, rendition_service.MASTER_FORMAT]):
+            response = self._send(arrangement, candidate)
+            if response is not None:
+                response.vary.add('Accept')
+                return response
+
+        return {"message": "File content is empty or not found."}, 404
+
+    def _send(self, arrangement, audio_format):
+        master = audio_format == rendition_service.MASTER_FORMAT
+        rendition = rendition_service.formats[audio_format]
+        file_name = arrangement.file_name if master else \
+            storage_keys.rendition_name(arrangement.file_name, rendition.extension)
+        arrangement_name = arrangement.name if master else f"{arrangement.name}.{rendition.extension}"
+        mimetype = 'application/octet-stream' if master else rendition.mimetype
+
+        if download_mode == 'redirect' or request.args.get('redirect', False, type=_flag):
+            if not master and s3_storage.size(file_name) is None:
+                return None
+            return redirect(s3_storage.presigned_url(file_name, download_url_expires, attachment(arrangement_name)))
+
+        cached_path = s3_storage.local_path(file_name)
+        if cached_path is not None:
+            try:
+                return send_file(cached_path, mimetype=mimetype, as_attachment=True,
+                                 download_name=arrangement_name, conditional=True, etag=file_name)
+            except FileNotFoundError:
+                pass
+
+        stored = s3_storage.stream(
+            file_name,
+            byte_range=request.headers.get('Range'),
+            if_none_match=request.headers.get('If-None-Match'),
+            if_modified_since=request.if_modified_since
         )
+        if stored is None:
+            return None
+
+        response = Response(status=stored.status)
+        if stored.body is not None:
+            s3_storage.prefetch(file_name)
+            response = Response(stream_with_context(stored.iter_chunks()), status=stored.status,
+                                mimetype=mimetype, direct_passthrough=True)
+            response.headers['Content-Disposition'] = attachment(arrangement_name)
+
+        response.headers['Accept-Ranges'] = 'bytes'
+        for header in ('content-length', 'content-range', 'etag', 'last-modified'):
+            if stored.headers.get(header):
+                response.headers[header] = stored.headers[header]
+        return response
+
+
+@api.route('/peaks/<int:arrangement_id>')
+class ArrangementPeaks(Resource):
+    @api.doc(description='Get multi-resolution waveform peaks of an arrangement. Every level has min and max '
+                         'arrays scaled to -127..127', security='access_token')
+    @api.response(200, 'Success')
+    @api.response(304, 'Not modified')
+    @require_access_token
+    def get(self, user_id, arrangement_id):
+        arrangement = arrangement_service.get_arrangement(arrangement_id)
+
+        if not arrangement:
+            return {'error': 'Arrangement not found'}, 404
+        elif arrangement.user_id != user_id:
+            return {'error': 'Access denied'}, 403
+        elif not arrangement.file_name:
+            return {"message": "File not found."}, 404
+
+        peaks_name = storage_keys.peaks_name(arrangement.file_name)
+        data = s3_storage.get(peaks_name)
+        if data is None:
+            audio_bytes = s3_storage.get(arrangement.file_name)
+            if not audio_bytes:
+                return {"message": "File content is empty or not found."}, 404
+            data = json.dumps(audio_mixer.waveform(audio_bytes), separators=(',', ':')).encode()
+            s3_storage.upload(data, peaks_name, 'application/json')
+
+        response = Response(data, mimetype='application/json')
+        response.set_etag(peaks_name)
+        return response.make_conditional(request)
 
 
 @api.route('/upload_video/<int:arrangement_id>')
 class ArrangementShare(Resource):
-    @api.doc(description='Upload arrangement to VK as a video. Upload link must be provided.', security='access_token')
-    @api.response(200, 'Link received')
+    @api.doc(description='Upload arrangement to VK as a video in the background. Upload link must be provided. '
+                         'Progress is reported over the WebSocket and the share job endpoint.',
+             security='access_token')
+    @api.response(202, 'Share job created', model=upload_video_response)
     @api.expect(upload_video)
     @require_access_token
     def post(self, user_id, arrangement_id):
@@ -183,12 +430,30 @@ class ArrangementShare(Resource):
         arrangement = arrangement_service.get_arrangement(arrangement_id)
 
         if arrangement and arrangement.user_id == user_id:
+            if not arrangement.file_name:
+                return {"message": "File not found."}, 404
 
-            audio_bytes = s3_storage.get(arrangement.file_name)
-            video_bytes = audio_to_video_service.convert_audio_to_video(audio_bytes)
-            response = vk_api_service.upload_video(url, video_bytes)
-            return response.json(), response.status_code
+            result = share_job_service.add_share_job(user_id, arrangement_id, url)
+            if result[1] == 202:
+                share_service.submit(result[0]['id'], websocket_controller.share_updated)
+            return result
         elif arrangement:
             return {'error': 'Access denied'}, 403
 
         return {'error': 'Arrangement not found'}, 404
+
+
+@api.route('/share_jobs/<int:share_job_id>')
+class ArrangementShareJob(Resource):
+    @api.doc(description='Get the status of a share job', security='access_token')
+    @api.response(200, 'Success', model=share_job)
+    @require_access_token
+    def get(self, user_id, share_job_id):
+        job = share_job_service.get_share_job(share_job_id)
+
+        if job and job.user_id == user_id:
+            return converter.share_job_to_dict(job), 200
+        elif job:
+            return {'error': 'Access denied'}, 403
+
+        return {'error': 'Share job not found'}, 404
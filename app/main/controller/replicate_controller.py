@@ -0,0 +1,28 @@
+from flask import request
+from flask_restx import Resource
+from ..util import webhook
+from ..util.dto import ReplicateDTO
+from ..service import generation_service
+from ..controller import websocket_controller
+
+api = ReplicateDTO().api
+
+
+@api.route('/webhook/<int:job_id>')
+class ReplicateWebhook(Resource):
+    @api.doc(description='Receive a prediction update from Replicate')
+    @api.response(200, 'Update received')
+    def post(self, job_id):
+        if not webhook.verify_signature(request.headers, request.get_data()):
+            return {'error': 'Invalid webhook signature'}, 401
+
+        payload = request.get_json(silent=True)
+        if not payload or 'id' not in payload:
+            return {'error': 'Invalid prediction payload'}, 400
+
+        try:
+            generation_service.handle_prediction(job_id, payload, websocket_controller.arrangement_status_changed)
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+        return {'status': 'success'}, 200
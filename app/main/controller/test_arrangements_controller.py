@@ -0,0 +1,133 @@
+import pytest
+from app.main.model.arrangement_status import ArrangementStatus
+from app.main.model.generation_jobs import GenerationJob
+from app.main.model.job_stage import JobStage
+from app.main.model.job_status import JobStatus
+from app.main.service.database import arrangement_service, job_service, user_service
+
+
+def auth(user_id):
+    return {'Authorization': f'Bearer {user_id}'}
+
+
+@pytest.fixture
+def arrangement_ids(database):
+    ids = {}
+    for user_id in (1, 2):
+        user_service.register_user(user_id)
+        ids[user_id] = [arrangement_service.add_arrangement(
+            {'user_id': user_id, 'name': f'Loop {n}', 'bpm': 120, 'tags': 'rock', 'file_name': f'mix-{user_id}-{n}',
+             'status': 'COMPLETED'})[0]['id'] for n in range(2)]
+    return ids
+
+
+@pytest.mark.parametrize('path', ['/api/arrangements/', '/api/arrangements/summary'])
+def test_repeated_reads_are_not_modified(client, arrangement_ids, path):
+    response = client.get(path, headers=auth(1))
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    response = client.get(path, headers={**auth(1), 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert response.data == b''
+
+
+def test_writes_change_the_etag(client, arrangement_ids):
+    arrangement_id = arrangement_ids[1][0]
+    path = f'/api/arrangements/{arrangement_id}'
+    etag = client.get(path, headers=auth(1)).headers['ETag']
+
+    assert client.patch(path, json={'name': 'Renamed'}, headers=auth(1)).status_code == 200
+
+    response = client.get(path, headers={**auth(1), 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.json['name'] == 'Renamed'
+
+
+def test_etags_are_per_user(client, arrangement_ids):
+    etag = client.get('/api/arrangements/', headers=auth(1)).headers['ETag']
+
+    response = client.get('/api/arrangements/', headers={**auth(2), 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert [item['id'] for item in response.json['results']] == list(reversed(arrangement_ids[2]))
+
+
+def test_errors_are_not_cached(client, arrangement_ids):
+    path = f'/api/arrangements/{arrangement_ids[2][0]}'
+    response = client.get(path, headers=auth(1))
+    assert response.status_code == 403
+    assert 'ETag' not in response.headers
+
+
+def test_bulk_get_only_returns_owned_arrangements(client, arrangement_ids):
+    own, other = arrangement_ids[1][0], arrangement_ids[2][0]
+    response = client.post('/api/arrangements/bulk_get', json={'ids': [other, own, 999]}, headers=auth(1))
+
+    assert response.status_code == 200
+    results = response.json['results']
+    assert [(result['id'], result['status']) for result in results] == \
+           [(other, 'forbidden'), (own, 'ok'), (999, 'not_found')]
+    assert 'arrangement' not in results[0]
+    assert results[1]['arrangement']['id'] == own
+
+
+def test_bulk_delete_only_deletes_owned_arrangements(client, arrangement_ids):
+    own, other = arrangement_ids[1][0], arrangement_ids[2][0]
+    response = client.post('/api/arrangements/bulk_delete', json={'ids': [own, other, 999]}, headers=auth(1))
+
+    assert response.status_code == 200
+    assert response.json['deleted'] == [own]
+    assert [result['status'] for result in response.json['results']] == ['deleted', 'forbidden', 'not_found']
+    assert arrangement_service.get_arrangement(own) is None
+    assert arrangement_service.get_arrangement(other) is not None
+    assert client.get('/api/arrangements/summary', headers=auth(1)).json['total'] == 1
+    assert client.get('/api/arrangements/summary', headers=auth(2)).json['total'] == 2
+
+
+@pytest.mark.parametrize('path', ['/api/arrangements/bulk_get', '/api/arrangements/bulk_delete'])
+@pytest.mark.parametrize('body', [{}, {'ids': []}, {'ids': ['1']}, {'ids': [True]}, {'ids': list(range(1001))}])
+def test_bulk_endpoints_validate_ids(client, arrangement_ids, path, body):
+    assert client.post(path, json=body, headers=auth(1)).status_code == 400
+
+
+@pytest.fixture
+def failed_job(database, arrangement_ids):
+    arrangement_service.add_arrangement(
+        {'user_id': 1, 'name': 'Loop', 'bpm': 120, 'tags': 'rock', 'drums_file_name': 'drums'})
+    for attempt in range(3):
+        job = job_service.claim_job('a', 60)
+        if attempt == 0:
+            job.stage = JobStage.SEPARATE
+            job.music_url = 'https://replicate.delivery/music.wav'
+            job.music_prediction_id = 'music'
+            database.session.commit()
+        job_service.fail_job(job.id, 'a', 'boom')
+    return job.id
+
+
+def test_retry_resumes_failed_job_from_its_checkpoint(client, database, failed_job):
+    job = database.session.get(GenerationJob, failed_job)
+    assert job.status == JobStatus.FAILED
+    assert arrangement_service.get_arrangement(job.arrangement_id).status == ArrangementStatus.FAILED
+
+    response = client.post(f'/api/arrangements/retry/{job.arrangement_id}', headers=auth(1))
+    assert response.status_code == 202
+    assert response.json['arrangement']['status'] == 'PROCESSING'
+
+    database.session.expire_all()
+    job = database.session.get(GenerationJob, failed_job)
+    assert (job.status, job.stage, job.attempts, job.last_error) == (JobStatus.QUEUED, JobStage.SEPARATE, 0, None)
+    assert (job.music_url, job.music_prediction_id) == ('https://replicate.delivery/music.wav', 'music')
+
+    assert client.post(f'/api/arrangements/retry/{job.arrangement_id}', headers=auth(1)).status_code == 409
+
+
+def test_retry_checks_ownership_and_status(client, database, failed_job, arrangement_ids):
+    arrangement_id = database.session.get(GenerationJob, failed_job).arrangement_id
+
+    assert client.post(f'/api/arrangements/retry/{arrangement_id}', headers=auth(2)).status_code == 403
+    assert client.post('/api/arrangements/retry/999', headers=auth(1)).status_code == 404
+    assert client.post(f'/api/arrangements/retry/{arrangement_ids[1][0]}', headers=auth(1)).status_code == 409
+    assert database.session.get(GenerationJob, failed_job).status == JobStatus.FAILED
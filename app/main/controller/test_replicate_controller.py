@@ -0,0 +1,42 @@
+import base64
+import json
+import time
+from app.main.model.generation_jobs import GenerationJob
+from app.main.model.job_status import JobStatus
+from app.main.service import generation_service
+from app.main.service.database import arrangement_service, job_service, user_service
+from app.main.util import webhook
+
+SECRET = 'whsec_' + base64.b64encode(b'test-secret').decode()
+
+
+def signed(body, secret=SECRET):
+    timestamp = str(int(time.time()))
+    return {'webhook-id': 'msg_1', 'webhook-timestamp': timestamp,
+            'webhook-signature': f"v1,{webhook.sign(secret, 'msg_1', timestamp, body)}"}
+
+
+def test_rejects_unsigned_webhook(client, database, monkeypatch):
+    monkeypatch.setattr(webhook, 'webhook_secret', SECRET)
+    calls = []
+    monkeypatch.setattr(generation_service, 'handle_prediction', lambda *args: calls.append(args))
+    user_service.register_user(1)
+    arrangement_service.add_arrangement(
+        {'user_id': 1, 'name': 'Loop', 'bpm': 120, 'tags': 'rock', 'drums_file_name': 'drums'})
+    job = job_service.claim_job('a', 60)
+    body = json.dumps({'id': 'prediction', 'status': 'succeeded'}).encode()
+
+    response = client.post(f'/api/replicate/webhook/{job.id}', data=body, content_type='application/json')
+    assert response.status_code == 401
+
+    forged = signed(body, secret='whsec_Zm9yZ2Vk')
+    response = client.post(f'/api/replicate/webhook/{job.id}', data=body, content_type='application/json',
+                           headers=forged)
+    assert response.status_code == 401
+    assert calls == []
+    assert database.session.get(GenerationJob, job.id).status == JobStatus.RUNNING
+
+    response = client.post(f'/api/replicate/webhook/{job.id}', data=body, content_type='application/json',
+                           headers=signed(body))
+    assert response.status_code == 200
+    assert len(calls) == 1
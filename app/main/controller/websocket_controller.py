@@ -1,19 +1,91 @@
 import json
 import logging
+import os
+import threading
+from collections import OrderedDict
 from flask_sock import Sock
-from ..service import vk_api_service
+from .. import response_cache
+from ..service import notification_bus, vk_api_service
+from ..util import converter
 
 sock = Sock()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('websocket')
 
+coalesce_window = float(os.getenv('WEBSOCKET_COALESCE_MS', 200)) / 1000
+
 clients = {}
+clients_lock = threading.Lock()
+
+bus = notification_bus.create_bus()
+
+
+class Connection:
+    """A registered socket that batches arrangement events.
+
+    Events for the same arrangement that arrive within ``coalesce_window`` are
+    merged, so only the latest state of each arrangement is sent. Every write
+    holds ``_send_lock``, and ``register`` sends the handshake reply before any
+    event can reach the socket.
+    """
+
+    def __init__(self, ws):
+        self.ws = ws
+        self._send_lock = threading.Lock()
+        self._pending = OrderedDict()
+        self._pending_lock = threading.Lock()
+        self._timer = None
+
+    def send(self, payload):
+        with self._send_lock:
+            self._write(payload)
+
+    def register(self, user_id, payload):
+        with self._send_lock:
+            with clients_lock:
+                clients.setdefault(user_id, {})[self.ws] = self
+            self._write(payload)
+
+    def _write(self, payload):
+        try:
+            self.ws.send(json.dumps(payload))
+        except Exception as e:
+            logger.info(f"Error sending WebSocket message: {e}")
+
+    def send_event(self, payload):
+        if coalesce_window <= 0:
+            self.send(payload)
+            return
+
+        arrangement_id = payload['arrangement']['id']
+        with self._pending_lock:
+            previous = self._pending.pop(arrangement_id, None)
+            if previous is not None and previous['event'] == 'created':
+                if payload['event'] == 'deleted':
+                    return
+                payload = dict(payload, event='created')
+            self._pending[arrangement_id] = payload
+
+            if self._timer is None:
+                self._timer = threading.Timer(coalesce_window, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush(self):
+        with self._pending_lock:
+            events = list(self._pending.values())
+            self._pending.clear()
+            self._timer = None
+
+        for payload in events:
+            self.send(payload)
 
 
 @sock.route('/websocket')
 def websocket_route(ws):
     user_id = None
+    connection = Connection(ws)
     try:
         while True:
             data = ws.receive()
@@ -26,32 +98,86 @@ def websocket_route(ws):
                 access_token = message['access_token']
 
                 try:
-                    user_id = vk_api_service.get_user_id(access_token)
+                    token_user_id = vk_api_service.get_user_id(access_token)
                 except Exception as e:
-                    ws.send(json.dumps({'status': 'fail', 'message': f'{e}'}))
+                    connection.send({'status': 'fail', 'message': f'{e}'})
                     return
 
-                if user_id is None:
-                    ws.send(json.dumps({'status': 'fail', 'message': 'Missing or invalid Authorization header'}))
+                if token_user_id is None:
+                    connection.send({'status': 'fail', 'message': 'Missing or invalid Authorization header'})
+                    continue
+
+                if user_id is not None and user_id != token_user_id:
+                    connection.send({'status': 'fail', 'message': 'Connection is registered to another user'})
+                    continue
+                user_id = token_user_id
 
-                if user_id not in clients:
-                    clients[user_id] = ws
+                start_listening()
+                with clients_lock:
+                    registered = ws in clients.get(user_id, {})
+                if not registered:
+                    connection.register(user_id, {'status': 'success', 'message': f'Successfully connected'})
                     logger.info(f"User {user_id} connected and registered.")
-                    ws.send(json.dumps({'status': 'success', 'message': f'Successfully connected'}))
 
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
-        ws.send(json.dumps({'status': 'fail', 'message': f'{e}'}))
+        connection.send({'status': 'fail', 'message': f'{e}'})
     finally:
-        if user_id in clients:
-            clients.pop(user_id, None)
-            logger.info(f"User {user_id} disconnected.")
+        with clients_lock:
+            connections = clients.get(user_id)
+            if connections is not None and ws in connections:
+                connections.pop(ws)
+                if not connections:
+                    clients.pop(user_id, None)
+                logger.info(f"User {user_id} disconnected.")
 
 
-def data_updated(user_id):
-    if user_id in clients:
-        ws = clients[user_id]
-        try:
-            ws.send(json.dumps({"status": "success", "message": "Data updated"}))
-        except Exception as e:
-            logger.info(f"Error sending WebSocket message: {e}")
+def start_listening():
+    bus.listen(_deliver)
+
+
+def arrangement_created(user_id, arrangement):
+    _send_event(user_id, 'created', arrangement)
+
+
+def arrangement_status_changed(arrangement):
+    _send_event(arrangement.user_id, 'status_changed', converter.arrangement_to_dict(arrangement))
+
+
+def arrangement_resumed(user_id, arrangement):
+    _send_event(user_id, 'status_changed', arrangement)
+
+
+def arrangement_renamed(user_id, arrangement):
+    _send_event(user_id, 'renamed', arrangement)
+
+
+def arrangement_deleted(user_id, arrangement_id):
+    _send_event(user_id, 'deleted', {'id': arrangement_id})
+
+
+def share_updated(user_id, share_job):
+    _send(user_id, {"status": "success", "message": "Share updated", "share_job": share_job})
+
+
+def _send_event(user_id, event, arrangement):
+    response_cache.bump(user_id)
+    _send(user_id, {"status": "success", "message": "Data updated", "event": event, "arrangement": arrangement})
+
+
+def _send(user_id, payload):
+    bus.publish(user_id, payload)
+
+
+def _deliver(user_id, payload):
+    if 'event' in payload:
+        response_cache.bump_local(user_id)
+
+    with clients_lock:
+        connections = list(clients.get(user_id, {}).values())
+
+    for connection in connections:
+        if 'event' in payload:
+            connection.send_event(payload)
+        else:
+            connection.send(payload)
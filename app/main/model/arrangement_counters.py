@@ -0,0 +1,10 @@
+from .arrangement_status import ArrangementStatus
+from app.main import db
+
+
+class ArrangementCounter(db.Model):
+    __tablename__ = "arrangement_counters"
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    status = db.Column(db.Enum(ArrangementStatus), primary_key=True)
+    count = db.Column(db.Integer, default=0, nullable=False)
@@ -1,5 +1,6 @@
-from sqlalchemy import text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Computed, text
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from .arrangement_status import ArrangementStatus
 from .users import User
 from app.main import db
@@ -13,8 +14,12 @@ class Arrangement(db.Model):
     name = db.Column(db.String(255), nullable=False)
     bpm = db.Column(db.Integer, nullable=False)
     tags = db.Column(db.String(1000), nullable=False)
+    tag_list = db.Column(ARRAY(db.String(100)), server_default=text("'{}'"), nullable=False)
     file_name = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, server_default=text('CURRENT_TIMESTAMP'))
     status = db.Column(db.Enum(ArrangementStatus), default=ArrangementStatus.PENDING, nullable=False)
+    peaks = db.Column(ARRAY(db.SmallInteger))
+    search_vector = deferred(db.Column(TSVECTOR, Computed(
+        "setweight(to_tsvector('simple', name), 'A') || setweight(to_tsvector('simple', tags), 'B')", persisted=True)))
 
     user = relationship(User, back_populates="arrangements")
@@ -0,0 +1,33 @@
+from sqlalchemy import text
+from sqlalchemy.orm import relationship
+from .job_stage import JobStage
+from .job_status import JobStatus
+from .arrangements import Arrangement
+from app.main import db
+
+
+class GenerationJob(db.Model):
+    __tablename__ = "generation_jobs"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    arrangement_id = db.Column(db.Integer, db.ForeignKey('arrangements.id', ondelete='CASCADE'), nullable=False)
+    drums_file_name = db.Column(db.String(255), nullable=False)
+    bpm = db.Column(db.Float, nullable=False)
+    tags = db.Column(db.String(1000), nullable=False)
+    status = db.Column(db.Enum(JobStatus), default=JobStatus.QUEUED, nullable=False)
+    stage = db.Column(db.Enum(JobStage), default=JobStage.GENERATE, nullable=False)
+    prediction_id = db.Column(db.String(255))
+    music_prediction_id = db.Column(db.String(255))
+    music_url = db.Column(db.Text)
+    stem_prediction_id = db.Column(db.String(255))
+    stem_url = db.Column(db.Text)
+    stem_file_name = db.Column(db.String(255))
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=3, nullable=False)
+    locked_by = db.Column(db.String(255))
+    locked_until = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, server_default=text('CURRENT_TIMESTAMP'))
+    updated_at = db.Column(db.DateTime, server_default=text('CURRENT_TIMESTAMP'))
+
+    arrangement = relationship(Arrangement)
@@ -0,0 +1,7 @@
+from enum import Enum
+
+
+class JobStage(Enum):
+    GENERATE = "GENERATE"
+    SEPARATE = "SEPARATE"
+    MIX = "MIX"
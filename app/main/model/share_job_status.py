@@ -0,0 +1,9 @@
+from enum import Enum
+
+
+class ShareJobStatus(Enum):
+    QUEUED = "QUEUED"
+    RENDERING = "RENDERING"
+    UPLOADING = "UPLOADING"
+    COMPLETED = "COMPLETED"
+    FAILED = "FAILED"
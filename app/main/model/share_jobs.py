@@ -0,0 +1,18 @@
+from sqlalchemy import text
+from .share_job_status import ShareJobStatus
+from app.main import db
+
+
+class ShareJob(db.Model):
+    __tablename__ = "share_jobs"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    arrangement_id = db.Column(db.Integer, db.ForeignKey('arrangements.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    upload_url = db.Column(db.Text, nullable=False)
+    status = db.Column(db.Enum(ShareJobStatus), default=ShareJobStatus.QUEUED, nullable=False)
+    response = db.Column(db.Text)
+    response_code = db.Column(db.Integer)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, server_default=text('CURRENT_TIMESTAMP'))
+    updated_at = db.Column(db.DateTime, server_default=text('CURRENT_TIMESTAMP'))
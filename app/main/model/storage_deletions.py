@@ -0,0 +1,14 @@
+from sqlalchemy import text
+from app.main import db
+
+
+class StorageDeletion(db.Model):
+    __tablename__ = "storage_deletions"
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    name = db.Column(db.String(255), nullable=False)
+    artifacts = db.Column(db.Boolean, default=False, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    not_before = db.Column(db.DateTime, server_default=text("(now() AT TIME ZONE 'utc')"), nullable=False)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, server_default=text("(now() AT TIME ZONE 'utc')"))
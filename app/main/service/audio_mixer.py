@@ -0,0 +1,221 @@
+import io
+import struct
+import wave
+from math import ceil
+from typing import Dict, List, Tuple
+import numpy as np
+
+PCM_FORMAT = 0x0001
+FLOAT_FORMAT = 0x0003
+EXTENSIBLE_FORMAT = 0xFFFE
+
+HEADROOM_DB = 0.1
+TARGET_DURATION_MS = 30 * 1000
+
+PEAK_LEVELS = (4096, 1024, 256, 64)
+PEAK_SCALE = 127
+
+
+class Audio:
+    def __init__(self, samples: np.ndarray, frame_rate: int, sample_width: int):
+        self.samples = samples
+        self.frame_rate = frame_rate
+        self.sample_width = sample_width
+
+    @property
+    def channels(self) -> int:
+        return self.samples.shape[1]
+
+    @property
+    def duration_ms(self) -> float:
+        return len(self.samples) * 1000 / self.frame_rate
+
+
+def mix(drums_bytes: bytes, music_bytes: bytes, bpm: float) -> bytes:
+    drums = decode(drums_bytes)
+    music = decode(music_bytes)
+
+    bar_duration_ms = (60 / bpm) * 4 * 1000
+
+    segment = melody_segment(music, bar_duration_ms)
+    segment = map_channels(resample(segment, music.frame_rate, drums.frame_rate), drums.channels)
+
+    drums_samples = normalize(loop_drums(drums, TARGET_DURATION_MS))
+    music_samples = normalize(_tile(segment, len(drums_samples)))
+
+    mixed = normalize(drums_samples + music_samples)
+    return encode(Audio(mixed, drums.frame_rate, drums.sample_width))
+
+
+def loop_drums(drums: Audio, target_duration_ms: float) -> np.ndarray:
+    if drums.duration_ms >= target_duration_ms:
+        return drums.samples
+    return _tile(drums.samples, _frames(target_duration_ms, drums.frame_rate))
+
+
+def melody_segment(music: Audio, bar_duration_ms: float) -> np.ndarray:
+    music_bars = round(music.duration_ms / bar_duration_ms)
+    segment_duration_ms = 2 * bar_duration_ms if music_bars == 3 else 4 * bar_duration_ms
+    return music.samples[:_frames(segment_duration_ms, music.frame_rate)]
+
+
+def resample(samples: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    if src_rate == dst_rate or len(samples) == 0:
+        return samples
+
+    out_frames = int(len(samples) * dst_rate / src_rate)
+    positions = np.arange(out_frames, dtype=np.float64) * (src_rate / dst_rate)
+    source = np.arange(len(samples), dtype=np.float64)
+    resampled = np.empty((out_frames, samples.shape[1]), dtype=np.float32)
+    for channel in range(samples.shape[1]):
+        resampled[:, channel] = np.interp(positions, source, samples[:, channel])
+    return resampled
+
+
+def map_channels(samples: np.ndarray, channels: int) -> np.ndarray:
+    current = samples.shape[1]
+    if current == channels:
+        return samples
+    if channels == 1:
+        return samples.mean(axis=1, keepdims=True)
+    if current == 1:
+        return np.broadcast_to(samples, (len(samples), channels))
+    return samples[:, np.arange(channels) % current]
+
+
+def normalize(samples: np.ndarray, headroom_db: float = HEADROOM_DB) -> np.ndarray:
+    peak = np.max(np.abs(samples)) if len(samples) else 0
+    if peak == 0:
+        return samples
+    return samples * np.float32(10 ** (-headroom_db / 20) / peak)
+
+
+def decode(data: bytes) -> Audio:
+    audio_format, channels, frame_rate, sample_width, frames = _parse_wav(data)
+    frames = frames[:len(frames) - len(frames) % (sample_width * channels)]
+
+    if audio_format == FLOAT_FORMAT:
+        dtype = np.float32 if sample_width == 4 else np.float64
+        samples = np.frombuffer(frames, dtype=dtype).astype(np.float32)
+    elif sample_width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif sample_width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        padded = np.zeros((len(raw), 4), dtype=np.uint8)
+        padded[:, 1:] = raw
+        samples = padded.view('<i4').reshape(-1).astype(np.float32) / 2 ** 31
+    else:
+        dtype = {2: '<i2', 4: '<i4'}[sample_width]
+        samples = np.frombuffer(frames, dtype=dtype).astype(np.float32) / 2 ** (8 * sample_width - 1)
+
+    frame_count = len(samples) // channels
+    return Audio(samples[:frame_count * channels].reshape(frame_count, channels), frame_rate,
+                 sample_width if audio_format != FLOAT_FORMAT else 2)
+
+
+def encode(audio: Audio) -> bytes:
+    width = audio.sample_width
+    scale = 2 ** (8 * width - 1)
+    clipped = np.clip(audio.samples, -1.0, (scale - 1) / scale)
+
+    if width == 1:
+        frames = (clipped * 128 + 128).astype(np.uint8).tobytes()
+    elif width == 3:
+        ints = (clipped * 2 ** 31).astype('<i4')
+        frames = ints.view(np.uint8).reshape(-1, 4)[:, 1:].tobytes()
+    else:
+        frames = (clipped * scale).astype({2: '<i2', 4: '<i4'}[width]).tobytes()
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(audio.channels)
+        wav.setsampwidth(width)
+        wav.setframerate(audio.frame_rate)
+        wav.writeframes(frames)
+    return buffer.getvalue()
+
+
+def duration(data: bytes) -> float:
+    _, channels, frame_rate, sample_width, frames = _parse_wav(data)
+    return len(frames) / (channels * sample_width * frame_rate)
+
+
+def peaks(audio: Audio, levels: Tuple[int, ...] = PEAK_LEVELS) -> List[Dict]:
+    frames = len(audio.samples)
+    if frames == 0:
+        return [{'buckets': 0, 'min': [], 'max': []} for _ in levels]
+
+    buckets = min(levels[0], frames)
+    starts = np.arange(buckets) * frames // buckets
+    lows = np.minimum.reduceat(audio.samples.min(axis=1), starts)
+    highs = np.maximum.reduceat(audio.samples.max(axis=1), starts)
+
+    result = []
+    for level in levels:
+        factor = len(lows) // level
+        if factor > 1:
+            lows = lows[:factor * level].reshape(level, factor).min(axis=1)
+            highs = highs[:factor * level].reshape(level, factor).max(axis=1)
+        result.append({
+            'buckets': len(lows),
+            'min': np.round(np.clip(lows, -1, 1) * PEAK_SCALE).astype(int).tolist(),
+            'max': np.round(np.clip(highs, -1, 1) * PEAK_SCALE).astype(int).tolist()
+        })
+    return result
+
+
+def waveform(data: bytes) -> Dict:
+    audio = decode(data)
+    return {
+        'sample_rate': audio.frame_rate,
+        'channels': audio.channels,
+        'duration': audio.duration_ms / 1000,
+        'levels': peaks(audio)
+    }
+
+
+def coarse_peaks(waveform_data: Dict) -> List[int]:
+    coarsest = waveform_data['levels'][-1]
+    return [max(high, -low) for low, high in zip(coarsest['min'], coarsest['max'])]
+
+
+def _tile(samples: np.ndarray, target_frames: int) -> np.ndarray:
+    if len(samples) == 0:
+        return np.zeros((target_frames, samples.shape[1]), dtype=np.float32)
+    repeats = ceil(target_frames / len(samples))
+    return np.tile(samples, (repeats, 1))[:target_frames]
+
+
+def _frames(duration_ms: float, frame_rate: int) -> int:
+    return int(duration_ms * frame_rate / 1000)
+
+
+def _parse_wav(data: bytes) -> Tuple[int, int, int, int, memoryview]:
+    if len(data) < 12 or data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        raise ValueError("Not a WAV file")
+
+    view = memoryview(data)
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        chunk_size = struct.unpack_from('<I', data, offset + 4)[0]
+        body = offset + 8
+
+        if chunk_id == b'fmt ':
+            audio_format, channels, frame_rate = struct.unpack_from('<HHI', data, body)
+            bits = struct.unpack_from('<H', data, body + 14)[0]
+            if audio_format == EXTENSIBLE_FORMAT:
+                audio_format = struct.unpack_from('<H', data, body + 24)[0]
+            fmt = (audio_format, channels, frame_rate, bits // 8)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ValueError("WAV data chunk precedes fmt chunk")
+            if fmt[0] not in (PCM_FORMAT, FLOAT_FORMAT):
+                raise ValueError(f"Unsupported WAV format {fmt[0]}")
+            end = min(len(data), body + chunk_size) if chunk_size else len(data)
+            return fmt + (view[body:end],)
+
+        offset = body + chunk_size + (chunk_size & 1)
+
+    raise ValueError("WAV file has no data chunk")
@@ -1,36 +1,77 @@
+import logging
 import os
 import random
-import uuid
+import subprocess
 import tempfile
-from moviepy import AudioFileClip, ImageClip
-
-
-def convert_audio_to_video(audio_bytes: bytes) -> bytes:
-    image_number = random.randint(1, 7)
-    with tempfile.NamedTemporaryFile(suffix='.wav') as audio_temp:
-        audio_temp.write(audio_bytes)
-        audio_temp.seek(0)
-
-        audio_clip = AudioFileClip(audio_temp.name)
-        image_clip = ImageClip(f"./app/resources/images/{image_number}.jpg")
-        video_clip = image_clip
-        video_clip.audio = audio_clip
-        video_clip.duration = audio_clip.duration
-        video_clip.fps = 1
-
-        temp_name = f'temp{uuid.uuid4().hex}.mp4'
-        video_clip.write_videofile(
-            filename=temp_name,
-            remove_temp=True,
-            fps=1,
-            codec="libx264",
-            audio_codec='aac'
-        )
-        audio_clip.close()
-        image_clip.close()
-        video_clip.close()
-
-        with open(temp_name, 'rb') as video:
-            output = video.read()
-            os.remove(temp_name)
-            return output
+import threading
+import imageio_ffmpeg
+from app.main.service import audio_mixer
+from app.main.service.disk_cache import private_directory
+
+logger = logging.getLogger('audio_to_video')
+
+ffmpeg_binary = os.getenv('FFMPEG_BINARY') or imageio_ffmpeg.get_ffmpeg_exe()
+cache_dir = os.getenv('VIDEO_CACHE_DIR', os.path.join(tempfile.gettempdir(), f'harmonia-video-loops-{os.getuid()}'))
+images_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'resources', 'images')
+images_count = 7
+loop_seconds = 10
+
+_loop_lock = threading.Lock()
+_loop_dir = None
+
+
+def render_video(audio_bytes: bytes, output_path: str, image_number: int = None) -> None:
+    loop_path = get_video_loop(image_number or random.randint(1, images_count))
+    run_ffmpeg([
+        '-stream_loop', '-1', '-i', loop_path,
+        '-i', 'pipe:0',
+        '-map', '0:v:0', '-map', '1:a:0',
+        '-c:v', 'copy',
+        '-c:a', 'aac', '-aac_coder', 'fast', '-b:a', '192k',
+        '-t', f'{audio_mixer.duration(audio_bytes):.3f}',
+        '-movflags', '+faststart',
+        output_path
+    ], stdin=audio_bytes)
+
+
+def get_video_loop(image_number: int) -> str:
+    loop_dir = _video_loop_dir()
+    loop_path = os.path.join(loop_dir, f'{image_number}.mp4')
+    if os.path.exists(loop_path):
+        return loop_path
+
+    with _loop_lock:
+        if os.path.exists(loop_path):
+            return loop_path
+
+        temp_path = os.path.join(loop_dir, f'.{image_number}.{os.getpid()}.mp4')
+        logger.info(f"Rendering video loop for image {image_number}")
+        run_ffmpeg([
+            '-loop', '1', '-framerate', '1',
+            '-i', os.path.join(images_dir, f'{image_number}.jpg'),
+            '-t', str(loop_seconds),
+            '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2',
+            '-c:v', 'libx264', '-tune', 'stillimage', '-pix_fmt', 'yuv420p',
+            '-r', '1', '-g', '1',
+            temp_path
+        ])
+        os.replace(temp_path, loop_path)
+        return loop_path
+
+
+def _video_loop_dir() -> str:
+    global _loop_dir
+    with _loop_lock:
+        if _loop_dir is None:
+            _loop_dir = cache_dir
+            if not private_directory(cache_dir):
+                _loop_dir = tempfile.mkdtemp(prefix='harmonia-video-loops-')
+                logger.error(f"Video cache directory {cache_dir} is not private to this user, using {_loop_dir}")
+        return _loop_dir
+
+
+def run_ffmpeg(arguments, stdin: bytes = None) -> None:
+    result = subprocess.run([ffmpeg_binary, '-y', '-loglevel', 'error', *arguments],
+                            input=stdin, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg failed: {result.stderr.decode(errors='replace').strip()}")
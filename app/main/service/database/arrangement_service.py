@@ -1,74 +1,73 @@
 import datetime
 import logging
 import os
-import uuid
-from sqlalchemy import or_, and_
-from app.main import db, app, s3_storage
+import re
+from math import ceil
+from sqlalchemy import Row, delete, func, or_, select, true, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from app.main import db, app, response_cache
 from app.main.model.arrangement_status import ArrangementStatus
 from app.main.model.arrangements import Arrangement
-from typing import Dict, Tuple
-from app.main.service.music_gen_service import MusicGenerator
-from app.main.util import converter
+from app.main.model.generation_jobs import GenerationJob
+from app.main.model.job_stage import JobStage
+from app.main.model.job_status import JobStatus
+from app.main.service.database import counter_service, job_service
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+from app.main.util import converter, cursor
+from app.main.util.tags import normalize_tags
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('arrangement_service')
 
 per_page = int(os.getenv('ARRANGEMENTS_PER_PAGE'))
 host_url = os.getenv("HOST_URL")
+search_backend = os.getenv('SEARCH_BACKEND', 'fulltext')
 
+DRUMS_FILE_NAME_INDEX = 'generation_jobs_drums_file_name_idx'
 
-def create_music(arrangement_id: int, drums_bytes: bytes, bpm: float, tags: str, websocket_status_update_handler):
-    arrangement = None
+_columns = [Arrangement.id, Arrangement.user_id, Arrangement.name, Arrangement.bpm, Arrangement.tags,
+            Arrangement.file_name, Arrangement.created_at, Arrangement.status, Arrangement.peaks]
 
-    def update_status(status: ArrangementStatus):
-        arrangement.status = status
-        update_arrangement(arrangement)
 
-        websocket_status_update_handler()
-
-    try:
-        arrangement = get_arrangement(arrangement_id)
-        if arrangement is None:
-            return
-
-        service = MusicGenerator(update_status)
-        file_response, file_status = service.create(drums_bytes, bpm, tags)
-
-        if file_status != 200:
-            arrangement.status = ArrangementStatus.FAILED
-        elif arrangement:
-            arrangement.status = ArrangementStatus.COMPLETED
-            arrangement.file_name = uuid.uuid4().hex
-            s3_storage.upload(file_response, arrangement.file_name)
-
-        update_arrangement(arrangement)
-        websocket_status_update_handler()
-    except Exception as e:
-        if arrangement:
-            arrangement.status = ArrangementStatus.FAILED
-            update_arrangement(arrangement)
-            websocket_status_update_handler()
-        logger.error(f"Error generating music or updating arrangement: {e}")
-
-
-def add_arrangement(data: Dict[str, str]) -> Tuple[Dict[str, str], int]:
+def add_arrangement(data: Dict[str, str]) -> Tuple[Dict, int]:
     try:
         new_arrangement = Arrangement(
             user_id=data["user_id"],
             name=data["name"],
             bpm=data["bpm"],
             tags=data["tags"],
+            tag_list=normalize_tags(data["tags"]),
             file_name=data.get("file_name"),
             status=ArrangementStatus(data.get("status", "PENDING")),
             created_at=datetime.datetime.utcnow()
         )
-        if _save_changes(new_arrangement):
-            return {"status": "success",
-                    "message": "Arrangement added successfully.",
-                    "id": new_arrangement.id}, 201
+        db.session.add(new_arrangement)
+        if data.get("drums_file_name"):
+            db.session.add(GenerationJob(
+                arrangement=new_arrangement,
+                drums_file_name=data["drums_file_name"],
+                bpm=data["bpm"],
+                tags=data["tags"]
+            ))
+        db.session.flush()
+        arrangement = converter.arrangement_to_dict(new_arrangement)
+        db.session.commit()
+
+        response_cache.bump(data["user_id"])
+        return {"status": "success",
+                "message": "Arrangement added successfully.",
+                "id": arrangement["id"],
+                "arrangement": arrangement}, 201
+    except IntegrityError as e:
+        db.session.rollback()
+        if DRUMS_FILE_NAME_INDEX in str(e.orig):
+            return {"status": "fail", "message": "Drums file has already been used."}, 409
+        logger.error(f"Error adding arrangement: {e}")
         return {"status": "fail", "message": "Error adding arrangement."}, 500
     except Exception as e:
         logger.error(f"Error adding arrangement: {e}")
+        db.session.rollback()
         return {"status": "fail", "message": "Error adding arrangement."}, 500
 
 
@@ -81,84 +80,185 @@ def get_arrangement(arrangement_id: int) -> Arrangement:
             return None
 
 
-def update_arrangement(arrangement: Arrangement) -> Tuple[Dict[str, str], int]:
-    with app.app_context():
-        try:
-            arrangement_in_db = Arrangement.query.filter_by(id=arrangement.id).first()
-            if arrangement_in_db:
-                arrangement_in_db.name = arrangement.name
-                arrangement_in_db.status = arrangement.status
-                arrangement_in_db.file_name = arrangement.file_name
-
-                if _save_changes(arrangement_in_db):
-                    return {"status": "success", "message": "Arrangement updated successfully."}, 200
+def rename_arrangement(arrangement_id: int, user_id: int, name: str) -> Tuple[Dict, int]:
+    try:
+        row = _change_owned(arrangement_id, user_id, update(Arrangement).values(name=name))
+        if row is None or (row.id is None and row.owner_id == user_id):
             return {"status": "fail", "message": "Arrangement not found."}, 404
-        except Exception as e:
-            logger.error(f"Error updating arrangement: {e}")
-            return {"status": "fail", "message": "Error updating arrangement."}, 500
+        elif row.id is None:
+            return {"status": "fail", "message": "Access denied."}, 403
+
+        response_cache.bump(user_id)
+        return {"status": "success", "message": "Arrangement updated successfully.",
+                "arrangement": converter.arrangement_to_dict(row)}, 200
+    except Exception as e:
+        logger.error(f"Error updating arrangement: {e}")
+        db.session.rollback()
+        return {"status": "fail", "message": "Error updating arrangement."}, 500
+
 
+def transition_status(arrangement_id: int, from_statuses: List[ArrangementStatus], to_status: ArrangementStatus,
+                      file_name: Optional[str] = None, peaks: Optional[List[int]] = None) -> Optional[Row]:
+    values = {Arrangement.status: to_status}
+    if file_name is not None:
+        values[Arrangement.file_name] = file_name
+    if peaks is not None:
+        values[Arrangement.peaks] = peaks
 
-def delete_arrangement(arrangement_id: int) -> Tuple[Dict[str, str], int]:
     try:
-        arrangement = Arrangement.query.filter_by(id=arrangement_id).first()
-        if arrangement:
-            db.session.delete(arrangement)
-            db.session.commit()
-            s3_storage.delete(arrangement.file_name)
-            return {"status": "success", "message": "Arrangement deleted successfully."}, 200
-        else:
+        row = db.session.execute(
+            update(Arrangement)
+            .where(Arrangement.id == arrangement_id, Arrangement.status.in_(from_statuses))
+            .values(values)
+            .returning(*_columns)
+        ).first()
+        db.session.commit()
+    except Exception as e:
+        logger.error(f"Error updating arrangement status: {e}")
+        db.session.rollback()
+        return None
+
+    if row is not None:
+        response_cache.bump(row.user_id)
+    return row
+
+
+def retry_arrangement(arrangement_id: int, user_id: int) -> Tuple[Dict, int]:
+    try:
+        arrangement = Arrangement.query.filter_by(id=arrangement_id).with_for_update().first()
+        if arrangement is None:
+            db.session.rollback()
+            return {"status": "fail", "message": "Arrangement not found."}, 404
+        elif arrangement.user_id != user_id:
+            db.session.rollback()
+            return {"status": "fail", "message": "Access denied."}, 403
+
+        job = GenerationJob.query \
+            .filter_by(arrangement_id=arrangement_id) \
+            .order_by(GenerationJob.id.desc()) \
+            .with_for_update() \
+            .first()
+        if arrangement.status != ArrangementStatus.FAILED or job is None or job.status != JobStatus.FAILED:
+            db.session.rollback()
+            return {"status": "fail", "message": "Only failed arrangements can be retried."}, 409
+
+        job_service.resume_job(job)
+        arrangement.status = ArrangementStatus.PENDING if job.stage == JobStage.GENERATE \
+            else ArrangementStatus.PROCESSING
+        db.session.flush()
+        result = converter.arrangement_to_dict(arrangement)
+        db.session.commit()
+
+        response_cache.bump(user_id)
+        return {"status": "success", "message": f"Arrangement resumed from the {job.stage.value.lower()} stage.",
+                "arrangement": result}, 202
+    except Exception as e:
+        logger.error(f"Error retrying arrangement: {e}")
+        db.session.rollback()
+        return {"status": "fail", "message": "Error retrying arrangement."}, 500
+
+
+def delete_arrangement(arrangement_id: int, user_id: int) -> Tuple[Dict[str, str], int]:
+    try:
+        row = _change_owned(arrangement_id, user_id, delete(Arrangement))
+        if row is None or (row.id is None and row.owner_id == user_id):
             return {"status": "fail", "message": "Arrangement not found."}, 404
+        elif row.id is None:
+            return {"status": "fail", "message": "Access denied."}, 403
+
+        response_cache.bump(user_id)
+        return {"status": "success", "message": "Arrangement deleted successfully."}, 200
     except Exception as e:
         logger.error(f"Error deleting arrangement: {e}")
         db.session.rollback()
         return {"status": "fail", "message": "Error deleting arrangement."}, 500
 
 
-def get_user_arrangements(user_id: int, page: int, search_query: str, status: [ArrangementStatus]) -> Tuple[Dict, int]:
+def get_arrangements(arrangement_ids: List[int], user_id: int) -> Tuple[Dict, int]:
     try:
-        status_filter = Arrangement.status.in_(status) if status else None
-
-        search_terms = [f"%{word}%" for word in search_query.split()] if len(search_query) > 0 else []
-        search_filter = and_(
-            *[
-                or_(
-                    Arrangement.name.ilike(term),
-                    Arrangement.tags.ilike(term)
-                ) for term in search_terms
-            ]
-        ) if search_terms else None
-
-        filters = [Arrangement.user_id == user_id]
-        if status_filter is not None:
-            filters.append(status_filter)
-        if search_filter is not None:
-            filters.append(search_filter)
-
-        arrangements_query = Arrangement.query.filter(and_(*filters)).order_by(Arrangement.created_at.desc())
-
-        paginated_arrangements = arrangements_query.paginate(page=page, per_page=per_page, error_out=False)
+        found = {a.id: a for a in Arrangement.query.filter(Arrangement.id.in_(arrangement_ids)).all()}
+    except Exception as e:
+        logger.error(f"Error fetching arrangements: {e}")
+        return {'error': 'An error occurred while fetching arrangements.'}, 500
+
+    results = []
+    for arrangement_id in arrangement_ids:
+        arrangement = found.get(arrangement_id)
+        if arrangement is None:
+            results.append({"id": arrangement_id, "status": "not_found"})
+        elif arrangement.user_id != user_id:
+            results.append({"id": arrangement_id, "status": "forbidden"})
+        else:
+            results.append({"id": arrangement_id, "status": "ok",
+                            "arrangement": converter.arrangement_to_dict(arrangement)})
+    return {"results": results}, 200
+
+
+def delete_arrangements(arrangement_ids: List[int], user_id: int) -> Tuple[Dict, int]:
+    target = select(Arrangement.id, Arrangement.user_id) \
+        .where(Arrangement.id.in_(arrangement_ids)) \
+        .cte('target')
+    changed = delete(Arrangement) \
+        .where(Arrangement.id == target.c.id, target.c.user_id == user_id) \
+        .returning(Arrangement.id) \
+        .cte('changed')
+
+    try:
+        rows = db.session.execute(
+            select(target.c.id, target.c.user_id.label('owner_id'), changed.c.id.label('deleted_id'))
+            .select_from(target.outerjoin(changed, changed.c.id == target.c.id))
+        ).all()
+        db.session.commit()
+    except Exception as e:
+        logger.error(f"Error deleting arrangements: {e}")
+        db.session.rollback()
+        return {"status": "fail", "message": "Error deleting arrangements."}, 500
+
+    found = {row.id: row for row in rows}
+    results = []
+    for arrangement_id in arrangement_ids:
+        row = found.get(arrangement_id)
+        if row is None or (row.deleted_id is None and row.owner_id == user_id):
+            results.append({"id": arrangement_id, "status": "not_found"})
+        elif row.deleted_id is None:
+            results.append({"id": arrangement_id, "status": "forbidden"})
+        else:
+            results.append({"id": arrangement_id, "status": "deleted"})
+
+    deleted = [result["id"] for result in results if result["status"] == "deleted"]
+    if deleted:
+        response_cache.bump(user_id)
+
+    return {"status": "success", "deleted": deleted, "results": results}, 200
+
+
+def get_user_arrangements(user_id: int, page: int, search_query: str, status: [ArrangementStatus],
+                          tag_filter: List[str] = None) -> Tuple[Dict, int]:
+    try:
+        arrangements_query = Arrangement.query \
+            .filter(*_user_filters(user_id, search_query, status, tag_filter)) \
+            .order_by(*_relevance(search_query), Arrangement.created_at.desc(), Arrangement.id.desc())
+
+        counted = not search_query and not tag_filter
+        paginated_arrangements = arrangements_query.paginate(page=page, per_page=per_page, error_out=False,
+                                                             count=not counted)
         arrangements = list(map(lambda a: converter.arrangement_to_dict(a), paginated_arrangements.items))
 
         if len(arrangements) == 0:
             return {"error": "Nothing found"}, 404
 
-        next_page_url = f"{host_url}/api/arrangements/?page={page + 1 if paginated_arrangements.has_next else None}"
-        prev_page_url = f"{host_url}/api/arrangements/?page={page - 1 if paginated_arrangements.has_prev else None}"
-
-        if search_query:
-            next_page_url += f"&search_query={search_query}"
-            prev_page_url += f"&search_query={search_query}"
+        total = counter_service.count_arrangements(user_id, status) if counted else paginated_arrangements.total
+        pages = ceil(total / per_page) if total else 0
 
-        if status_filter is not None:
-            status_query = ",".join(map(lambda x: x.value.lower(), status))
-            next_page_url += f"&status={status_query}"
-            prev_page_url += f"&status={status_query}"
+        query_suffix = _query_suffix(search_query, status, tag_filter)
+        next_page_url = f"{host_url}/api/arrangements/?page={page + 1}{query_suffix}"
+        prev_page_url = f"{host_url}/api/arrangements/?page={page - 1}{query_suffix}"
 
         result = {
-            'count': paginated_arrangements.total,
-            'pages': paginated_arrangements.pages,
-            'next': next_page_url if paginated_arrangements.has_next else None,
-            'prev': prev_page_url if paginated_arrangements.has_prev else None,
+            'count': total,
+            'pages': pages,
+            'next': next_page_url if page < pages else None,
+            'prev': prev_page_url if page > 1 else None,
             'results': arrangements
         }
 
@@ -169,12 +269,124 @@ def get_user_arrangements(user_id: int, page: int, search_query: str, status: [A
         return {'error': 'An error occurred while fetching arrangements.'}, 500
 
 
-def _save_changes(data) -> bool:
+def get_user_arrangements_after(user_id: int, page_cursor: str, search_query: str, status: [ArrangementStatus],
+                                tag_filter: List[str] = None, with_count: bool = False) -> Tuple[Dict, int]:
     try:
-        db.session.add(data)
-        db.session.commit()
-        return True
+        position = cursor.decode(page_cursor) if page_cursor else None
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+    try:
+        filters = _user_filters(user_id, search_query, status, tag_filter)
+        query = Arrangement.query.filter(*filters)
+        key = tuple_(Arrangement.created_at, Arrangement.id)
+
+        backwards = position is not None and position[2] == cursor.PREV
+        if position is None:
+            query = query.order_by(Arrangement.created_at.desc(), Arrangement.id.desc())
+        elif backwards:
+            query = query.filter(key > tuple_(position[0], position[1])) \
+                .order_by(Arrangement.created_at.asc(), Arrangement.id.asc())
+        else:
+            query = query.filter(key < tuple_(position[0], position[1])) \
+                .order_by(Arrangement.created_at.desc(), Arrangement.id.desc())
+
+        rows = query.limit(per_page + 1).all()
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        if backwards:
+            rows.reverse()
+
+        if len(rows) == 0:
+            return {"error": "Nothing found"}, 404
+
+        has_next = position is not None if backwards else has_more
+        has_prev = has_more if backwards else position is not None
+
+        query_suffix = _query_suffix(search_query, status, tag_filter) + ("&with_count=true" if with_count else "")
+        next_cursor = cursor.encode(rows[-1].created_at, rows[-1].id, cursor.NEXT)
+        prev_cursor = cursor.encode(rows[0].created_at, rows[0].id, cursor.PREV)
+        count = None
+        if with_count and not search_query and not tag_filter:
+            count = counter_service.count_arrangements(user_id, status)
+        elif with_count:
+            count = db.session.query(func.count(Arrangement.id)).filter(*filters).scalar()
+
+        result = {
+            'count': count,
+            'pages': None,
+            'next': f"{host_url}/api/arrangements/?cursor={next_cursor}{query_suffix}" if has_next else None,
+            'prev': f"{host_url}/api/arrangements/?cursor={prev_cursor}{query_suffix}" if has_prev else None,
+            'results': [converter.arrangement_to_dict(a) for a in rows]
+        }
+
+        return result, 200
+
     except Exception as e:
-        logger.error(f"Error saving changes: {e}")
-        db.session.rollback()
-        return False
+        logger.error(f"Error fetching user arrangements: {e}")
+        return {'error': 'An error occurred while fetching arrangements.'}, 500
+
+
+def _change_owned(arrangement_id: int, user_id: int, statement) -> Optional[Row]:
+    target = select(Arrangement.id, Arrangement.user_id) \
+        .where(Arrangement.id == arrangement_id) \
+        .cte('target')
+    changed = statement \
+        .where(Arrangement.id == target.c.id, target.c.user_id == user_id) \
+        .returning(*_columns) \
+        .cte('changed')
+
+    row = db.session.execute(
+        select(target.c.user_id.label('owner_id'), *changed.c).select_from(target.outerjoin(changed, true()))
+    ).first()
+    db.session.commit()
+    return row
+
+
+def _user_filters(user_id: int, search_query: str, status: [ArrangementStatus], tag_filter: List[str]) -> List:
+    filters = [Arrangement.user_id == user_id]
+    if status:
+        filters.append(Arrangement.status.in_(status))
+
+    if search_backend == 'fulltext':
+        if tag_filter:
+            filters.append(Arrangement.tag_list.contains(tag_filter))
+        ts_query = _ts_query(search_query)
+        if ts_query is not None:
+            filters.append(or_(Arrangement.search_vector.op('@@')(ts_query),
+                               Arrangement.name.op('%')(search_query.strip())))
+        return filters
+
+    for tag in tag_filter or []:
+        filters.append(Arrangement.tags.ilike(f"%{tag}%"))
+    for word in search_query.split():
+        term = f"%{word}%"
+        filters.append(or_(Arrangement.name.ilike(term), Arrangement.tags.ilike(term)))
+
+    return filters
+
+
+def _relevance(search_query: str) -> List:
+    ts_query = _ts_query(search_query) if search_backend == 'fulltext' else None
+    if ts_query is None:
+        return []
+    return [(func.ts_rank_cd(Arrangement.search_vector, ts_query) +
+             func.similarity(Arrangement.name, search_query.strip())).desc()]
+
+
+def _ts_query(search_query: str):
+    words = re.findall(r'\w+', search_query.lower())
+    if not words:
+        return None
+    return func.to_tsquery('simple', ' & '.join(f"{word}:*" for word in words))
+
+
+def _query_suffix(search_query: str, status: [ArrangementStatus], tag_filter: List[str] = None) -> str:
+    suffix = ""
+    if search_query:
+        suffix += f"&search_query={quote(search_query)}"
+    if status:
+        suffix += f"&status={','.join(map(lambda x: x.value.lower(), status))}"
+    if tag_filter:
+        suffix += f"&tags={quote(','.join(tag_filter))}"
+    return suffix
@@ -0,0 +1,35 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+from app.main import db
+from app.main.model.arrangement_counters import ArrangementCounter
+from app.main.model.arrangement_status import ArrangementStatus
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('counter_service')
+
+
+def get_status_counts(user_id: int) -> Dict[ArrangementStatus, int]:
+    counts = {status: 0 for status in ArrangementStatus}
+    for counter in ArrangementCounter.query.filter_by(user_id=user_id).all():
+        counts[counter.status] = counter.count
+    return counts
+
+
+def count_arrangements(user_id: int, status: Optional[List[ArrangementStatus]] = None) -> int:
+    query = db.session.query(db.func.coalesce(db.func.sum(ArrangementCounter.count), 0)) \
+        .filter(ArrangementCounter.user_id == user_id)
+    if status:
+        query = query.filter(ArrangementCounter.status.in_(status))
+    return int(query.scalar())
+
+
+def get_summary(user_id: int) -> Tuple[Dict, int]:
+    try:
+        counts = get_status_counts(user_id)
+        return {
+            'total': sum(counts.values()),
+            'statuses': {status.value: count for status, count in counts.items()}
+        }, 200
+    except Exception as e:
+        logger.error(f"Error fetching arrangement summary: {e}")
+        return {'error': 'An error occurred while fetching the summary.'}, 500
@@ -0,0 +1,179 @@
+import datetime
+import logging
+from typing import Dict, List, Optional
+from app.main import db
+from app.main.model.arrangement_status import ArrangementStatus
+from app.main.model.arrangements import Arrangement
+from app.main.model.generation_jobs import GenerationJob
+from app.main.model.job_stage import JobStage
+from app.main.model.job_status import JobStatus
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('job_service')
+
+
+class LeaseLostError(Exception):
+    pass
+
+
+def claim_job(worker_id: str, lease_seconds: int, stages: List[JobStage] = None) -> Optional[GenerationJob]:
+    try:
+        query = GenerationJob.query.filter(GenerationJob.status == JobStatus.QUEUED)
+        if stages:
+            query = query.filter(GenerationJob.stage.in_(stages))
+        job = query \
+            .order_by(GenerationJob.id) \
+            .with_for_update(skip_locked=True) \
+            .first()
+        if job is None:
+            db.session.rollback()
+            return None
+
+        now = datetime.datetime.utcnow()
+        job.status = JobStatus.RUNNING
+        job.attempts += 1
+        job.locked_by = worker_id
+        job.locked_until = now + datetime.timedelta(seconds=lease_seconds)
+        job.updated_at = now
+        db.session.commit()
+        return job
+    except Exception as e:
+        logger.error(f"Error claiming job: {e}")
+        db.session.rollback()
+        return None
+
+
+def heartbeat(job_id: int, worker_id: str, lease_seconds: int) -> bool:
+    try:
+        now = datetime.datetime.utcnow()
+        updated = _leased_jobs(job_id, worker_id, now) \
+            .update({GenerationJob.locked_until: now + datetime.timedelta(seconds=lease_seconds),
+                     GenerationJob.updated_at: now})
+        db.session.commit()
+        return updated > 0
+    except Exception as e:
+        logger.error(f"Error extending job lease: {e}")
+        db.session.rollback()
+        return False
+
+
+def complete_job(job_id: int, worker_id: str) -> bool:
+    return _finish_job(job_id, worker_id, JobStatus.COMPLETED)
+
+
+def fail_job(job_id: int, worker_id: str, error: str) -> bool:
+    try:
+        job = _leased_jobs(job_id, worker_id).with_for_update().first()
+        if job is None:
+            return False
+
+        retry_or_fail(job, error)
+        db.session.commit()
+        return True
+    except Exception as e:
+        logger.error(f"Error failing job: {e}")
+        db.session.rollback()
+        return False
+
+
+def lock_job(job_id: int) -> Optional[GenerationJob]:
+    return GenerationJob.query.filter_by(id=job_id).with_for_update().populate_existing().first()
+
+
+def has_job_for_drums(drums_file_name: str) -> bool:
+    return db.session.query(GenerationJob.query.filter_by(drums_file_name=drums_file_name).exists()).scalar()
+
+
+def count_active_jobs() -> Dict[JobStatus, int]:
+    active = [JobStatus.QUEUED, JobStatus.RUNNING, JobStatus.WAITING]
+    counts = dict(db.session.query(GenerationJob.status, db.func.count(GenerationJob.id))
+                  .filter(GenerationJob.status.in_(active))
+                  .group_by(GenerationJob.status)
+                  .all())
+    return {status: counts.get(status, 0) for status in active}
+
+
+def get_waiting_jobs(idle_seconds: int, limit: int = 100) -> List[GenerationJob]:
+    try:
+        idle_since = datetime.datetime.utcnow() - datetime.timedelta(seconds=idle_seconds)
+        return GenerationJob.query \
+            .filter(GenerationJob.status == JobStatus.WAITING, GenerationJob.updated_at < idle_since) \
+            .order_by(GenerationJob.updated_at) \
+            .limit(limit) \
+            .all()
+    except Exception as e:
+        logger.error(f"Error fetching waiting jobs: {e}")
+        return []
+
+
+def recover_stale_jobs() -> List[int]:
+    try:
+        now = datetime.datetime.utcnow()
+        jobs = GenerationJob.query \
+            .filter(GenerationJob.status == JobStatus.RUNNING, GenerationJob.locked_until < now) \
+            .with_for_update(skip_locked=True) \
+            .all()
+
+        failed_arrangements = []
+        for job in jobs:
+            logger.info(f"Recovering job {job.id} abandoned by {job.locked_by}")
+            if not retry_or_fail(job, "Lease expired"):
+                failed_arrangements.append(job.arrangement_id)
+        db.session.commit()
+        return failed_arrangements
+    except Exception as e:
+        logger.error(f"Error recovering stale jobs: {e}")
+        db.session.rollback()
+        return []
+
+
+def _leased_jobs(job_id: int, worker_id: str, now: datetime.datetime = None):
+    return GenerationJob.query.filter(GenerationJob.id == job_id,
+                                      GenerationJob.locked_by == worker_id,
+                                      GenerationJob.status == JobStatus.RUNNING,
+                                      GenerationJob.locked_until >= (now or datetime.datetime.utcnow()))
+
+
+def _finish_job(job_id: int, worker_id: str, status: JobStatus) -> bool:
+    try:
+        job = _leased_jobs(job_id, worker_id).with_for_update().first()
+        if job is None:
+            return False
+
+        release_job(job, status)
+        db.session.commit()
+        return True
+    except Exception as e:
+        logger.error(f"Error finishing job: {e}")
+        db.session.rollback()
+        return False
+
+
+def retry_or_fail(job: GenerationJob, error: str) -> bool:
+    if job.attempts < job.max_attempts:
+        release_job(job, JobStatus.QUEUED, error)
+        return True
+
+    release_job(job, JobStatus.FAILED, error)
+    _fail_arrangement(job.arrangement_id)
+    return False
+
+
+def resume_job(job: GenerationJob) -> None:
+    job.attempts = 0
+    release_job(job, JobStatus.QUEUED)
+
+
+def release_job(job: GenerationJob, status: JobStatus, error: Optional[str] = None) -> None:
+    job.status = status
+    job.locked_by = None
+    job.locked_until = None
+    job.last_error = error
+    job.updated_at = datetime.datetime.utcnow()
+
+
+def _fail_arrangement(arrangement_id: int) -> None:
+    Arrangement.query \
+        .filter(Arrangement.id == arrangement_id,
+                Arrangement.status.in_([ArrangementStatus.PENDING, ArrangementStatus.PROCESSING])) \
+        .update({Arrangement.status: ArrangementStatus.FAILED}, synchronize_session=False)
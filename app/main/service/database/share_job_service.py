@@ -0,0 +1,91 @@
+import datetime
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+from app.main import db
+from app.main.model.share_job_status import ShareJobStatus
+from app.main.model.share_jobs import ShareJob
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('share_job_service')
+
+share_job_timeout = int(os.getenv('SHARE_JOB_TIMEOUT', 600))
+
+ACTIVE_STATUSES = [ShareJobStatus.QUEUED, ShareJobStatus.RENDERING, ShareJobStatus.UPLOADING]
+
+
+def add_share_job(user_id: int, arrangement_id: int, upload_url: str) -> Tuple[Dict[str, str], int]:
+    try:
+        now = datetime.datetime.utcnow()
+        share_job = ShareJob(user_id=user_id, arrangement_id=arrangement_id, upload_url=upload_url,
+                             status=ShareJobStatus.QUEUED, created_at=now, updated_at=now)
+        db.session.add(share_job)
+        db.session.commit()
+        return {"status": "success", "message": "Share job created.", "id": share_job.id}, 202
+    except Exception as e:
+        logger.error(f"Error adding share job: {e}")
+        db.session.rollback()
+        return {"status": "fail", "message": "Error creating share job."}, 500
+
+
+def get_share_job(share_job_id: int) -> Optional[ShareJob]:
+    try:
+        return ShareJob.query.filter_by(id=share_job_id).first()
+    except Exception as e:
+        logger.error(f"Error fetching share job: {e}")
+        return None
+
+
+def start_share_job(share_job_id: int) -> Optional[ShareJob]:
+    try:
+        share_job = ShareJob.query \
+            .filter_by(id=share_job_id, status=ShareJobStatus.QUEUED) \
+            .with_for_update() \
+            .first()
+        if share_job is None:
+            db.session.rollback()
+            return None
+
+        share_job.status = ShareJobStatus.RENDERING
+        share_job.updated_at = datetime.datetime.utcnow()
+        db.session.commit()
+        return share_job
+    except Exception as e:
+        logger.error(f"Error starting share job: {e}")
+        db.session.rollback()
+        return None
+
+
+def update_share_job(share_job: ShareJob, status: ShareJobStatus, response=None, response_code: int = None,
+                     error: str = None) -> None:
+    try:
+        share_job.status = status
+        share_job.response = json.dumps(response) if response is not None else share_job.response
+        share_job.response_code = response_code or share_job.response_code
+        share_job.error = error
+        share_job.updated_at = datetime.datetime.utcnow()
+        db.session.commit()
+    except Exception as e:
+        logger.error(f"Error updating share job: {e}")
+        db.session.rollback()
+
+
+def fail_stale_share_jobs() -> List[ShareJob]:
+    try:
+        now = datetime.datetime.utcnow()
+        share_jobs = ShareJob.query \
+            .filter(ShareJob.status.in_(ACTIVE_STATUSES),
+                    ShareJob.updated_at < now - datetime.timedelta(seconds=share_job_timeout)) \
+            .with_for_update(skip_locked=True) \
+            .all()
+        for share_job in share_jobs:
+            share_job.status = ShareJobStatus.FAILED
+            share_job.error = "Share job was interrupted"
+            share_job.updated_at = now
+        db.session.commit()
+        return share_jobs
+    except Exception as e:
+        logger.error(f"Error failing stale share jobs: {e}")
+        db.session.rollback()
+        return []
@@ -0,0 +1,106 @@
+import datetime
+import logging
+from contextlib import contextmanager
+from typing import Iterable, List, Set
+from sqlalchemy import delete, func, insert, select, text, union
+from app.main import db
+from app.main.model.arrangements import Arrangement
+from app.main.model.generation_jobs import GenerationJob
+from app.main.model.job_status import JobStatus
+from app.main.model.storage_deletions import StorageDeletion
+from app.main.util import storage_keys
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('storage_deletion_service')
+
+SWEEP_LOCK_KEY = 0x6861726d6f6e6961
+MAX_RETRY_DELAY = 3600
+
+
+def enqueue(names: Iterable[str], artifacts: bool = False) -> bool:
+    rows = [{'name': name, 'artifacts': artifacts} for name in names]
+    if not rows:
+        return True
+
+    try:
+        db.session.execute(insert(StorageDeletion), rows)
+        db.session.commit()
+        return True
+    except Exception as e:
+        logger.error(f"Error enqueueing storage deletions: {e}")
+        db.session.rollback()
+        return False
+
+
+def count_pending() -> int:
+    return db.session.query(db.func.count(StorageDeletion.id)).scalar()
+
+
+def claim_due(limit: int) -> List[StorageDeletion]:
+    return StorageDeletion.query \
+        .filter(StorageDeletion.not_before <= datetime.datetime.utcnow()) \
+        .order_by(StorageDeletion.id) \
+        .limit(limit) \
+        .with_for_update(skip_locked=True) \
+        .all()
+
+
+def object_names(deletion: StorageDeletion) -> List[str]:
+    return storage_keys.artifact_names(deletion.name) if deletion.artifacts else [deletion.name]
+
+
+def finish(deletions: List[StorageDeletion], failed: Set[str], error: str = None) -> None:
+    now = datetime.datetime.utcnow()
+    done = []
+    for deletion in deletions:
+        if failed.isdisjoint(object_names(deletion)):
+            done.append(deletion.id)
+            continue
+
+        deletion.attempts += 1
+        deletion.last_error = error
+        deletion.not_before = now + datetime.timedelta(seconds=min(30 * 2 ** deletion.attempts, MAX_RETRY_DELAY))
+
+    if done:
+        db.session.execute(delete(StorageDeletion).where(StorageDeletion.id.in_(done)))
+    db.session.commit()
+
+
+def find_orphans(names: List[str]) -> List[str]:
+    bases = {storage_keys.base_name(name) for name in names}
+    if not bases:
+        return []
+
+    local_urls = [f"{storage_keys.LOCAL_SCHEME}{base}" for base in bases]
+    local_offset = len(storage_keys.LOCAL_SCHEME) + 1
+    known = set(db.session.execute(union(
+        select(Arrangement.file_name).where(Arrangement.file_name.in_(bases)),
+        select(GenerationJob.drums_file_name).where(GenerationJob.drums_file_name.in_(bases),
+                                                    GenerationJob.status != JobStatus.COMPLETED),
+        select(GenerationJob.stem_file_name).where(GenerationJob.stem_file_name.in_(bases),
+                                                   GenerationJob.status != JobStatus.COMPLETED),
+        select(func.substr(GenerationJob.music_url, local_offset)).where(GenerationJob.music_url.in_(local_urls),
+                                                                        GenerationJob.status != JobStatus.COMPLETED),
+        select(func.substr(GenerationJob.stem_url, local_offset)).where(GenerationJob.stem_url.in_(local_urls),
+                                                                       GenerationJob.status != JobStatus.COMPLETED),
+        select(StorageDeletion.name).where(StorageDeletion.name.in_(bases))
+    )).scalars())
+    db.session.commit()
+    return [name for name in names if storage_keys.base_name(name) not in known]
+
+
+@contextmanager
+def sweep_lock():
+    if db.engine.dialect.name != 'postgresql':
+        yield True
+        return
+
+    with db.engine.connect() as connection:
+        acquired = connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {'key': SWEEP_LOCK_KEY}).scalar()
+        connection.commit()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                connection.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': SWEEP_LOCK_KEY})
+                connection.commit()
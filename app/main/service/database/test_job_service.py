@@ -0,0 +1,83 @@
+import datetime
+import threading
+import pytest
+from app.main.model.arrangement_status import ArrangementStatus
+from app.main.model.arrangements import Arrangement
+from app.main.model.generation_jobs import GenerationJob
+from app.main.model.job_status import JobStatus
+from app.main.service import generation_service
+from app.main.service.database import arrangement_service, job_service, user_service
+
+
+@pytest.fixture
+def job_id(database):
+    user_service.register_user(1)
+    response, status = arrangement_service.add_arrangement(
+        {'user_id': 1, 'name': 'Loop', 'bpm': 120, 'tags': 'rock', 'drums_file_name': 'drums'})
+    assert status == 201
+    return GenerationJob.query.filter_by(arrangement_id=response['id']).one().id
+
+
+def expire_lease(database, job_id):
+    job = database.session.get(GenerationJob, job_id)
+    job.locked_until = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    database.session.commit()
+
+
+def test_claim_takes_each_queued_job_once(job_id):
+    job = job_service.claim_job('a', 60)
+
+    assert (job.id, job.status, job.locked_by, job.attempts) == (job_id, JobStatus.RUNNING, 'a', 1)
+    assert job_service.claim_job('b', 60) is None
+
+
+def test_only_the_lease_holder_can_extend_or_complete(database, job_id):
+    job_service.claim_job('a', 60)
+
+    assert not job_service.heartbeat(job_id, 'b', 60)
+    assert not job_service.complete_job(job_id, 'b')
+    assert job_service.heartbeat(job_id, 'a', 60)
+    assert job_service.complete_job(job_id, 'a')
+    assert database.session.get(GenerationJob, job_id).status == JobStatus.COMPLETED
+
+
+def test_expired_lease_cannot_be_completed(database, job_id):
+    job_service.claim_job('a', 60)
+    expire_lease(database, job_id)
+
+    assert not job_service.heartbeat(job_id, 'a', 60)
+    assert not job_service.complete_job(job_id, 'a')
+    assert not job_service.fail_job(job_id, 'a', 'boom')
+    assert database.session.get(GenerationJob, job_id).status == JobStatus.RUNNING
+
+
+def test_recover_requeues_expired_jobs_until_attempts_run_out(database, job_id):
+    for attempt in range(1, 4):
+        job = job_service.claim_job(f'worker-{attempt}', 60)
+        assert job.attempts == attempt
+        expire_lease(database, job_id)
+        failed = job_service.recover_stale_jobs()
+
+    job = database.session.get(GenerationJob, job_id)
+    assert (job.status, job.locked_by, job.last_error) == (JobStatus.FAILED, None, 'Lease expired')
+    assert failed == [job.arrangement_id]
+    assert database.session.get(Arrangement, job.arrangement_id).status == ArrangementStatus.FAILED
+
+
+def test_recovered_job_cannot_be_completed_by_its_old_worker(database, job_id):
+    job_service.claim_job('a', 60)
+    expire_lease(database, job_id)
+    job_service.recover_stale_jobs()
+    job_service.claim_job('b', 60)
+
+    assert not job_service.complete_job(job_id, 'a')
+    assert job_service.complete_job(job_id, 'b')
+
+
+def test_run_job_stops_when_the_lease_is_lost(job_id):
+    job = job_service.claim_job('a', 60)
+    lease_lost = threading.Event()
+    lease_lost.set()
+
+    with pytest.raises(job_service.LeaseLostError):
+        generation_service.run_job(job, lambda arrangement: None, lease_lost)
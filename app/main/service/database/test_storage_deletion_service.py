@@ -0,0 +1,39 @@
+import pytest
+from app.main.model.generation_jobs import GenerationJob
+from app.main.model.storage_deletions import StorageDeletion
+from app.main.service.database import arrangement_service, job_service, storage_deletion_service, user_service
+
+
+@pytest.fixture
+def job(database):
+    user_service.register_user(1)
+    arrangement_service.add_arrangement(
+        {'user_id': 1, 'name': 'Loop', 'bpm': 120, 'tags': 'rock', 'drums_file_name': 'drums'})
+    job = job_service.claim_job('a', 60)
+    job.music_url = 'local://generated_music'
+    job.stem_url = 'local://generated_stem'
+    database.session.commit()
+    return job
+
+
+def queued_names(database):
+    return sorted(database.session.execute(database.select(StorageDeletion.name)).scalars())
+
+
+def test_running_job_files_are_not_orphans(job):
+    names = ['drums', 'generated_music', 'generated_stem', 'stray']
+    assert storage_deletion_service.find_orphans(names) == ['stray']
+
+
+def test_completing_a_job_queues_its_inputs_and_local_outputs(database, job):
+    assert job_service.complete_job(job.id, 'a')
+    assert queued_names(database) == ['drums', 'generated_music', 'generated_stem']
+
+
+def test_replicate_outputs_are_not_queued(database, job):
+    job = database.session.get(GenerationJob, job.id)
+    job.music_url = job.stem_url = 'https://replicate.delivery/output.wav'
+    database.session.commit()
+
+    assert job_service.complete_job(job.id, 'a')
+    assert queued_names(database) == ['drums']
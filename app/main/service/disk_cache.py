@@ -0,0 +1,264 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from stat import S_ISDIR
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger('disk_cache')
+
+_TEMP_PREFIX = '.tmp-'
+_TEMP_MAX_AGE = 3600
+_EVICT_TO = 0.9
+
+
+class CachedStorage:
+    """Read-through LRU disk cache in front of an ``S3Storage``.
+
+    Files are stored under a hash of their object name and always land with an
+    atomic rename, so readers never see a partial file. Bytes and files uploaded
+    through the cache are kept locally too; ``prefetch`` fills the cache in the
+    background for callers that stream a miss straight from storage.
+
+    Sizes and recency are kept in an in-memory LRU index that is built from the
+    directory at startup and updated on every read and write. Reads also touch
+    the file, so processes sharing the directory agree on recency. When the
+    index total goes over ``max_bytes``, the index is rebuilt from the
+    directory, which picks up files written by other processes, and the least
+    recently used files are evicted down to 90% of the limit.
+
+    The directory must be private to the current user; otherwise the cache is
+    disabled and everything is delegated to the wrapped storage.
+    """
+
+    def __init__(self, storage, directory: str, max_bytes: int):
+        self._storage = storage
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        self._index = OrderedDict()
+        self._prefetching = set()
+        self._prefetcher = ThreadPoolExecutor(max_workers=2)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+
+        if self.enabled and not private_directory(directory):
+            logger.error(f"Storage cache directory {directory} is not private to this user, caching is disabled")
+            self._directory = None
+        if self.enabled:
+            self._index = self._scan()
+            self.size = sum(self._index.values())
+            if self.size > self._max_bytes:
+                self._evict()
+
+    def __getattr__(self, name):
+        return getattr(self._storage, name)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._directory) and self._max_bytes > 0
+
+    def upload(self, file, name, content_type=None):
+        self._storage.upload(file, name, content_type)
+        if isinstance(file, (bytes, bytearray)):
+            self._store(name, lambda path: _write(path, file))
+
+    def upload_file(self, path, name):
+        self._storage.upload_file(path, name)
+        self._store(name, lambda temp_path: shutil.copyfile(path, temp_path))
+
+    def get(self, name):
+        path = self._lookup(name) if self.enabled else None
+        if path is not None:
+            try:
+                with open(path, 'rb') as f:
+                    return f.read()
+            except FileNotFoundError:
+                pass
+
+        data = self._storage.get(name)
+        if data is not None:
+            self._store(name, lambda temp_path: _write(temp_path, data))
+        return data
+
+    def download(self, name, path):
+        cached = self._lookup(name) if self.enabled else None
+        if cached is not None:
+            try:
+                shutil.copyfile(cached, path)
+                return True
+            except FileNotFoundError:
+                pass
+
+        if not self._storage.download(name, path):
+            return False
+        self._store(name, lambda temp_path: shutil.copyfile(path, temp_path))
+        return True
+
+    def local_path(self, name) -> Optional[str]:
+        return self._lookup(name) if self.enabled else None
+
+    def prefetch(self, name) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if name in self._prefetching:
+                return
+            self._prefetching.add(name)
+        self._prefetcher.submit(self._prefetch, name)
+
+    def delete(self, name):
+        return self.delete_many([name])
+
+    def delete_many(self, names):
+        for name in names:
+            self.invalidate(name)
+        return self._storage.delete_many(names)
+
+    def invalidate(self, name) -> None:
+        if not self.enabled:
+            return
+        path = os.path.join(self._directory, _file_name(name))
+        _remove(path)
+        with self._lock:
+            self.size -= self._index.pop(path, 0)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._index),
+                'bytes': self.size,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+    def _prefetch(self, name) -> None:
+        try:
+            self._store(name, lambda temp_path: self._storage.download(name, temp_path))
+        finally:
+            with self._lock:
+                self._prefetching.discard(name)
+
+    def _lookup(self, name) -> Optional[str]:
+        path = os.path.join(self._directory, _file_name(name))
+        try:
+            os.utime(path)
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+                self.size -= self._index.pop(path, 0)
+            return None
+
+        with self._lock:
+            self.hits += 1
+        self._track(path, size)
+        return path
+
+    def _store(self, name, write: Callable[[str], Optional[bool]]) -> Optional[str]:
+        if not self.enabled:
+            return None
+
+        path = os.path.join(self._directory, _file_name(name))
+        fd, temp_path = tempfile.mkstemp(prefix=_TEMP_PREFIX, dir=self._directory)
+        os.close(fd)
+
+        try:
+            if write(temp_path) is False:
+                return None
+            size = os.path.getsize(temp_path)
+            if size > self._max_bytes:
+                return None
+            os.replace(temp_path, path)
+        except Exception as e:
+            logger.error(f"Error caching {name}: {e}")
+            return None
+        finally:
+            _remove(temp_path)
+
+        if self._track(path, size) > self._max_bytes:
+            self._evict(keep=path)
+        return path
+
+    def _track(self, path: str, size: int) -> int:
+        with self._lock:
+            self.size += size - self._index.pop(path, 0)
+            self._index[path] = size
+            return self.size
+
+    def _evict(self, keep: str = None) -> None:
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            index = self._scan()
+            size = sum(index.values())
+            kept = index.pop(keep, None)
+            evicted = 0
+            while index and size > self._max_bytes * _EVICT_TO:
+                path, file_size = index.popitem(last=False)
+                _remove(path)
+                size -= file_size
+                evicted += 1
+            if kept is not None:
+                index[keep] = kept
+
+            with self._lock:
+                self._index = index
+                self.size = size
+                self.evictions += evicted
+        finally:
+            self._evict_lock.release()
+
+    def _scan(self) -> OrderedDict:
+        files = []
+        for entry in os.scandir(self._directory):
+            try:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if entry.name.startswith(_TEMP_PREFIX):
+                if stat.st_mtime < time.time() - _TEMP_MAX_AGE:
+                    _remove(entry.path)
+                continue
+            files.append((stat.st_mtime, entry.path, stat.st_size))
+        return OrderedDict((path, file_size) for _, path, file_size in sorted(files))
+
+
+def private_directory(directory: str) -> bool:
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        stat = os.lstat(directory)
+    except OSError as e:
+        logger.error(f"Error creating directory {directory}: {e}")
+        return False
+    return S_ISDIR(stat.st_mode) and stat.st_uid == os.getuid() and not stat.st_mode & 0o077
+
+
+def _file_name(name: str) -> str:
+    return hashlib.sha256(name.encode()).hexdigest()
+
+
+def _write(path: str, data: bytes) -> None:
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,369 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from math import ceil
+from typing import Callable, Dict, Iterable, List, Optional
+import numpy as np
+import replicate
+import requests
+from app.main import s3_storage
+from app.main.model.job_stage import JobStage
+from app.main.service import audio_mixer
+from app.main.util import metrics, webhook as webhook_util
+from app.main.util.storage_keys import LOCAL_SCHEME
+
+logger = logging.getLogger('generation_backends')
+
+MUSIC_GEN_VERSION = "f8140d0457c2b39ad8728a80736fea9a67a0ec0cd37b35f40b68cce507db2366"
+DEMUCS_VERSION = "5a7041cc9b82e5a558fea6b3d7b12dea89625e89da33f0447bd727c2d0ab9e77"
+TERMINAL_STATUSES = ("succeeded", "failed", "canceled")
+WEBHOOK_EVENTS = ["start", "completed"]
+LATENCY_WINDOW = 100
+MIN_SAMPLES = 5
+
+backend_names = [name.strip() for name in os.getenv('GENERATION_BACKENDS', 'replicate').split(',') if name.strip()]
+hedging_enabled = os.getenv('GENERATION_HEDGING', 'false').lower() in ('1', 'true', 'yes')
+exploration_rate = float(os.getenv('GENERATION_ROUTING_EXPLORATION', 0.05))
+prediction_timeout = int(os.getenv('PREDICTION_TIMEOUT', 300))
+local_delay = float(os.getenv('LOCAL_BACKEND_DELAY', 0))
+
+
+class GenerationBackend(ABC):
+    """A provider for the melody generation and stem separation stages.
+
+    Prediction ids are prefixed with ``<name>:`` so any process can route a
+    stored id back to its backend. Replicate ids are stored unprefixed.
+    """
+
+    name = None
+
+    @abstractmethod
+    def start_generation(self, bpm: float, tags: str, webhook: Optional[str] = None):
+        pass
+
+    @abstractmethod
+    def start_separation(self, url: str, webhook: Optional[str] = None):
+        pass
+
+    @abstractmethod
+    def get_prediction(self, prediction_id: str):
+        pass
+
+    async def async_get_prediction(self, prediction_id: str):
+        return self.get_prediction(prediction_id)
+
+    def cancel_prediction(self, prediction_id: str) -> None:
+        pass
+
+
+class ReplicateBackend(GenerationBackend):
+    name = 'replicate'
+
+    def __init__(self):
+        self._async_client = None
+
+    @metrics.external_call_seconds.time(service='replicate', operation='start_generation')
+    def start_generation(self, bpm: float, tags: str, webhook: Optional[str] = None):
+        return replicate.predictions.create(
+            version=MUSIC_GEN_VERSION,
+            input={
+                "bpm": bpm,
+                "seed": -1,
+                "top_k": 250,
+                "top_p": 0,
+                "prompt": tags,
+                "variations": 1,
+                "temperature": 1,
+                "max_duration": melody_duration(bpm),
+                "model_version": "medium",
+                "output_format": "wav",
+                "classifier_free_guidance": 3
+            },
+            **self._webhook_options(webhook)
+        )
+
+    @metrics.external_call_seconds.time(service='replicate', operation='start_separation')
+    def start_separation(self, url: str, webhook: Optional[str] = None):
+        if url.startswith(LOCAL_SCHEME):
+            url = s3_storage.presigned_url(url[len(LOCAL_SCHEME):], 3600)
+
+        return replicate.predictions.create(
+            version=DEMUCS_VERSION,
+            input={
+                "jobs": 0,
+                "stem": "other",
+                "audio": url,
+                "model": "htdemucs",
+                "split": True,
+                "shifts": 1,
+                "overlap": 0.25,
+                "clip_mode": "rescale",
+                "mp3_preset": 2,
+                "wav_format": "int24",
+                "mp3_bitrate": 320,
+                "output_format": "wav"
+            },
+            **self._webhook_options(webhook)
+        )
+
+    @metrics.external_call_seconds.time(service='replicate', operation='get_prediction')
+    def get_prediction(self, prediction_id: str):
+        return replicate.predictions.get(prediction_id)
+
+    async def async_get_prediction(self, prediction_id: str):
+        if self._async_client is None:
+            self._async_client = replicate.Client()
+        with metrics.external_call_seconds.time(service='replicate', operation='get_prediction'):
+            return await self._async_client.predictions.async_get(prediction_id)
+
+    def cancel_prediction(self, prediction_id: str) -> None:
+        replicate.predictions.cancel(prediction_id)
+
+    @staticmethod
+    def _webhook_options(webhook: Optional[str]) -> dict:
+        if not webhook:
+            return {}
+        return {"webhook": webhook, "webhook_events_filter": WEBHOOK_EVENTS}
+
+
+class LocalPrediction:
+    def __init__(self, prediction_id: str):
+        self.id = prediction_id
+        self.error = None
+        self.reload()
+
+    def reload(self) -> None:
+        _, token = self.id.split(':', 1)
+        kind, created_ms, _ = token.split('-')
+        created = int(created_ms, 16) / 1000
+        done = time.time() >= created + local_delay
+
+        self.status = "succeeded" if done else "processing"
+        self.output = {LocalBackend.output_keys[kind]: f"{LOCAL_SCHEME}generated_{token}"} if done else None
+        self.created_at = self.started_at = _timestamp(created)
+        self.completed_at = _timestamp(created + local_delay) if done else None
+
+    def to_dict(self) -> Dict:
+        return {'id': self.id, 'status': self.status, 'output': self.output, 'error': self.error,
+                'created_at': self.created_at, 'started_at': self.started_at, 'completed_at': self.completed_at}
+
+
+class LocalBackend(GenerationBackend):
+    """Deterministic CPU stand-in for tests and benchmarks.
+
+    Generation renders a melody seeded by the tags and bpm, and separation
+    filters the low end out of its input. The audio is rendered when the
+    prediction starts and kept in storage until its job completes or is
+    deleted; outputs no job points to are left to the orphan sweep. A prediction reports ``processing`` for ``LOCAL_BACKEND_DELAY``
+    seconds. It needs no state beyond its id, so any process can poll it.
+    """
+
+    name = 'local'
+    output_keys = {'generate': 'variation_01', 'separate': 'other'}
+
+    @metrics.external_call_seconds.time(service='local', operation='start_generation')
+    def start_generation(self, bpm: float, tags: str, webhook: Optional[str] = None):
+        return self._start('generate', render_melody(bpm, tags), webhook)
+
+    @metrics.external_call_seconds.time(service='local', operation='start_separation')
+    def start_separation(self, url: str, webhook: Optional[str] = None):
+        if url.startswith(LOCAL_SCHEME):
+            data = fetch_local(url)
+            if data is None:
+                raise Exception(f"Local output {url} not found")
+        else:
+            response = requests.get(url, timeout=30)
+            response.raise_for_status()
+            data = response.content
+        return self._start('separate', remove_low_end(data), webhook)
+
+    def get_prediction(self, prediction_id: str):
+        return LocalPrediction(prediction_id)
+
+    def _start(self, kind: str, data: bytes, webhook: Optional[str]) -> LocalPrediction:
+        token = f"{kind}-{int(time.time() * 1000):x}-{uuid.uuid4().hex[:16]}"
+        s3_storage.upload(data, f"generated_{token}", 'audio/wav')
+
+        prediction = LocalPrediction(f"{self.name}:{token}")
+        if webhook:
+            timer = threading.Timer(local_delay, _send_webhook, args=(webhook, prediction))
+            timer.daemon = True
+            timer.start()
+        return prediction
+
+
+class BackendRouter:
+    """Picks a backend per stage from recent prediction latencies.
+
+    Backends are ranked by the median latency of their last predictions.
+    Failures, and predictions canceled because a hedge won, count as a full
+    ``PREDICTION_TIMEOUT``, so the p95 does not drift down as hedges win. A
+    backend with too few samples ranks first, so that it gets measured. A
+    small share of requests goes to a random backend to keep the figures
+    fresh. If starting a prediction fails, the next backend is tried. With
+    hedging on, ``hedge_delay`` returns a backend's p95. A caller still
+    waiting after that long can start the same stage elsewhere.
+    """
+
+    def __init__(self, names: List[str], hedging: bool = False, exploration: float = 0.0):
+        self._backends: Dict[str, GenerationBackend] = {backend.name: backend() for backend in BACKENDS.values()}
+        unknown = [name for name in names if name not in self._backends]
+        if unknown:
+            raise ValueError(f"Unknown generation backends: {', '.join(unknown)}")
+
+        self.names = names
+        self.hedging = hedging
+        self.exploration = exploration
+        self._latencies: Dict[tuple, deque] = {}
+        self._lock = threading.Lock()
+
+    def start_generation(self, bpm: float, tags: str, webhook: Optional[str] = None, exclude: Iterable[str] = ()):
+        return self._start(JobStage.GENERATE, lambda backend: backend.start_generation(bpm, tags, webhook), exclude)
+
+    def start_separation(self, url: str, webhook: Optional[str] = None, exclude: Iterable[str] = ()):
+        return self._start(JobStage.SEPARATE, lambda backend: backend.start_separation(url, webhook), exclude)
+
+    def get_prediction(self, prediction_id: str):
+        return self.backend_for(prediction_id).get_prediction(prediction_id)
+
+    async def async_get_prediction(self, prediction_id: str):
+        return await self.backend_for(prediction_id).async_get_prediction(prediction_id)
+
+    def cancel_prediction(self, prediction_id: str) -> None:
+        self.backend_for(prediction_id).cancel_prediction(prediction_id)
+
+    def backend_for(self, prediction_id: str) -> GenerationBackend:
+        return self._backends[self.backend_name(prediction_id)]
+
+    @staticmethod
+    def backend_name(prediction_id: str) -> str:
+        name, separator, _ = prediction_id.partition(':')
+        return name if separator else ReplicateBackend.name
+
+    def observe(self, prediction_id: str, stage: JobStage, seconds: float, succeeded: bool) -> None:
+        self._record(self.backend_name(prediction_id), stage, seconds, succeeded)
+
+    def hedge_delay(self, prediction_id: str, stage: JobStage) -> Optional[float]:
+        name = self.backend_name(prediction_id)
+        if not self.hedging or not any(other != name for other in self.names):
+            return None
+        return self._quantile(name, stage, 0.95)
+
+    def ranked(self, stage: JobStage, exclude: Iterable[str] = ()) -> List[str]:
+        candidates = [name for name in self.names if name not in exclude]
+
+        def score(name):
+            median = self._quantile(name, stage, 0.5)
+            return median if median is not None else 0.0
+
+        candidates.sort(key=score)
+        if len(candidates) > 1 and random.random() < self.exploration:
+            candidates.insert(0, candidates.pop(random.randrange(1, len(candidates))))
+        return candidates
+
+    def latency_stats(self) -> Dict[tuple, float]:
+        stats = {}
+        for name in self.names:
+            for stage in (JobStage.GENERATE, JobStage.SEPARATE):
+                for label, q in (('0.5', 0.5), ('0.95', 0.95)):
+                    value = self._quantile(name, stage, q, min_samples=1)
+                    if value is not None:
+                        stats[(name, stage.value.lower(), label)] = value
+        return stats
+
+    def _start(self, stage: JobStage, call: Callable[[GenerationBackend], object], exclude: Iterable[str]):
+        candidates = self.ranked(stage, exclude)
+        if not candidates:
+            raise Exception(f"No generation backend available for {stage.value.lower()}")
+
+        error = None
+        for name in candidates:
+            try:
+                return call(self._backends[name])
+            except Exception as e:
+                logger.error(f"Backend {name} failed to start {stage.value.lower()}: {e}")
+                self._record(name, stage, prediction_timeout, False)
+                error = e
+        raise error
+
+    def _record(self, name: str, stage: JobStage, seconds: float, succeeded: bool) -> None:
+        key = (name, stage)
+        with self._lock:
+            window = self._latencies.setdefault(key, deque(maxlen=LATENCY_WINDOW))
+            window.append(seconds if succeeded else max(seconds, prediction_timeout))
+
+    def _quantile(self, name: str, stage: JobStage, q: float, min_samples: int = MIN_SAMPLES) -> Optional[float]:
+        with self._lock:
+            window = self._latencies.get((name, stage))
+            if window is None or len(window) < min_samples:
+                return None
+            return float(np.quantile(np.fromiter(window, dtype=float), q))
+
+
+BACKENDS = {backend.name: backend for backend in (ReplicateBackend, LocalBackend)}
+
+router = BackendRouter(backend_names, hedging_enabled, exploration_rate)
+
+metrics.Gauge('harmonia_generation_backend_latency_seconds', 'Recent prediction latency by backend and stage',
+              ('backend', 'stage', 'quantile'), function=router.latency_stats)
+hedged_requests = metrics.Counter('harmonia_generation_hedged_requests_total',
+                                  'Predictions started on a second backend, and how many of them won',
+                                  ('stage', 'outcome'))
+
+
+def melody_duration(bpm: float) -> int:
+    return ceil(60 / bpm * 4 * 4) + 2
+
+
+def fetch_local(url: str) -> Optional[bytes]:
+    return s3_storage.get(url[len(LOCAL_SCHEME):])
+
+
+def render_melody(bpm: float, tags: str, frame_rate: int = 32000) -> bytes:
+    seed = int.from_bytes(hashlib.sha256(f"{tags}|{bpm}".encode()).digest()[:8], 'big')
+    rng = np.random.default_rng(seed)
+
+    t = np.arange(melody_duration(bpm) * frame_rate) / frame_rate
+    beats = t * bpm / 60
+    scale = np.array([0, 2, 4, 7, 9, 12, 14, 16])
+    notes = scale[rng.integers(0, len(scale), int(beats[-1]) + 1)]
+    frequencies = 220 * 2 ** (notes[beats.astype(int)] / 12)
+    tone = np.sin(2 * np.pi * np.cumsum(frequencies) / frame_rate) * np.exp(-(beats % 1) * 3) * 0.5
+    return audio_mixer.encode(audio_mixer.Audio(np.stack([tone, tone], axis=1).astype(np.float32), frame_rate, 2))
+
+
+def remove_low_end(data: bytes, window: int = 64) -> bytes:
+    audio = audio_mixer.decode(data)
+    padded = np.concatenate([np.zeros((window, audio.channels), dtype=audio.samples.dtype), audio.samples])
+    cumulative = np.cumsum(padded, axis=0)
+    low = (cumulative[window:] - cumulative[:-window]) / window
+    return audio_mixer.encode(audio_mixer.Audio((audio.samples - low).astype(np.float32), audio.frame_rate,
+                                                audio.sample_width))
+
+
+def _send_webhook(url: str, prediction: LocalPrediction) -> None:
+    prediction.reload()
+    body = json.dumps(prediction.to_dict()).encode()
+    webhook_id = f"msg_{uuid.uuid4().hex}"
+    timestamp = str(int(time.time()))
+    headers = {'Content-Type': 'application/json', 'webhook-id': webhook_id, 'webhook-timestamp': timestamp}
+    if webhook_util.webhook_secret:
+        signature = webhook_util.sign(webhook_util.webhook_secret, webhook_id, timestamp, body)
+        headers['webhook-signature'] = f"v1,{signature}"
+
+    try:
+        requests.post(url, data=body, headers=headers, timeout=10)
+    except requests.RequestException as e:
+        logger.error(f"Webhook delivery to {url} failed: {e}")
+
+
+def _timestamp(seconds: float) -> str:
+    return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc).isoformat()
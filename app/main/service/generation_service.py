@@ -0,0 +1,319 @@
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional
+from app.main import app, db, s3_storage
+from app.main.model.arrangement_status import ArrangementStatus
+from app.main.model.arrangements import Arrangement
+from app.main.model.generation_jobs import GenerationJob
+from app.main.model.job_stage import JobStage
+from app.main.model.job_status import JobStatus
+from app.main.service.database import arrangement_service, job_service, storage_deletion_service
+from app.main.service.music_gen_service import MusicGenerator, TERMINAL_STATUSES
+from app.main.service.prediction_tracker import PredictionTracker
+from app.main.service import audio_mixer, generation_backends, rendition_service
+from app.main.util import metrics, storage_keys, webhook as webhook_util
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('generation_service')
+
+generation_mode = os.getenv('GENERATION_MODE', 'blocking')
+host_url = os.getenv('HOST_URL')
+prediction_timeout = generation_backends.prediction_timeout
+reconcile_idle_seconds = int(os.getenv('RECONCILE_IDLE_SECONDS', 60))
+
+if generation_mode == 'webhook' and not webhook_util.webhook_secret:
+    raise ValueError("REPLICATE_WEBHOOK_SECRET is required when GENERATION_MODE is webhook")
+
+poll_intervals = {JobStage.GENERATE: 10, JobStage.SEPARATE: 5}
+
+tracker: Optional[PredictionTracker] = None
+
+metrics.Gauge('harmonia_outstanding_predictions', 'Predictions tracked by this process',
+              function=lambda: tracker.outstanding() if tracker is not None else 0)
+metrics.Gauge('harmonia_prediction_callback_queue_length', 'Prediction updates queued or running on a callback thread',
+              function=lambda: tracker.pending_callbacks() if tracker is not None else 0)
+
+
+def start_tracker(notify: Callable[[Arrangement], None]) -> PredictionTracker:
+    global tracker
+
+    def on_update(job_id: int, payload: Dict) -> None:
+        with app.app_context():
+            handle_prediction(job_id, payload, notify or (lambda arrangement: None))
+
+    tracker = PredictionTracker(on_update)
+    tracker.start()
+    return tracker
+
+
+def run_job(job: GenerationJob, notify: Callable[[Arrangement], None],
+            lease_lost: Optional[threading.Event] = None) -> bool:
+    while job.stage != JobStage.MIX:
+        _check_lease(job, lease_lost)
+        if generation_mode in ('webhook', 'async'):
+            job_service.lock_job(job.id)
+            prediction = _resume_stage(job)
+            if prediction is not None and prediction.status == "succeeded":
+                _record_output(job, prediction.output)
+                db.session.commit()
+                continue
+
+            _park_stage(job, prediction)
+            db.session.commit()
+            _track(job)
+            return False
+
+        prediction = _resume_stage(job)
+        if prediction is None:
+            prediction = _start_stage(job)
+        db.session.commit()
+
+        on_processing = (lambda: _mark_processing(job.arrangement_id, notify)) \
+            if job.stage == JobStage.GENERATE else None
+        primary = prediction
+        started = time.monotonic()
+        prediction = MusicGenerator.wait(prediction, interval=poll_intervals[job.stage],
+                                         timeout=prediction_timeout, on_processing=on_processing,
+                                         hedge_after=generation_backends.router.hedge_delay(primary.id, job.stage),
+                                         start_hedge=lambda: _start_hedge(job, primary))
+        if prediction is not primary:
+            generation_backends.router.observe(primary.id, job.stage, time.monotonic() - started, False)
+            generation_backends.hedged_requests.inc(stage=job.stage.value.lower(), outcome='won')
+            job.prediction_id = prediction.id
+        _observe_prediction(job.stage, {'id': prediction.id, 'status': prediction.status,
+                                        'created_at': prediction.created_at, 'started_at': prediction.started_at,
+                                        'completed_at': prediction.completed_at})
+        if prediction.status != "succeeded":
+            raise Exception(f"Prediction {prediction.id} {prediction.status}: {prediction.error}")
+
+        _check_lease(job, lease_lost)
+        _record_output(job, prediction.output)
+        db.session.commit()
+
+    _check_lease(job, lease_lost)
+    _mix(job, notify, lease_lost)
+    return True
+
+
+def handle_prediction(job_id: int, payload: Dict, notify: Callable[[Arrangement], None]) -> bool:
+    try:
+        job = job_service.lock_job(job_id)
+        if job is None or job.status != JobStatus.WAITING or job.prediction_id != payload.get('id'):
+            db.session.rollback()
+            return False
+
+        status = payload.get('status')
+        if status not in TERMINAL_STATUSES:
+            db.session.rollback()
+            if job.stage == JobStage.GENERATE:
+                _mark_processing(job.arrangement_id, notify)
+            return True
+
+        _observe_prediction(job.stage, payload)
+        if status == "succeeded":
+            _record_output(job, payload.get('output'))
+            if job.stage == JobStage.MIX:
+                job.prediction_id = None
+                job_service.release_job(job, JobStatus.QUEUED)
+            else:
+                _park_stage(job)
+            db.session.commit()
+            _track(job)
+            return True
+
+        retried = job_service.retry_or_fail(job, f"Prediction {status}: {payload.get('error')}")
+        db.session.commit()
+        if not retried:
+            _notify(job.arrangement_id, notify)
+        return True
+    except Exception as e:
+        logger.error(f"Error handling prediction update for job {job_id}: {e}")
+        db.session.rollback()
+        raise
+
+
+def reconcile(notify: Callable[[Arrangement], None]) -> None:
+    for job in job_service.get_waiting_jobs(reconcile_idle_seconds):
+        try:
+            prediction = MusicGenerator.get_prediction(job.prediction_id)
+            payload = {'id': prediction.id, 'status': prediction.status,
+                       'output': prediction.output, 'error': prediction.error,
+                       'created_at': prediction.created_at, 'started_at': prediction.started_at,
+                       'completed_at': prediction.completed_at}
+
+            waited = (datetime.datetime.utcnow() - job.updated_at).total_seconds()
+            if prediction.status not in TERMINAL_STATUSES and waited > prediction_timeout:
+                MusicGenerator.cancel_prediction(prediction.id)
+                payload.update(status="canceled", error=f"Timed out after {int(waited)} seconds")
+
+            handle_prediction(job.id, payload, notify)
+        except Exception as e:
+            logger.error(f"Error reconciling job {job.id}: {e}")
+
+
+def _start_stage(job: GenerationJob, webhook: str = None):
+    prediction = _start_prediction(job, webhook)
+    job.prediction_id = prediction.id
+    return prediction
+
+
+def _start_prediction(job: GenerationJob, webhook: str = None, exclude=()):
+    if job.stage == JobStage.GENERATE:
+        return MusicGenerator.start_generation(job.bpm, job.tags, webhook, exclude)
+    return MusicGenerator.start_separation(job.music_url, webhook, exclude)
+
+
+def _start_hedge(job: GenerationJob, primary):
+    backend = generation_backends.router.backend_name(primary.id)
+    try:
+        prediction = _start_prediction(job, exclude=[backend])
+    except Exception as e:
+        logger.error(f"Error hedging prediction {primary.id} of job {job.id}: {e}")
+        return None
+
+    logger.info(f"Job {job.id} hedges slow prediction {primary.id} with {prediction.id}.")
+    generation_backends.hedged_requests.inc(stage=job.stage.value.lower(), outcome='started')
+    return prediction
+
+
+def _resume_stage(job: GenerationJob):
+    if not job.prediction_id:
+        return None
+
+    try:
+        prediction = MusicGenerator.get_prediction(job.prediction_id)
+    except Exception as e:
+        logger.error(f"Error fetching prediction {job.prediction_id} of job {job.id}: {e}")
+        return None
+
+    if prediction.status in ("failed", "canceled"):
+        return None
+    logger.info(f"Job {job.id} resumes prediction {prediction.id} ({prediction.status}).")
+    return prediction
+
+
+def _park_stage(job: GenerationJob, prediction=None) -> None:
+    if prediction is None:
+        webhook = f"{host_url}/api/replicate/webhook/{job.id}" if generation_mode == 'webhook' else None
+        _start_stage(job, webhook)
+    job_service.release_job(job, JobStatus.WAITING)
+
+
+def _track(job: GenerationJob) -> None:
+    if tracker is not None and job.status == JobStatus.WAITING:
+        tracker.track(job.id, job.prediction_id)
+
+
+def _record_output(job: GenerationJob, output) -> None:
+    if job.stage == JobStage.GENERATE:
+        job.music_url = MusicGenerator.generation_output(output)
+        job.music_prediction_id = job.prediction_id
+        job.stage = JobStage.SEPARATE
+    elif job.stage == JobStage.SEPARATE:
+        job.stem_url = MusicGenerator.separation_output(output)
+        job.stem_prediction_id = job.prediction_id
+        job.stage = JobStage.MIX
+    job.prediction_id = None
+
+
+def _check_lease(job: GenerationJob, lease_lost: Optional[threading.Event]) -> None:
+    if lease_lost is not None and lease_lost.is_set():
+        raise job_service.LeaseLostError(f"Lost the lease on job {job.id}")
+
+
+def _mix(job: GenerationJob, notify: Callable[[Arrangement], None],
+         lease_lost: Optional[threading.Event] = None) -> None:
+    with metrics.stage_seconds.time(stage='fetch_drums'):
+        drums_bytes = s3_storage.get(job.drums_file_name)
+    if not drums_bytes:
+        raise Exception(f"Drums file {job.drums_file_name} not found")
+
+    with metrics.stage_seconds.time(stage='fetch_stem'):
+        music_bytes = _fetch_stem(job, lease_lost)
+    with metrics.stage_seconds.time(stage='mix'):
+        mixed = MusicGenerator.mix(drums_bytes, music_bytes, job.bpm)
+    with metrics.stage_seconds.time(stage='render'):
+        renditions = rendition_service.render(mixed)
+    with metrics.stage_seconds.time(stage='peaks'):
+        waveform = audio_mixer.waveform(mixed)
+
+    _check_lease(job, lease_lost)
+    file_name = uuid.uuid4().hex
+    with metrics.stage_seconds.time(stage='upload'):
+        s3_storage.upload(mixed, file_name)
+        for audio_format, data in renditions.items():
+            rendition = rendition_service.formats[audio_format]
+            s3_storage.upload(data, storage_keys.rendition_name(file_name, rendition.extension), rendition.mimetype)
+        s3_storage.upload(json.dumps(waveform, separators=(',', ':')).encode(), storage_keys.peaks_name(file_name),
+                          'application/json')
+
+    try:
+        _check_lease(job, lease_lost)
+    except job_service.LeaseLostError:
+        storage_deletion_service.enqueue([file_name], artifacts=True)
+        raise
+    with metrics.stage_seconds.time(stage='status_update'):
+        arrangement = arrangement_service.transition_status(
+            job.arrangement_id, [ArrangementStatus.PENDING, ArrangementStatus.PROCESSING],
+            ArrangementStatus.COMPLETED, file_name, audio_mixer.coarse_peaks(waveform))
+    if arrangement is None:
+        storage_deletion_service.enqueue([file_name], artifacts=True)
+        return
+    notify(arrangement)
+
+
+def _fetch_stem(job: GenerationJob, lease_lost: Optional[threading.Event] = None) -> bytes:
+    if job.stem_file_name:
+        music_bytes = s3_storage.get(job.stem_file_name)
+        if music_bytes:
+            return music_bytes
+        logger.error(f"Stem {job.stem_file_name} of job {job.id} is missing, downloading it again")
+
+    music_bytes = MusicGenerator.get_audio(job.stem_url)
+    _check_lease(job, lease_lost)
+    stem_file_name = f"stem_{uuid.uuid4().hex}"
+    try:
+        s3_storage.upload(music_bytes, stem_file_name, 'audio/wav')
+        job.stem_file_name = stem_file_name
+        db.session.commit()
+    except Exception as e:
+        logger.error(f"Error storing stem of job {job.id}: {e}")
+        db.session.rollback()
+    return music_bytes
+
+
+def _mark_processing(arrangement_id: int, notify: Callable[[Arrangement], None]) -> None:
+    with metrics.stage_seconds.time(stage='status_update'):
+        arrangement = arrangement_service.transition_status(
+            arrangement_id, [ArrangementStatus.PENDING], ArrangementStatus.PROCESSING)
+    if arrangement is not None:
+        notify(arrangement)
+
+
+def _notify(arrangement_id: int, notify: Callable[[Arrangement], None]) -> None:
+    arrangement = arrangement_service.get_arrangement(arrangement_id)
+    if arrangement:
+        notify(arrangement)
+
+
+def _observe_prediction(stage: JobStage, payload: Dict) -> None:
+    try:
+        created, started, completed = (datetime.datetime.fromisoformat(payload[key]) if payload.get(key) else None
+                                       for key in ('created_at', 'started_at', 'completed_at'))
+    except (TypeError, ValueError):
+        return
+
+    name = stage.value.lower()
+    outcome = 'success' if payload.get('status') == 'succeeded' else 'error'
+    if payload.get('id') and created and completed:
+        generation_backends.router.observe(payload['id'], stage, (completed - created).total_seconds(),
+                                           outcome == 'success')
+    if created and started:
+        metrics.stage_seconds.observe((started - created).total_seconds(), stage=f'{name}_queued', outcome=outcome)
+    if started and completed:
+        metrics.stage_seconds.observe((completed - started).total_seconds(), stage=f'{name}_running', outcome=outcome)
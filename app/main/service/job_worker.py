@@ -0,0 +1,126 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+from app.main import app, db
+from app.main.model.arrangements import Arrangement
+from app.main.model.job_stage import JobStage
+from app.main.service import generation_service
+from app.main.service.database import arrangement_service, job_service
+from app.main.util import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('job_worker')
+
+lease_seconds = int(os.getenv('JOB_LEASE_SECONDS', 60))
+poll_interval = float(os.getenv('JOB_POLL_INTERVAL', 2))
+recovery_interval = float(os.getenv('JOB_RECOVERY_INTERVAL', 60))
+reconcile_interval = float(os.getenv('JOB_RECONCILE_INTERVAL', 120))
+max_outstanding_predictions = int(os.getenv('MAX_OUTSTANDING_PREDICTIONS', 500))
+
+
+def _job_counts():
+    with app.app_context():
+        return {(status.value,): count for status, count in job_service.count_active_jobs().items()}
+
+
+metrics.Gauge('harmonia_generation_jobs', 'Generation jobs that are queued, running or waiting', ('status',),
+              function=_job_counts, cache_seconds=metrics.gauge_cache_seconds)
+
+
+class JobWorker:
+    def __init__(self, status_update_handler: Optional[Callable[[Arrangement], None]] = None, worker_id: str = None):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._status_update_handler = status_update_handler
+        self._last_recovery = None
+        self._last_reconcile = None
+
+    def run_forever(self, stop_event: threading.Event) -> None:
+        logger.info(f"Worker {self.worker_id} started.")
+        while not stop_event.is_set():
+            try:
+                with app.app_context():
+                    self._recover_if_due()
+                    self._reconcile_if_due()
+                    processed = self.run_once()
+            except Exception as e:
+                logger.error(f"Worker {self.worker_id} error: {e}")
+                processed = False
+
+            if not processed:
+                stop_event.wait(poll_interval)
+        logger.info(f"Worker {self.worker_id} stopped.")
+
+    def run_once(self) -> bool:
+        tracker = generation_service.tracker
+        stages = [JobStage.MIX] if tracker and tracker.outstanding() >= max_outstanding_predictions else None
+        job = job_service.claim_job(self.worker_id, lease_seconds, stages)
+        if job is None:
+            return False
+
+        logger.info(f"Worker {self.worker_id} claimed job {job.id} (attempt {job.attempts}).")
+        stop_heartbeat = threading.Event()
+        lease_lost = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job.id, stop_heartbeat, lease_lost), daemon=True)
+        heartbeat.start()
+        try:
+            if generation_service.run_job(job, self._status_changed, lease_lost) \
+                    and not job_service.complete_job(job.id, self.worker_id):
+                logger.error(f"Worker {self.worker_id} finished job {job.id} without holding its lease.")
+        except job_service.LeaseLostError as e:
+            logger.error(f"Worker {self.worker_id} stopped job {job.id}: {e}")
+            db.session.rollback()
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {e}")
+            db.session.rollback()
+            job_service.fail_job(job.id, self.worker_id, str(e))
+            self._notify(job.arrangement_id)
+        finally:
+            stop_heartbeat.set()
+            heartbeat.join()
+        return True
+
+    def _heartbeat(self, job_id: int, stop_event: threading.Event, lease_lost: threading.Event) -> None:
+        while not stop_event.wait(lease_seconds / 3):
+            with app.app_context():
+                if not job_service.heartbeat(job_id, self.worker_id, lease_seconds):
+                    logger.error(f"Worker {self.worker_id} lost the lease on job {job_id}.")
+                    lease_lost.set()
+                    return
+
+    def _recover_if_due(self) -> None:
+        if self._last_recovery is not None and time.monotonic() - self._last_recovery < recovery_interval:
+            return
+        self._last_recovery = time.monotonic()
+        for arrangement_id in job_service.recover_stale_jobs():
+            self._notify(arrangement_id)
+
+    def _reconcile_if_due(self) -> None:
+        if generation_service.generation_mode not in ('webhook', 'async'):
+            return
+        if self._last_reconcile is not None and time.monotonic() - self._last_reconcile < reconcile_interval:
+            return
+        self._last_reconcile = time.monotonic()
+        generation_service.reconcile(self._status_changed)
+
+    def _notify(self, arrangement_id: int) -> None:
+        arrangement = arrangement_service.get_arrangement(arrangement_id)
+        if arrangement:
+            self._status_changed(arrangement)
+
+    def _status_changed(self, arrangement: Arrangement) -> None:
+        if callable(self._status_update_handler):
+            self._status_update_handler(arrangement)
+
+
+def start_workers(count: int, status_update_handler: Optional[Callable[[Arrangement], None]] = None) -> threading.Event:
+    stop_event = threading.Event()
+    if count > 0 and generation_service.generation_mode == 'async':
+        generation_service.start_tracker(status_update_handler)
+    for _ in range(count):
+        worker = JobWorker(status_update_handler)
+        threading.Thread(target=worker.run_forever, args=(stop_event,), daemon=True).start()
+    return stop_event
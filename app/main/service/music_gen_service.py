@@ -1,55 +1,48 @@
 import logging
+import os
 import time
 from math import ceil
-from typing import Tuple
+from typing import Callable, Iterable, Optional
 from pydub import AudioSegment, effects
 import io
-import replicate
 import requests
-from app.main.model.arrangement_status import ArrangementStatus
+from app.main.service import audio_mixer, generation_backends
+from app.main.service.generation_backends import TERMINAL_STATUSES
+from app.main.util import metrics
 
 logger = logging.getLogger("music_generator")
 
+mixing_engine = os.getenv('MIXING_ENGINE', 'numpy')
 
-class MusicGenerator:
-    def __init__(self, status_update_handler):
-        self._status_update_handler = status_update_handler
-        self._status = ArrangementStatus.PENDING
-
-    def _handle_update(self, status: ArrangementStatus):
-        if callable(self._status_update_handler):
-            self._status_update_handler(status)
-
-    def create(self, drums_bytes: bytes, bpm: float, tags: str) -> Tuple[bytes, int]:
-        with open("test_drums.wav", "wb") as f:
-            f.write(drums_bytes)
-        try:
-            music_url = self.__generate_music(bpm, tags)
-            plain_music_url = self.__remove_drums(music_url)
-            plain_music_bytes = self.__get_audio(plain_music_url)
 
-            drums = AudioSegment.from_file(io.BytesIO(drums_bytes), format="wav")
-            music = AudioSegment.from_file(io.BytesIO(plain_music_bytes), format="wav")
+class MusicGenerator:
+    @staticmethod
+    def mix(drums_bytes: bytes, music_bytes: bytes, bpm: float) -> bytes:
+        if mixing_engine == 'pydub':
+            return MusicGenerator.mix_pydub(drums_bytes, music_bytes, bpm)
+        return audio_mixer.mix(drums_bytes, music_bytes, bpm)
 
-            music = music.set_frame_rate(drums.frame_rate)
-            music = music.set_channels(drums.channels)
-            music = music.set_sample_width(drums.sample_width)
+    @staticmethod
+    def mix_pydub(drums_bytes: bytes, music_bytes: bytes, bpm: float) -> bytes:
+        drums = AudioSegment.from_file(io.BytesIO(drums_bytes), format="wav")
+        music = AudioSegment.from_file(io.BytesIO(music_bytes), format="wav")
 
-            bar_duration_ms = (60 / bpm) * 4 * 1000
+        music = music.set_frame_rate(drums.frame_rate)
+        music = music.set_channels(drums.channels)
+        music = music.set_sample_width(drums.sample_width)
 
-            target_duration_ms = 30 * 1000
+        bar_duration_ms = (60 / bpm) * 4 * 1000
 
-            drums = effects.normalize(self.__process_drums_duration(drums, target_duration_ms))
-            processed_music = effects.normalize(self.__process_melody_duration(music, drums, bar_duration_ms))
+        target_duration_ms = 30 * 1000
 
-            mixed = effects.normalize(drums.overlay(processed_music))
+        drums = effects.normalize(MusicGenerator.__process_drums_duration(drums, target_duration_ms))
+        processed_music = effects.normalize(MusicGenerator.__process_melody_duration(music, drums, bar_duration_ms))
 
-            buffer = io.BytesIO()
-            mixed.export(buffer, format="wav")
-            return buffer.getvalue(), 200
+        mixed = effects.normalize(drums.overlay(processed_music))
 
-        except Exception:
-            return bytes(), 500
+        buffer = io.BytesIO()
+        mixed.export(buffer, format="wav")
+        return buffer.getvalue()
 
     @staticmethod
     def __process_drums_duration(drums: AudioSegment, target_duration: int) -> AudioSegment:
@@ -74,97 +67,92 @@ class MusicGenerator:
 
         return processed
 
-    def __generate_music(self, bpm: float, tags: str) -> str:
-        try:
-            prediction = replicate.predictions.create(
-                version="f8140d0457c2b39ad8728a80736fea9a67a0ec0cd37b35f40b68cce507db2366",
-                input={
-                    "bpm": bpm,
-                    "seed": -1,
-                    "top_k": 250,
-                    "top_p": 0,
-                    "prompt": tags,
-                    "variations": 1,
-                    "temperature": 1,
-                    "max_duration": ceil(60 / bpm * 4 * 4) + 2,
-                    "model_version": "medium",
-                    "output_format": "wav",
-                    "classifier_free_guidance": 3
-                }
-            )
-
-            time.sleep(2)
-
-            start_time = time.time()
-            while prediction.status not in ["succeeded", "failed", "canceled"]:
-                if time.time() - start_time > 300:
-                    raise TimeoutError("Generation timed out after 5 minutes")
-
-                if self._status == ArrangementStatus.PENDING and prediction.status == "processing":
-                    self._status = ArrangementStatus.PROCESSING
-                    self._handle_update(ArrangementStatus.PROCESSING)
-
-                time.sleep(10)
-                prediction.reload()
-
-            if prediction.status == "succeeded":
-                audio_url = prediction.output['variation_01']
-                return audio_url
-            elif prediction.status in ("failed", "canceled"):
-                self._handle_update(ArrangementStatus.FAILED)
-            else:
-                raise Exception(f"Generation failed: {prediction.error}")
+    @staticmethod
+    def start_generation(bpm: float, tags: str, webhook: Optional[str] = None, exclude: Iterable[str] = ()):
+        return generation_backends.router.start_generation(bpm, tags, webhook, exclude)
 
-        except Exception as e:
-            logging.info(str(e))
+    @staticmethod
+    def start_separation(url: str, webhook: Optional[str] = None, exclude: Iterable[str] = ()):
+        return generation_backends.router.start_separation(url, webhook, exclude)
 
-    def __remove_drums(self, url: str) -> str:
-        try:
-            prediction = replicate.predictions.create(
-                version="5a7041cc9b82e5a558fea6b3d7b12dea89625e89da33f0447bd727c2d0ab9e77",
-                input={
-                    "jobs": 0,
-                    "stem": "other",
-                    "audio": url,
-                    "model": "htdemucs",
-                    "split": True,
-                    "shifts": 1,
-                    "overlap": 0.25,
-                    "clip_mode": "rescale",
-                    "mp3_preset": 2,
-                    "wav_format": "int24",
-                    "mp3_bitrate": 320,
-                    "output_format": "wav"
-                }
-            )
-            start_time = time.time()
-            while prediction.status not in ["succeeded", "failed", "canceled"]:
-                if time.time() - start_time > 300:
-                    raise TimeoutError("Generation timed out after 5 minutes")
+    @staticmethod
+    def generation_output(output) -> str:
+        return output['variation_01']
 
-                time.sleep(5)
-                prediction.reload()
+    @staticmethod
+    def separation_output(output) -> str:
+        return output['other']
 
-            if prediction.status == "succeeded":
-                audio_url = prediction.output["other"]
-                return audio_url
-            elif prediction.status in ("failed", "canceled"):
-                self._handle_update(ArrangementStatus.FAILED)
-            else:
-                raise Exception(f"Generation failed: {prediction.error}")
+    @staticmethod
+    def get_prediction(prediction_id: str):
+        return generation_backends.router.get_prediction(prediction_id)
 
+    @staticmethod
+    def cancel_prediction(prediction_id: str) -> None:
+        try:
+            generation_backends.router.cancel_prediction(prediction_id)
         except Exception as e:
-            logger.error(str(e))
+            logger.error(f"Error canceling prediction {prediction_id}: {e}")
 
     @staticmethod
-    def __get_audio(url: str) -> bytes:
+    def wait(prediction, interval: float, timeout: float = 300,
+             on_processing: Optional[Callable[[], None]] = None,
+             hedge_after: Optional[float] = None, start_hedge: Optional[Callable[[], object]] = None):
+        predictions = [prediction]
+        start_time = time.time()
+        while True:
+            finished = [p for p in predictions if p.status in TERMINAL_STATUSES]
+            winner = next((p for p in finished if p.status == "succeeded"), None)
+            if winner is not None or len(finished) == len(predictions):
+                break
+
+            elapsed = time.time() - start_time
+            if elapsed > timeout:
+                for p in predictions:
+                    if p.status not in TERMINAL_STATUSES:
+                        MusicGenerator.cancel_prediction(p.id)
+                raise TimeoutError(f"Generation timed out after {int(timeout)} seconds")
+
+            if callable(on_processing) and any(p.status == "processing" for p in predictions):
+                on_processing()
+                on_processing = None
+
+            if callable(start_hedge) and hedge_after is not None and elapsed > hedge_after:
+                hedge = start_hedge()
+                start_hedge = None
+                if hedge is not None:
+                    predictions.append(hedge)
+                    continue
+
+            time.sleep(interval)
+            for p in predictions:
+                if p.status not in TERMINAL_STATUSES:
+                    with metrics.external_call_seconds.time(
+                            service=generation_backends.router.backend_name(p.id), operation='get_prediction'):
+                        p.reload()
+
+        for p in predictions:
+            if p is not winner and p.status not in TERMINAL_STATUSES:
+                MusicGenerator.cancel_prediction(p.id)
+        return winner or predictions[0]
+
+    @staticmethod
+    def get_audio(url: str) -> bytes:
+        if url.startswith(generation_backends.LOCAL_SCHEME):
+            data = generation_backends.fetch_local(url)
+            if data is None:
+                raise Exception(f"Local output {url} not found")
+            return data
+
         for attempt in range(3):
             try:
-                response = requests.get(url, timeout=30)
-                response.raise_for_status()
+                with metrics.external_call_seconds.time(service='replicate', operation='get_audio'):
+                    response = requests.get(url, timeout=30)
+                    response.raise_for_status()
                 return response.content
             except requests.exceptions.RequestException as e:
                 logger.error(f"Download attempt {attempt + 1} failed: {str(e)}")
+                metrics.external_call_retries.inc(service='replicate', operation='get_audio')
                 time.sleep(5)
 
         raise Exception("Failed to download after 3 attempts")
@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import select
+import threading
+import time
+from typing import Callable, Dict, Optional
+from sqlalchemy.engine import make_url
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('notification_bus')
+
+bus_backend = os.getenv('NOTIFICATION_BUS')
+bus_channel = os.getenv('NOTIFICATION_CHANNEL', 'harmonia_events')
+
+MAX_PAYLOAD_BYTES = 7900
+RECONNECT_DELAY = 5
+
+Handler = Callable[[int, Dict], None]
+
+
+class LocalBus:
+    """Delivers events to the handler of the current process only."""
+
+    def __init__(self):
+        self._handler: Optional[Handler] = None
+
+    def listen(self, handler: Handler) -> None:
+        self._handler = handler
+
+    def publish(self, user_id: int, payload: Dict) -> None:
+        if self._handler is not None:
+            self._handler(user_id, payload)
+
+
+class PostgresBus(LocalBus):
+    """Fans events out to every process through Postgres LISTEN/NOTIFY.
+
+    Only processes that call ``listen`` open a listening connection, so
+    standalone workers just publish. Events that are too large for NOTIFY, or
+    that cannot be published, fall back to local delivery.
+    """
+
+    def __init__(self, dsn: str, channel: str):
+        super().__init__()
+        self._dsn = dsn
+        self._channel = channel
+        self._connection = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def listen(self, handler: Handler) -> None:
+        super().listen(handler)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen_forever, name='notification-bus', daemon=True)
+                self._thread.start()
+
+    def publish(self, user_id: int, payload: Dict) -> None:
+        message = json.dumps({'user_id': user_id, 'payload': payload})
+        if len(message.encode()) > MAX_PAYLOAD_BYTES:
+            logger.warning(f"Event for user {user_id} is too large to publish, delivering locally")
+            super().publish(user_id, payload)
+            return
+
+        try:
+            with self._lock:
+                if self._connection is None or self._connection.closed:
+                    self._connection = self._connect()
+                with self._connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_notify(%s, %s)", (self._channel, message))
+        except Exception as e:
+            logger.error(f"Error publishing event, delivering locally: {e}")
+            self._connection = None
+            super().publish(user_id, payload)
+
+    def _connect(self):
+        import psycopg2
+        connection = psycopg2.connect(self._dsn)
+        connection.autocommit = True
+        return connection
+
+    def _listen_forever(self) -> None:
+        while True:
+            connection = None
+            try:
+                connection = self._connect()
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self._channel}"')
+                logger.info(f"Listening for events on {self._channel}")
+
+                while True:
+                    if select.select([connection], [], [], RECONNECT_DELAY) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        self._deliver(connection.notifies.pop(0).payload)
+            except Exception as e:
+                logger.error(f"Event listener error, reconnecting: {e}")
+                if connection is not None:
+                    connection.close()
+                time.sleep(RECONNECT_DELAY)
+
+    def _deliver(self, message: str) -> None:
+        try:
+            event = json.loads(message)
+            if self._handler is not None:
+                self._handler(event['user_id'], event['payload'])
+        except Exception as e:
+            logger.error(f"Error delivering event: {e}")
+
+
+def create_bus() -> LocalBus:
+    database_uri = os.getenv('SQLALCHEMY_DATABASE_URI') or ''
+    backend = bus_backend or ('postgres' if database_uri.startswith('postgres') else 'local')
+    if backend != 'postgres':
+        return LocalBus()
+
+    dsn = make_url(database_uri).set(drivername='postgresql').render_as_string(hide_password=False)
+    return PostgresBus(dsn, bus_channel)
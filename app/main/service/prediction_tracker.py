@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import os
+import threading
+from typing import Callable, Dict
+from app.main.service.generation_backends import TERMINAL_STATUSES, router
+from app.main.util.counting_executor import CountingExecutor
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('prediction_tracker')
+
+max_concurrent_polls = int(os.getenv('TRACKER_MAX_CONCURRENT_POLLS', 20))
+min_poll_interval = float(os.getenv('TRACKER_MIN_POLL_INTERVAL', 2))
+max_poll_interval = float(os.getenv('TRACKER_MAX_POLL_INTERVAL', 20))
+backoff_factor = float(os.getenv('TRACKER_BACKOFF_FACTOR', 1.5))
+callback_workers = int(os.getenv('TRACKER_CALLBACK_WORKERS', 4))
+
+
+class _TrackedPrediction:
+    def __init__(self, job_id: int, prediction_id: str, due: float):
+        self.job_id = job_id
+        self.prediction_id = prediction_id
+        self.status = None
+        self.interval = min_poll_interval
+        self.due = due
+
+
+class PredictionTracker:
+    """Polls every outstanding prediction from a single asyncio loop.
+
+    Each prediction is polled with its own backoff, which resets whenever its
+    status changes. Status changes are handed to ``on_update(job_id, payload)``
+    on a small thread pool, so slow callbacks never stall polling.
+    """
+
+    def __init__(self, on_update: Callable[[int, Dict], None]):
+        self._on_update = on_update
+        self._tracked: Dict[str, _TrackedPrediction] = {}
+        self._executor = CountingExecutor(max_workers=callback_workers, thread_name_prefix='prediction-callback')
+        self._loop = asyncio.new_event_loop()
+        self._wakeup = asyncio.Event()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='prediction-tracker', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._run(), self._loop)
+
+    def track(self, job_id: int, prediction_id: str) -> None:
+        self._loop.call_soon_threadsafe(self._add, job_id, prediction_id)
+
+    def outstanding(self) -> int:
+        return len(self._tracked)
+
+    def pending_callbacks(self) -> int:
+        return self._executor.pending()
+
+    def _add(self, job_id: int, prediction_id: str) -> None:
+        if prediction_id not in self._tracked:
+            self._tracked[prediction_id] = _TrackedPrediction(job_id, prediction_id,
+                                                              self._loop.time() + min_poll_interval)
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        semaphore = asyncio.Semaphore(max_concurrent_polls)
+
+        while True:
+            now = self._loop.time()
+            due = [tracked for tracked in self._tracked.values() if tracked.due <= now]
+            if due:
+                await asyncio.gather(*(self._poll(semaphore, tracked) for tracked in due))
+
+            self._wakeup.clear()
+            next_due = min((tracked.due for tracked in self._tracked.values()), default=now + max_poll_interval)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, next_due - self._loop.time()))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, semaphore: asyncio.Semaphore, tracked: _TrackedPrediction) -> None:
+        try:
+            async with semaphore:
+                prediction = await router.async_get_prediction(tracked.prediction_id)
+        except Exception as e:
+            logger.error(f"Error polling prediction {tracked.prediction_id}: {e}")
+            tracked.interval = min(tracked.interval * backoff_factor, max_poll_interval)
+            tracked.due = self._loop.time() + tracked.interval
+            return
+
+        if prediction.status in TERMINAL_STATUSES:
+            self._tracked.pop(tracked.prediction_id, None)
+        elif prediction.status == tracked.status:
+            tracked.interval = min(tracked.interval * backoff_factor, max_poll_interval)
+        else:
+            tracked.interval = min_poll_interval
+
+        tracked.due = self._loop.time() + tracked.interval
+        if prediction.status != tracked.status:
+            tracked.status = prediction.status
+            payload = {'id': prediction.id, 'status': prediction.status,
+                       'output': prediction.output, 'error': prediction.error,
+                       'created_at': prediction.created_at, 'started_at': prediction.started_at,
+                       'completed_at': prediction.completed_at}
+            self._executor.submit(self._deliver, tracked.job_id, payload)
+
+    def _deliver(self, job_id: int, payload: Dict) -> None:
+        try:
+            self._on_update(job_id, payload)
+        except Exception as e:
+            logger.error(f"Error handling update of prediction {payload['id']}: {e}")
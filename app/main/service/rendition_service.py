@@ -0,0 +1,67 @@
+import logging
+import os
+import tempfile
+from typing import Dict, List
+from app.main.service.audio_to_video_service import run_ffmpeg
+
+logger = logging.getLogger('rendition_service')
+
+MASTER_FORMAT = 'wav'
+
+
+class Rendition:
+    def __init__(self, extension: str, mimetypes: List[str], codec: List[str]):
+        self.extension = extension
+        self.mimetypes = mimetypes
+        self.codec = codec
+
+    @property
+    def mimetype(self) -> str:
+        return self.mimetypes[0]
+
+
+formats = {
+    'wav': Rendition('wav', ['audio/wav', 'audio/x-wav', 'audio/wave'], []),
+    'opus': Rendition('opus', ['audio/ogg', 'audio/opus'],
+                      ['-c:a', 'libopus', '-b:a', os.getenv('OPUS_BITRATE', '96k'), '-f', 'ogg']),
+    'mp3': Rendition('mp3', ['audio/mpeg', 'audio/mp3'],
+                     ['-c:a', 'libmp3lame', '-b:a', os.getenv('MP3_BITRATE', '160k'), '-f', 'mp3']),
+    'flac': Rendition('flac', ['audio/flac', 'audio/x-flac'], ['-c:a', 'flac', '-f', 'flac']),
+}
+
+rendition_formats = [f for f in os.getenv('AUDIO_RENDITIONS', 'opus,mp3,flac').split(',')
+                     if f in formats and f != MASTER_FORMAT]
+default_format = os.getenv('DEFAULT_AUDIO_FORMAT', MASTER_FORMAT)
+
+
+def render(wav_bytes: bytes) -> Dict[str, bytes]:
+    if not rendition_formats:
+        return {}
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        outputs = []
+        for name in rendition_formats:
+            path = os.path.join(temp_dir, f'audio.{formats[name].extension}')
+            outputs += ['-map', '0:a:0', *formats[name].codec, path]
+        run_ffmpeg(['-i', 'pipe:0', *outputs], stdin=wav_bytes)
+
+        renditions = {}
+        for name in rendition_formats:
+            with open(os.path.join(temp_dir, f'audio.{formats[name].extension}'), 'rb') as f:
+                renditions[name] = f.read()
+        return renditions
+
+
+def available_formats() -> List[str]:
+    return [MASTER_FORMAT] + rendition_formats
+
+
+def negotiate(accept_mimetypes) -> str:
+    preferred = [default_format] if default_format in available_formats() else []
+    ordered = preferred + [f for f in available_formats() if f not in preferred]
+    mimetypes = [mimetype for name in ordered for mimetype in formats[name].mimetypes]
+
+    best = accept_mimetypes.best_match(mimetypes)
+    if best is None:
+        return ordered[0]
+    return next(name for name in ordered if best in formats[name].mimetypes)
@@ -1,5 +1,10 @@
 import os
 import boto3
+from botocore.exceptions import ClientError
+from werkzeug.http import http_date
+from ..util import metrics
+
+DELETE_BATCH_SIZE = 1000
 
 
 class S3Storage:
@@ -14,26 +19,122 @@ class S3Storage:
         self.__bucket_name = os.getenv("AWS_BUCKET_NAME")
         self.__root_dir = os.getenv("AWS_ROOT_DIR")
 
-    def upload(self, file, name):
-        self.s3.put_object(
-            Bucket=self.__bucket_name,
-            Key=f'{self.__root_dir}/{name}',
-            Body=file
-        )
+    def upload(self, file, name, content_type=None):
+        params = {'Bucket': self.__bucket_name, 'Key': f'{self.__root_dir}/{name}', 'Body': file}
+        if content_type:
+            params['ContentType'] = content_type
+        with _timed('put_object'):
+            self.s3.put_object(**params)
+
+    def upload_file(self, path, name):
+        with _timed('upload_file'):
+            self.s3.upload_file(path, self.__bucket_name, f'{self.__root_dir}/{name}')
 
     def get(self, name):
         try:
-            response = self.s3.get_object(
-                Bucket=self.__bucket_name,
-                Key=f'{self.__root_dir}/{name}'
-            )
-            file_bytes = response['Body'].read()
+            with _timed('get_object'):
+                response = self.s3.get_object(
+                    Bucket=self.__bucket_name,
+                    Key=f'{self.__root_dir}/{name}'
+                )
+                file_bytes = response['Body'].read()
             return file_bytes
         except Exception:
             return None
 
-    def delete(self, name):
-        return self.s3.delete_objects(
+    def stream(self, name, byte_range=None, if_none_match=None, if_modified_since=None):
+        params = {'Bucket': self.__bucket_name, 'Key': f'{self.__root_dir}/{name}'}
+        if byte_range:
+            params['Range'] = byte_range
+        if if_none_match:
+            params['IfNoneMatch'] = if_none_match
+        if if_modified_since:
+            params['IfModifiedSince'] = if_modified_since
+
+        try:
+            with _timed('get_object_stream'):
+                response = self.s3.get_object(**params)
+        except ClientError as e:
+            metadata = e.response.get('ResponseMetadata', {})
+            status = metadata.get('HTTPStatusCode')
+            if status in (304, 412, 416):
+                headers = metadata.get('HTTPHeaders', {})
+                return StoredObject(None, status, {'etag': headers.get('etag'),
+                                                   'last-modified': headers.get('last-modified')})
+            return None
+
+        return StoredObject(response['Body'], response['ResponseMetadata']['HTTPStatusCode'], {
+            'content-length': response.get('ContentLength'),
+            'content-range': response.get('ContentRange'),
+            'etag': response.get('ETag'),
+            'last-modified': http_date(response['LastModified']) if response.get('LastModified') else None
+        })
+
+    def presigned_url(self, name, expires_in, content_disposition=None):
+        params = {'Bucket': self.__bucket_name, 'Key': f'{self.__root_dir}/{name}'}
+        if content_disposition:
+            params['ResponseContentDisposition'] = content_disposition
+        return self.s3.generate_presigned_url('get_object', Params=params, ExpiresIn=expires_in)
+
+    def presigned_post(self, name, max_bytes, expires_in):
+        return self.s3.generate_presigned_post(
             Bucket=self.__bucket_name,
-            Delete={'Objects': [{'Key': f'{self.__root_dir}/{name}'}]}
+            Key=f'{self.__root_dir}/{name}',
+            Conditions=[['content-length-range', 1, max_bytes]],
+            ExpiresIn=expires_in
         )
+
+    def size(self, name):
+        try:
+            with _timed('head_object'):
+                response = self.s3.head_object(Bucket=self.__bucket_name, Key=f'{self.__root_dir}/{name}')
+            return response['ContentLength']
+        except Exception:
+            return None
+
+    def download(self, name, path):
+        try:
+            with _timed('download_file'):
+                self.s3.download_file(self.__bucket_name, f'{self.__root_dir}/{name}', path)
+            return True
+        except Exception:
+            return False
+
+    def delete(self, name):
+        return self.delete_many([name])
+
+    def delete_many(self, names):
+        failed = []
+        prefix = f'{self.__root_dir}/'
+        for start in range(0, len(names), DELETE_BATCH_SIZE):
+            with _timed('delete_objects'):
+                response = self.s3.delete_objects(
+                    Bucket=self.__bucket_name,
+                    Delete={'Objects': [{'Key': f'{prefix}{name}'} for name in names[start:start + DELETE_BATCH_SIZE]],
+                            'Quiet': True}
+                )
+            failed += [error['Key'][len(prefix):] for error in response.get('Errors', [])]
+        return failed
+
+    def list_pages(self):
+        prefix = f'{self.__root_dir}/'
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.__bucket_name, Prefix=prefix):
+            yield [(item['Key'][len(prefix):], item['LastModified']) for item in page.get('Contents', [])]
+
+
+def _timed(operation):
+    return metrics.external_call_seconds.time(service='s3', operation=operation)
+
+
+class StoredObject:
+    def __init__(self, body, status, headers):
+        self.body = body
+        self.status = status
+        self.headers = headers
+
+    def iter_chunks(self, chunk_size=64 * 1024):
+        try:
+            yield from self.body.iter_chunks(chunk_size)
+        finally:
+            self.body.close()
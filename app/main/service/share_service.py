@@ -0,0 +1,88 @@
+import logging
+import os
+import tempfile
+import threading
+from typing import Callable, Optional
+from app.main import app, s3_storage
+from app.main.model.share_job_status import ShareJobStatus
+from app.main.service import audio_to_video_service, vk_api_service
+from app.main.service.database import arrangement_service, share_job_service
+from app.main.util import converter, metrics, storage_keys
+from app.main.util.counting_executor import CountingExecutor
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('share_service')
+
+executor = CountingExecutor(max_workers=int(os.getenv('SHARE_WORKERS', 2)))
+sweep_interval = float(os.getenv('SHARE_SWEEP_INTERVAL', 60))
+
+metrics.Gauge('harmonia_share_queue_length', 'Share jobs queued or running on an executor thread',
+              function=executor.pending)
+
+
+def submit(share_job_id: int, progress_handler: Callable[[int, dict], None]) -> None:
+    executor.submit(_run, share_job_id, progress_handler)
+
+
+def start_sweeper(progress_handler: Callable[[int, dict], None],
+                  stop_event: Optional[threading.Event] = None) -> threading.Event:
+    stop_event = stop_event or threading.Event()
+    threading.Thread(target=_sweep_forever, args=(progress_handler, stop_event), daemon=True).start()
+    return stop_event
+
+
+def sweep(progress_handler: Callable[[int, dict], None]) -> None:
+    with app.app_context():
+        for share_job in share_job_service.fail_stale_share_jobs():
+            logger.info(f"Share job {share_job.id} timed out.")
+            progress_handler(share_job.user_id, converter.share_job_to_dict(share_job))
+
+
+def _sweep_forever(progress_handler: Callable[[int, dict], None], stop_event: threading.Event) -> None:
+    while not stop_event.wait(sweep_interval):
+        try:
+            sweep(progress_handler)
+        except Exception as e:
+            logger.error(f"Share job sweep error: {e}")
+
+
+def _run(share_job_id: int, progress_handler: Callable[[int, dict], None]) -> None:
+    with app.app_context():
+        share_job = share_job_service.start_share_job(share_job_id)
+        if share_job is None:
+            return
+
+        def update(status: ShareJobStatus, **kwargs):
+            share_job_service.update_share_job(share_job, status, **kwargs)
+            progress_handler(share_job.user_id, converter.share_job_to_dict(share_job))
+
+        progress_handler(share_job.user_id, converter.share_job_to_dict(share_job))
+        try:
+            arrangement = arrangement_service.get_arrangement(share_job.arrangement_id)
+            if arrangement is None or not arrangement.file_name:
+                raise Exception("Arrangement file not found")
+
+            with tempfile.TemporaryDirectory() as temp_dir:
+                video_path = os.path.join(temp_dir, 'video.mp4')
+                _prepare_video(arrangement.file_name, video_path)
+
+                update(ShareJobStatus.UPLOADING)
+                response = vk_api_service.upload_video(share_job.upload_url, video_path)
+
+            update(ShareJobStatus.COMPLETED, response=response.json(), response_code=response.status_code)
+        except Exception as e:
+            logger.error(f"Share job {share_job_id} failed: {e}")
+            update(ShareJobStatus.FAILED, error=str(e))
+
+
+def _prepare_video(file_name: str, video_path: str) -> None:
+    video_name = storage_keys.video_name(file_name)
+    if s3_storage.download(video_name, video_path):
+        return
+
+    audio_bytes = s3_storage.get(file_name)
+    if not audio_bytes:
+        raise Exception("Arrangement audio not found")
+
+    audio_to_video_service.render_video(audio_bytes, video_path)
+    s3_storage.upload_file(video_path, video_name)
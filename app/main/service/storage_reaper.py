@@ -0,0 +1,105 @@
+import datetime
+import logging
+import os
+import random
+import threading
+import time
+from typing import Optional
+from app.main import app, db, s3_storage
+from app.main.service.database import storage_deletion_service
+from app.main.util import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('storage_reaper')
+
+reaper_enabled = os.getenv('STORAGE_REAPER', 'true').lower() in ('1', 'true', 'yes')
+reaper_interval = float(os.getenv('STORAGE_REAPER_INTERVAL', 5))
+reaper_batch_size = int(os.getenv('STORAGE_REAPER_BATCH_SIZE', 500))
+sweep_interval = float(os.getenv('STORAGE_SWEEP_INTERVAL', 24 * 3600))
+sweep_grace = float(os.getenv('STORAGE_SWEEP_GRACE', 24 * 3600))
+
+
+def _pending_deletions():
+    with app.app_context():
+        return storage_deletion_service.count_pending()
+
+
+metrics.Gauge('harmonia_storage_deletions_pending', 'Storage objects queued for deletion',
+              function=_pending_deletions, cache_seconds=metrics.gauge_cache_seconds)
+
+
+class StorageReaper:
+    """Deletes queued storage objects in batches and periodically sweeps orphans.
+
+    Rows land in the outbox from database triggers when arrangements or
+    generation jobs stop referencing a file, so no request waits on storage
+    and a failed delete is retried with backoff instead of being lost.
+    """
+
+    def __init__(self):
+        self._last_sweep = time.monotonic() - random.uniform(0, sweep_interval) if sweep_interval > 0 else None
+
+    def run_forever(self, stop_event: threading.Event) -> None:
+        logger.info("Storage reaper started.")
+        while not stop_event.is_set():
+            try:
+                with app.app_context():
+                    self._sweep_if_due()
+                    processed = self.run_once()
+            except Exception as e:
+                logger.error(f"Storage reaper error: {e}")
+                processed = 0
+
+            if processed < reaper_batch_size:
+                stop_event.wait(reaper_interval)
+        logger.info("Storage reaper stopped.")
+
+    def run_once(self) -> int:
+        deletions = storage_deletion_service.claim_due(reaper_batch_size)
+        if not deletions:
+            db.session.rollback()
+            return 0
+
+        names = [name for deletion in deletions for name in storage_deletion_service.object_names(deletion)]
+        error = None
+        try:
+            failed = set(s3_storage.delete_many(names))
+            if failed:
+                error = "Delete rejected by storage"
+        except Exception as e:
+            failed = set(names)
+            error = str(e)
+
+        if failed:
+            logger.error(f"Error deleting {len(failed)} storage objects: {error}")
+        storage_deletion_service.finish(deletions, failed, error)
+        return len(deletions)
+
+    def sweep(self) -> int:
+        with storage_deletion_service.sweep_lock() as acquired:
+            if not acquired:
+                return 0
+
+            cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=sweep_grace)
+            orphans = 0
+            for page in s3_storage.list_pages():
+                names = [name for name, modified in page if modified < cutoff]
+                found = storage_deletion_service.find_orphans(names)
+                if found and storage_deletion_service.enqueue(found):
+                    orphans += len(found)
+
+            logger.info(f"Storage sweep queued {orphans} orphaned objects.")
+            return orphans
+
+    def _sweep_if_due(self) -> None:
+        if self._last_sweep is None or time.monotonic() - self._last_sweep < sweep_interval:
+            return
+        self._last_sweep = time.monotonic()
+        self.sweep()
+
+
+def start_reaper(stop_event: Optional[threading.Event] = None) -> threading.Event:
+    stop_event = stop_event or threading.Event()
+    if reaper_enabled:
+        threading.Thread(target=StorageReaper().run_forever, args=(stop_event,), daemon=True).start()
+    return stop_event
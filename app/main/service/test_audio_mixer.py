@@ -0,0 +1,95 @@
+import io
+import struct
+import wave
+import numpy as np
+import pytest
+from app.main.service import audio_mixer
+from app.main.service.audio_mixer import Audio
+
+
+def tone(seconds=1.0, frame_rate=8000, channels=2, frequency=440, amplitude=0.5):
+    t = np.arange(int(seconds * frame_rate)) / frame_rate
+    samples = (np.sin(2 * np.pi * frequency * t) * amplitude).astype(np.float32)
+    return np.repeat(samples[:, None], channels, axis=1)
+
+
+def float_wav(samples, frame_rate):
+    data = samples.astype('<f4').tobytes()
+    fmt = struct.pack('<HHIIHH', audio_mixer.FLOAT_FORMAT, samples.shape[1], frame_rate,
+                      frame_rate * samples.shape[1] * 4, samples.shape[1] * 4, 32)
+    chunks = b'fmt ' + struct.pack('<I', len(fmt)) + fmt + b'data' + struct.pack('<I', len(data)) + data
+    return b'RIFF' + struct.pack('<I', 4 + len(chunks)) + b'WAVE' + chunks
+
+
+@pytest.mark.parametrize('width', [1, 2, 3, 4])
+def test_encode_decode_round_trip(width):
+    samples = tone()
+    audio = audio_mixer.decode(audio_mixer.encode(Audio(samples, 8000, width)))
+
+    assert (audio.frame_rate, audio.sample_width, audio.channels) == (8000, width, 2)
+    assert audio.samples.shape == samples.shape
+    assert np.abs(audio.samples - samples).max() < 2 / 2 ** (8 * width - 1)
+
+
+def test_encode_matches_wave_module():
+    data = audio_mixer.encode(Audio(tone(channels=1), 8000, 2))
+    with wave.open(io.BytesIO(data)) as wav:
+        assert (wav.getnchannels(), wav.getsampwidth(), wav.getframerate(), wav.getnframes()) == (1, 2, 8000, 8000)
+
+
+def test_decodes_float_wav():
+    samples = tone(frame_rate=16000)
+    audio = audio_mixer.decode(float_wav(samples, 16000))
+
+    assert audio.frame_rate == 16000
+    np.testing.assert_array_equal(audio.samples, samples)
+
+
+def test_rejects_non_wav_data():
+    with pytest.raises(ValueError, match='Not a WAV file'):
+        audio_mixer.decode(b'ID3' + bytes(100))
+
+
+def test_duration():
+    assert audio_mixer.duration(audio_mixer.encode(Audio(tone(seconds=2.5), 8000, 2))) == pytest.approx(2.5)
+
+
+def test_resample_and_map_channels():
+    samples = tone(frame_rate=8000)
+    resampled = audio_mixer.resample(samples, 8000, 16000)
+    assert resampled.shape == (16000, 2)
+
+    assert audio_mixer.map_channels(samples, 1).shape == (8000, 1)
+    assert audio_mixer.map_channels(samples[:, :1], 2).shape == (8000, 2)
+
+
+def test_normalize_leaves_headroom():
+    normalized = audio_mixer.normalize(tone(amplitude=0.1))
+    assert np.abs(normalized).max() == pytest.approx(10 ** (-audio_mixer.HEADROOM_DB / 20), rel=1e-4)
+    assert not audio_mixer.normalize(np.zeros((10, 2), dtype=np.float32)).any()
+
+
+def test_mix_loops_drums_to_target_duration():
+    bpm = 120
+    drums = audio_mixer.encode(Audio(tone(seconds=2, frequency=60), 8000, 2))
+    music = audio_mixer.encode(Audio(tone(seconds=8, frame_rate=16000, channels=1), 16000, 2))
+
+    mixed = audio_mixer.decode(audio_mixer.mix(drums, music, bpm))
+    assert mixed.frame_rate == 8000
+    assert mixed.channels == 2
+    assert mixed.duration_ms == pytest.approx(audio_mixer.TARGET_DURATION_MS)
+    assert np.abs(mixed.samples).max() <= 1
+
+
+def test_peaks_levels_and_coarse_peaks():
+    samples = tone(seconds=2)
+    levels = audio_mixer.peaks(Audio(samples, 8000, 2), levels=(1000, 100, 10))
+
+    assert [level['buckets'] for level in levels] == [1000, 100, 10]
+    assert max(levels[0]['max']) == round(0.5 * audio_mixer.PEAK_SCALE)
+    assert audio_mixer.coarse_peaks({'levels': levels}) == [round(0.5 * audio_mixer.PEAK_SCALE)] * 10
+
+
+def test_peaks_of_empty_audio():
+    levels = audio_mixer.peaks(Audio(np.zeros((0, 2), dtype=np.float32), 8000, 2), levels=(4, 2))
+    assert levels == [{'buckets': 0, 'min': [], 'max': []}] * 2
@@ -0,0 +1,28 @@
+import os
+import pytest
+from app.main.service import audio_to_video_service
+
+
+@pytest.fixture(autouse=True)
+def reset_loop_dir(monkeypatch):
+    monkeypatch.setattr(audio_to_video_service, '_loop_dir', None)
+
+
+def test_uses_private_cache_dir(monkeypatch, tmp_path):
+    cache_dir = str(tmp_path / 'loops')
+    monkeypatch.setattr(audio_to_video_service, 'cache_dir', cache_dir)
+
+    assert audio_to_video_service._video_loop_dir() == cache_dir
+    assert os.stat(cache_dir).st_mode & 0o777 == 0o700
+
+
+def test_replaces_shared_cache_dir(monkeypatch, tmp_path):
+    cache_dir = tmp_path / 'loops'
+    cache_dir.mkdir(mode=0o777)
+    cache_dir.chmod(0o777)
+    monkeypatch.setattr(audio_to_video_service, 'cache_dir', str(cache_dir))
+
+    loop_dir = audio_to_video_service._video_loop_dir()
+    assert loop_dir != str(cache_dir)
+    assert os.stat(loop_dir).st_mode & 0o777 == 0o700
+    os.rmdir(loop_dir)
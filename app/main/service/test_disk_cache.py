@@ -0,0 +1,96 @@
+import pytest
+from app.main.service.disk_cache import CachedStorage
+
+
+class FakeStorage:
+    def __init__(self):
+        self.objects = {}
+        self.calls = []
+
+    def upload(self, file, name, content_type=None):
+        self.objects[name] = bytes(file)
+
+    def get(self, name):
+        self.calls.append(('get', name))
+        return self.objects.get(name)
+
+    def download(self, name, path):
+        self.calls.append(('download', name))
+        if name not in self.objects:
+            return False
+        with open(path, 'wb') as f:
+            f.write(self.objects[name])
+        return True
+
+
+@pytest.fixture
+def storage():
+    return FakeStorage()
+
+
+@pytest.fixture
+def cache(storage, tmp_path):
+    return CachedStorage(storage, str(tmp_path / 'cache'), 1024)
+
+
+def test_local_path_only_returns_hits(cache, storage):
+    storage.objects['a'] = b'audio'
+
+    assert cache.local_path('a') is None
+    assert storage.calls == []
+
+    cache.prefetch('a')
+    cache._prefetcher.shutdown(wait=True)
+    with open(cache.local_path('a'), 'rb') as f:
+        assert f.read() == b'audio'
+    assert storage.calls == [('download', 'a')]
+
+
+def test_prefetch_of_missing_object_caches_nothing(cache):
+    cache.prefetch('missing')
+    cache._prefetcher.shutdown(wait=True)
+    assert cache.local_path('missing') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_index_is_built_from_existing_files(storage, tmp_path):
+    directory = str(tmp_path / 'cache')
+    CachedStorage(storage, directory, 1024).upload(b'x' * 100, 'a')
+
+    cache = CachedStorage(storage, directory, 1024)
+    assert (cache.stats()['entries'], cache.stats()['bytes']) == (1, 100)
+    assert cache.get('a') == b'x' * 100
+    assert storage.calls == []
+
+
+def test_writes_do_not_scan_until_over_limit(cache, monkeypatch):
+    scans = []
+    scan = cache._scan
+    monkeypatch.setattr(cache, '_scan', lambda: scans.append(1) or scan())
+
+    for name in 'abc':
+        cache.upload(b'x' * 300, name)
+    assert scans == []
+
+    cache.upload(b'x' * 300, 'd')
+    assert scans == [1]
+    assert cache.stats()['bytes'] <= 1024 * 0.9
+
+
+def test_evicts_least_recently_read(cache, storage):
+    for name in 'abc':
+        cache.upload(b'x' * 300, name)
+    cache.get('a')
+    cache.upload(b'x' * 300, 'd')
+
+    assert cache.local_path('a') is not None
+    assert cache.local_path('b') is None
+    assert cache.local_path('c') is not None
+    assert cache.local_path('d') is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_invalidate_updates_the_index(cache):
+    cache.upload(b'x' * 300, 'a')
+    cache.invalidate('a')
+    assert (cache.stats()['entries'], cache.stats()['bytes']) == (0, 0)
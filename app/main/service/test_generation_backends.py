@@ -0,0 +1,94 @@
+import pytest
+from app.main.model.job_stage import JobStage
+from app.main.service import generation_backends
+from app.main.service.generation_backends import BackendRouter, GenerationBackend, MIN_SAMPLES
+
+
+def observe(router, prediction_id, seconds, succeeded=True, stage=JobStage.GENERATE, count=MIN_SAMPLES):
+    for _ in range(count):
+        router.observe(prediction_id, stage, seconds, succeeded)
+
+
+def test_backend_must_implement_abstract_methods():
+    class Incomplete(GenerationBackend):
+        name = 'incomplete'
+
+        def start_generation(self, bpm, tags, webhook=None):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError, match='missing'):
+        BackendRouter(['replicate', 'missing'])
+
+
+def test_prediction_ids_route_to_backends():
+    assert BackendRouter.backend_name('abc123') == 'replicate'
+    assert BackendRouter.backend_name('local:generate-1-2') == 'local'
+
+
+def test_ranked_puts_unmeasured_backends_first():
+    router = BackendRouter(['replicate', 'local'])
+    observe(router, 'abc', 1)
+    assert router.ranked(JobStage.GENERATE) == ['local', 'replicate']
+
+
+def test_ranked_orders_by_median_latency_per_stage():
+    router = BackendRouter(['replicate', 'local'])
+    observe(router, 'abc', 40)
+    observe(router, 'local:x', 5)
+    observe(router, 'abc', 2, stage=JobStage.SEPARATE)
+    observe(router, 'local:x', 8, stage=JobStage.SEPARATE)
+
+    assert router.ranked(JobStage.GENERATE) == ['local', 'replicate']
+    assert router.ranked(JobStage.SEPARATE) == ['replicate', 'local']
+    assert router.ranked(JobStage.GENERATE, exclude=['local']) == ['replicate']
+
+
+def test_failures_count_as_prediction_timeout():
+    router = BackendRouter(['replicate', 'local'])
+    observe(router, 'abc', 10)
+    observe(router, 'local:x', 1, succeeded=False, count=MIN_SAMPLES * 2)
+
+    assert router.ranked(JobStage.GENERATE) == ['replicate', 'local']
+    assert router._quantile('local', JobStage.GENERATE, 0.5) == generation_backends.prediction_timeout
+
+
+def test_exploration_promotes_another_backend():
+    router = BackendRouter(['replicate', 'local'], exploration=1.0)
+    observe(router, 'abc', 1)
+    observe(router, 'local:x', 5)
+    assert router.ranked(JobStage.GENERATE) == ['local', 'replicate']
+
+
+def test_hedge_delay_is_p95_of_the_primary_backend():
+    router = BackendRouter(['replicate', 'local'], hedging=True)
+    assert router.hedge_delay('abc', JobStage.GENERATE) is None
+
+    for seconds in range(1, 21):
+        router.observe('abc', JobStage.GENERATE, seconds, True)
+    assert router.hedge_delay('abc', JobStage.GENERATE) == pytest.approx(19.05)
+
+
+def test_hedge_delay_needs_hedging_and_another_backend():
+    for router in (BackendRouter(['replicate', 'local']), BackendRouter(['replicate'], hedging=True)):
+        observe(router, 'abc', 1)
+        assert router.hedge_delay('abc', JobStage.GENERATE) is None
+
+
+def test_start_fails_over_to_next_backend():
+    router = BackendRouter(['replicate', 'local'])
+    attempts = []
+
+    def call(backend):
+        attempts.append(backend.name)
+        if backend.name == 'replicate':
+            raise Exception("backend down")
+        return 'prediction'
+
+    assert router._start(JobStage.GENERATE, call, ()) == 'prediction'
+    assert attempts == ['replicate', 'local']
+    assert router._quantile('replicate', JobStage.GENERATE, 0.5, min_samples=1) == generation_backends.prediction_timeout
@@ -0,0 +1,86 @@
+import datetime
+import pytest
+from app.main.model.share_job_status import ShareJobStatus
+from app.main.model.share_jobs import ShareJob
+from app.main.service import share_service
+from app.main.service.database import arrangement_service, share_job_service, user_service
+
+
+class Response:
+    status_code = 200
+
+    def json(self):
+        return {'video_id': 1}
+
+
+@pytest.fixture
+def share_job_id(database):
+    user_service.register_user(1)
+    response, _ = arrangement_service.add_arrangement(
+        {'user_id': 1, 'name': 'Loop', 'bpm': 120, 'tags': 'rock', 'file_name': 'mix', 'status': 'COMPLETED'})
+    response, status = share_job_service.add_share_job(1, response['id'], 'https://upload.example')
+    assert status == 202
+    return response['id']
+
+
+@pytest.fixture
+def events():
+    events = []
+    return events, lambda user_id, share_job: events.append((user_id, share_job['status']))
+
+
+def age(database, share_job_id, seconds):
+    share_job = database.session.get(ShareJob, share_job_id)
+    share_job.updated_at -= datetime.timedelta(seconds=seconds)
+    database.session.commit()
+
+
+def test_run_reports_each_status(monkeypatch, share_job_id, events):
+    events, handler = events
+    monkeypatch.setattr(share_service, '_prepare_video', lambda file_name, video_path: None)
+    monkeypatch.setattr(share_service.vk_api_service, 'upload_video', lambda url, path: Response())
+
+    share_service._run(share_job_id, handler)
+
+    assert events == [(1, 'RENDERING'), (1, 'UPLOADING'), (1, 'COMPLETED')]
+    share_job = share_job_service.get_share_job(share_job_id)
+    assert (share_job.response, share_job.response_code) == ('{"video_id": 1}', 200)
+
+
+def test_run_records_failures(monkeypatch, share_job_id, events):
+    events, handler = events
+
+    def prepare_video(file_name, video_path):
+        raise Exception("ffmpeg failed")
+
+    monkeypatch.setattr(share_service, '_prepare_video', prepare_video)
+    share_service._run(share_job_id, handler)
+
+    assert events == [(1, 'RENDERING'), (1, 'FAILED')]
+    assert share_job_service.get_share_job(share_job_id).error == "ffmpeg failed"
+
+
+def test_job_starts_only_once(share_job_id):
+    assert share_job_service.start_share_job(share_job_id).status == ShareJobStatus.RENDERING
+    assert share_job_service.start_share_job(share_job_id) is None
+
+
+@pytest.mark.parametrize('start', [False, True])
+def test_sweep_fails_stale_queued_and_running_jobs(database, share_job_id, events, start):
+    events, handler = events
+    if start:
+        share_job_service.start_share_job(share_job_id)
+
+    share_service.sweep(handler)
+    assert events == []
+
+    age(database, share_job_id, share_job_service.share_job_timeout + 1)
+    share_service.sweep(handler)
+    assert events == [(1, 'FAILED')]
+    assert share_job_service.get_share_job(share_job_id).error == "Share job was interrupted"
+    assert share_job_service.start_share_job(share_job_id) is None
+
+
+def test_reading_a_stale_job_does_not_change_it(database, share_job_id):
+    age(database, share_job_id, share_job_service.share_job_timeout + 1)
+    assert share_job_service.get_share_job(share_job_id).status == ShareJobStatus.QUEUED
@@ -1,11 +1,32 @@
 import os
+import uuid
 from io import BytesIO
 import requests
+from ..util import metrics
+from ..util.shared_store import get_redis
+from ..util.token_cache import TokenCache, InvalidTokenError
 
 client_id = os.getenv('VK_CLIENT_ID')
+request_timeout = float(os.getenv('VK_REQUEST_TIMEOUT', 10))
+upload_timeout = float(os.getenv('VK_UPLOAD_TIMEOUT', 300))
+AUTH_ERRORS = ('invalid_token', 'invalid_client', 'access_denied')
+
+token_cache = TokenCache(
+    max_size=int(os.getenv('VK_TOKEN_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('VK_TOKEN_CACHE_TTL', 300)),
+    negative_ttl=float(os.getenv('VK_TOKEN_CACHE_NEGATIVE_TTL', 30)),
+    shared_store=get_redis()
+)
+
+metrics.Gauge('harmonia_token_cache', 'VK token cache statistics', ('stat',),
+              function=lambda: {(stat,): value for stat, value in token_cache.stats().items()})
 
 
 def get_user_id(access_token: str) -> int:
+    return token_cache.get_user_id(access_token, _fetch_user_id)
+
+
+def _fetch_user_id(access_token: str) -> int:
     url = "https://id.vk.com/oauth2/user_info"
     headers = {"Content-Type": "application/x-www-form-urlencoded"}
     data = {
@@ -14,31 +35,31 @@ def get_user_id(access_token: str) -> int:
     }
 
     try:
-        response = requests.post(url, headers=headers, data=data)
+        with metrics.external_call_seconds.time(service='vk', operation='user_info'):
+            response = requests.post(url, headers=headers, data=data, timeout=request_timeout)
+        if response.status_code == 401:
+            raise InvalidTokenError("Token is invalid")
         response.raise_for_status()
         user_info = response.json()
 
         if "user" in user_info and "user_id" in user_info["user"]:
             return int(user_info["user"]["user_id"])
+        elif user_info.get("error") in AUTH_ERRORS:
+            raise InvalidTokenError("Token is invalid")
         else:
-            raise Exception("Token is invalid")
+            raise Exception(f"VK API error: {user_info.get('error', 'unexpected response')}")
     except requests.RequestException as e:
         raise Exception(f"VK API request error: {e}")
 
 
-def upload_video(url: str, video_bytes: bytes) -> requests.Response:
-    with BytesIO(video_bytes) as video_file:
-        files = {
-            'video_file': (
-                'video.mp4',
-                video_file,
-                'video/mp4'
-            )
-        }
-
+def upload_video(url: str, video_path: str) -> requests.Response:
+    with _MultipartFile('video_file', 'video.mp4', 'video/mp4', video_path) as body, \
+            metrics.external_call_seconds.time(service='vk', operation='upload_video'):
         response = requests.post(
             url,
-            files=files
+            data=body,
+            headers={'Content-Type': body.content_type},
+            timeout=upload_timeout
         )
 
     if response.status_code not in range(200, 300):
@@ -47,3 +68,33 @@ def upload_video(url: str, video_bytes: bytes) -> requests.Response:
         )
 
     return response
+
+
+class _MultipartFile:
+    chunk_size = 64 * 1024
+
+    def __init__(self, field: str, file_name: str, content_type: str, path: str):
+        boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+        head = (f'--{boundary}\r\n'
+                f'Content-Disposition: form-data; name="{field}"; filename="{file_name}"\r\n'
+                f'Content-Type: {content_type}\r\n\r\n').encode()
+        tail = f'\r\n--{boundary}--\r\n'.encode()
+
+        self._file = open(path, 'rb')
+        self._parts = [BytesIO(head), self._file, BytesIO(tail)]
+        self._length = len(head) + os.path.getsize(path) + len(tail)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for part in self._parts:
+            while chunk := part.read(self.chunk_size):
+                yield chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._file.close()
@@ -1,5 +1,7 @@
+import json
 import os
 from ..model.arrangements import Arrangement
+from ..model.share_jobs import ShareJob
 
 host_url = os.getenv('HOST_URL')
 
@@ -12,5 +14,20 @@ def arrangement_to_dict(arrangement: Arrangement):
         "tags": arrangement.tags,
         "file": f'{host_url}/api/arrangements/file/{arrangement.id}',
         "created_at": arrangement.created_at.isoformat(),
-        "status": arrangement.status.value
+        "status": arrangement.status.value,
+        "peaks": arrangement.peaks,
+        "waveform": f'{host_url}/api/arrangements/peaks/{arrangement.id}' if arrangement.file_name else None
+    }
+
+
+def share_job_to_dict(share_job: ShareJob):
+    return {
+        "id": share_job.id,
+        "arrangement_id": share_job.arrangement_id,
+        "status": share_job.status.value,
+        "response": json.loads(share_job.response) if share_job.response else None,
+        "response_code": share_job.response_code,
+        "error": share_job.error,
+        "created_at": share_job.created_at.isoformat(),
+        "updated_at": share_job.updated_at.isoformat()
     }
@@ -0,0 +1,31 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    """``ThreadPoolExecutor`` that counts submitted tasks which have not finished yet."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._count_lock = threading.Lock()
+        self.submitted = 0
+        self.finished = 0
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        with self._count_lock:
+            self.submitted += 1
+        try:
+            future = super().submit(fn, *args, **kwargs)
+        except Exception:
+            self._finish()
+            raise
+        future.add_done_callback(lambda _: self._finish())
+        return future
+
+    def pending(self) -> int:
+        with self._count_lock:
+            return self.submitted - self.finished
+
+    def _finish(self) -> None:
+        with self._count_lock:
+            self.finished += 1
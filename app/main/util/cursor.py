@@ -0,0 +1,22 @@
+import base64
+import datetime
+import json
+from typing import Tuple
+
+NEXT = 'next'
+PREV = 'prev'
+
+
+def encode(created_at: datetime.datetime, arrangement_id: int, direction: str) -> str:
+    data = json.dumps([created_at.isoformat(), arrangement_id, direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode(token: str) -> Tuple[datetime.datetime, int, str]:
+    try:
+        created_at, arrangement_id, direction = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if direction not in (NEXT, PREV):
+            raise ValueError(direction)
+        return datetime.datetime.fromisoformat(created_at), int(arrangement_id), direction
+    except Exception:
+        raise ValueError("Invalid cursor")
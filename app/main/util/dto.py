@@ -14,6 +14,24 @@ class ArrangementDTO:
         'tags': fields.String(description='Tags for desired melody', example='rock, energetic'),
     })
 
+    create_arrangement_from_upload = api.model('Create arrangement from upload', {
+        'name': fields.String(required=True, description='Name of the arrangement', example='Cool music'),
+        'bpm': fields.Integer(required=True, description='BPM', example=120),
+        'tags': fields.String(description='Tags for desired melody', example='rock, energetic'),
+        'key': fields.String(required=True, description='Key of the uploaded drums file',
+                             example='drums_1_0f8fad5bd9cb469fa16570867728950e'),
+    })
+
+    drums_upload = api.model('Drums upload', {
+        'key': fields.String(description='Key to reference when creating the arrangement',
+                             example='drums_1_0f8fad5bd9cb469fa16570867728950e'),
+        'url': fields.String(description='URL to POST the drums file to as multipart form data',
+                             example='https://storage.yandexcloud.net/harmonia'),
+        'fields': fields.Raw(description='Form fields to send along with the file', example={'key': '...'}),
+        'expires_in': fields.Integer(description='Seconds until the upload URL expires', example=600),
+        'max_size': fields.Integer(description='Maximum file size in bytes', example=52428800),
+    })
+
     rename_arrangement = api.model('Rename arrangement', {
         'name': fields.String(required=True, description='Name of the arrangement', example='Cool music')
     })
@@ -21,7 +39,8 @@ class ArrangementDTO:
     create_arrangement_response = api.model('Create arrangement response', {
         'status': fields.String(description='Status of the arrangement', example='success'),
         'message': fields.String(description='Message', example='Arrangement added successfully'),
-        'id': fields.Integer(description='Arrangement ID', example=1)
+        'id': fields.Integer(description='Arrangement ID', example=1),
+        'arrangement': fields.Raw(description='The created arrangement', example={'id': 1, 'status': 'PENDING'})
     })
 
     arrangement = api.model('Arrangement', {
@@ -32,6 +51,10 @@ class ArrangementDTO:
         'file': fields.String(description='Arrangement file', example=f'{host_url}/api/arrangements/file/1'),
         'created_at': fields.DateTime(description='Arrangement created at', example=str(datetime.utcnow())),
         'status': fields.String(description='Status of the arrangement', example='PENDING'),
+        'peaks': fields.List(fields.Integer, description='Coarse waveform peaks from 0 to 127, null until completed',
+                             example=[12, 64, 127, 90]),
+        'waveform': fields.String(description='Multi-resolution waveform peaks',
+                                  example=f'{host_url}/api/arrangements/peaks/1'),
     })
 
     arrangements_list = api.model('Arrangements paged list with search query', {
@@ -42,10 +65,53 @@ class ArrangementDTO:
         'results': fields.List(fields.Nested(arrangement), description='List of arrangements')
     })
 
+    arrangements_summary = api.model('Arrangements summary', {
+        'total': fields.Integer(description='Total number of arrangements', example=24),
+        'statuses': fields.Raw(description='Number of arrangements by status',
+                               example={'PENDING': 1, 'PROCESSING': 2, 'COMPLETED': 20, 'FAILED': 1}),
+    })
+
+    bulk_ids = api.model('Arrangement IDs', {
+        'ids': fields.List(fields.Integer, required=True, description='Arrangement IDs', example=[1, 2, 3])
+    })
+
+    bulk_result = api.model('Bulk arrangement result', {
+        'id': fields.Integer(description='Arrangement ID', example=1),
+        'status': fields.String(description='ok, deleted, not_found or forbidden', example='deleted'),
+        'arrangement': fields.Nested(arrangement, allow_null=True, skip_none=True,
+                                     description='The arrangement, for bulk reads'),
+    })
+
+    bulk_response = api.model('Bulk arrangement response', {
+        'deleted': fields.List(fields.Integer, description='IDs of deleted arrangements', example=[1, 2]),
+        'results': fields.List(fields.Nested(bulk_result), description='Result for every requested ID')
+    })
+
     upload_video = api.model('Upload video', {
         'url': fields.String(description='Link for video to be uploaded to', example='https://ovu.mycdn.me/upload.do?sig=6c...')
     })
 
+    upload_video_response = api.model('Upload video response', {
+        'status': fields.String(description='Status of the request', example='success'),
+        'message': fields.String(description='Message', example='Share job created.'),
+        'id': fields.Integer(description='Share job ID', example=1)
+    })
+
+    share_job = api.model('Share job', {
+        'id': fields.Integer(description='Share job ID', example=1),
+        'arrangement_id': fields.Integer(description='Arrangement ID', example=1),
+        'status': fields.String(description='QUEUED, RENDERING, UPLOADING, COMPLETED or FAILED', example='UPLOADING'),
+        'response': fields.Raw(description='VK upload response', example={'video_id': 456239017}),
+        'response_code': fields.Integer(description='VK upload response status code', example=200),
+        'error': fields.String(description='Error message of a failed job', example=None),
+        'created_at': fields.DateTime(description='Share job created at', example=str(datetime.utcnow())),
+        'updated_at': fields.DateTime(description='Share job updated at', example=str(datetime.utcnow())),
+    })
+
 
 class UserDTO:
     api = Namespace('user', description='User related operations')
+
+
+class ReplicateDTO:
+    api = Namespace('replicate', description='Replicate prediction callbacks')
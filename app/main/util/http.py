@@ -0,0 +1,13 @@
+import unicodedata
+from urllib.parse import quote
+from werkzeug.http import dump_options_header
+
+
+def attachment(download_name: str) -> str:
+    try:
+        download_name.encode('ascii')
+        return dump_options_header('attachment', {'filename': download_name})
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        quoted = quote(download_name, safe="!#$&+^`|~")
+        return dump_options_header('attachment', {'filename': simple, 'filename*': f"UTF-8''{quoted}"})
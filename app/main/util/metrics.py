@@ -0,0 +1,269 @@
+import bisect
+import functools
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+from flask import Response, g, request
+
+logger = logging.getLogger('metrics')
+
+# /metrics on the API app is public, so it is only served when METRICS_TOKEN is set.
+# The METRICS_PORT server is meant for an internal port and accepts the token if there is one.
+metrics_token = os.getenv('METRICS_TOKEN')
+gauge_cache_seconds = float(os.getenv('METRICS_GAUGE_CACHE_SECONDS', 5))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_registry: List['_Metric'] = []
+_registry_lock = threading.Lock()
+
+
+class _Metric(ABC):
+    type = None
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(label, '')) for label in self.labels)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{label}="{_escape(value)}"' for label, value in pairs) + '}'
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        pass
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}'] + self.samples()
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f'{self.name}{self._format_labels(key)} {_number(value)}' for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    """A value that is either set directly or read from ``function`` on every scrape.
+
+    The function may return a number, or a dict that maps tuples of label
+    values to numbers for labelled gauges. With ``cache_seconds``, its result is
+    reused for that long, so frequent scrapes of gauges backed by database
+    queries do not add load.
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 function: Optional[Callable[[], object]] = None, cache_seconds: float = 0):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function = function
+        self._cache_seconds = cache_seconds
+        self._cached_at = None
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def samples(self) -> List[str]:
+        values = self._collect()
+        return [f'{self.name}{self._format_labels(key)} {_number(value)}' for key, value in values.items()]
+
+    def _collect(self) -> Dict[Tuple[str, ...], float]:
+        if self._function is None:
+            with self._lock:
+                return dict(self._values)
+
+        now = time.monotonic()
+        with self._lock:
+            if self._cached_at is not None and now - self._cached_at < self._cache_seconds:
+                return dict(self._values)
+
+        values = self._call()
+        with self._lock:
+            self._values = values
+            self._cached_at = now
+        return dict(values)
+
+    def _call(self) -> Dict[Tuple[str, ...], float]:
+        try:
+            value = self._function()
+        except Exception as e:
+            logger.error(f"Error collecting {self.name}: {e}")
+            return {}
+        if isinstance(value, dict):
+            return {tuple(str(v) for v in key): float(v) for key, v in value.items()}
+        return {(): float(value)} if value is not None else {}
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with a timer usable as a context manager or decorator.
+
+    If the histogram has an ``outcome`` label, the timer fills it with
+    ``success`` or ``error`` depending on whether the block raised.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self._buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self._buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def time(self, **labels) -> '_Timer':
+        return _Timer(self, labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+
+        lines = []
+        for key, (counts, total) in values.items():
+            cumulative = 0
+            for bound, count in zip(self._buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                lines.append(f'{self.name}_bucket{self._format_labels(key, (("le", le),))} {cumulative}')
+            lines.append(f'{self.name}_sum{self._format_labels(key)} {_number(total)}')
+            lines.append(f'{self.name}_count{self._format_labels(key)} {cumulative}')
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, object]):
+        self._histogram = histogram
+        self._labels = labels
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        labels = dict(self._labels)
+        if 'outcome' in self._histogram.labels and 'outcome' not in labels:
+            labels['outcome'] = 'error' if exc_type is not None else 'success'
+        self._histogram.observe(time.perf_counter() - self._start, **labels)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(self._histogram, self._labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+def init_app(app) -> None:
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.get('request_started')
+        if started is not None:
+            endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            http_request_seconds.observe(time.perf_counter() - started, method=request.method, endpoint=endpoint,
+                                         status=response.status_code)
+        return response
+
+    if metrics_token:
+        app.add_url_rule('/metrics', 'metrics', _metrics_view)
+    else:
+        logger.warning("METRICS_TOKEN is not set, /metrics is disabled; use METRICS_PORT or set a token")
+
+
+def start_server(port: int) -> None:
+    def application(environ, start_response):
+        if metrics_token and environ.get('HTTP_AUTHORIZATION') != f'Bearer {metrics_token}':
+            start_response('401 Unauthorized', [('Content-Type', 'text/plain')])
+            return [b'Unauthorized\n']
+        start_response('200 OK', [('Content-Type', CONTENT_TYPE)])
+        return [render().encode()]
+
+    server = make_server('0.0.0.0', port, application, handler_class=_QuietHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"Serving metrics on port {port}")
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def _metrics_view():
+    if request.headers.get('Authorization') != f'Bearer {metrics_token}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(render(), content_type=CONTENT_TYPE)
+
+
+def render() -> str:
+    with _registry_lock:
+        metrics = list(_registry)
+    return '\n'.join(line for metric in metrics for line in metric.render()) + '\n'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+http_request_seconds = Histogram('harmonia_http_request_duration_seconds', 'HTTP request latency by endpoint',
+                                 ('method', 'endpoint', 'status'))
+external_call_seconds = Histogram('harmonia_external_call_duration_seconds', 'Latency of calls to external services',
+                                  ('service', 'operation', 'outcome'))
+external_call_retries = Counter('harmonia_external_call_retries_total', 'Retried calls to external services',
+                                ('service', 'operation'))
+stage_seconds = Histogram('harmonia_generation_stage_duration_seconds', 'Duration of generation pipeline stages',
+                          ('stage', 'outcome'))
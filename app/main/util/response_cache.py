@@ -0,0 +1,93 @@
+import hashlib
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger('response_cache')
+
+
+class ResponseCache:
+    """Per-user data versions with a short-lived cache of serialized responses.
+
+    Every write bumps the user's version, which changes the ETags of all their
+    responses and orphans their cached bodies. Versions live in the optional
+    redis client so all workers agree on them, and fall back to this process
+    otherwise.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 30, shared_store=None,
+                 key_prefix: str = 'harmonia:version:'):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._shared_store = shared_store
+        self._key_prefix = key_prefix
+        self._epoch = f"{random.getrandbits(64):x}"
+        self._versions: Dict[int, int] = {}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, user_id: int) -> str:
+        shared = self._get_shared(user_id)
+        if shared is not None:
+            return shared
+        with self._lock:
+            return f"{self._epoch}.{self._versions.get(user_id, 0)}"
+
+    def bump(self, user_id: int) -> None:
+        self.bump_local(user_id)
+        if self._shared_store is None:
+            return
+        try:
+            self._shared_store.incr(self._key_prefix + str(user_id))
+        except Exception as e:
+            logger.error(f"Error bumping shared version: {e}")
+
+    def bump_local(self, user_id: int) -> None:
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def etag(self, user_id: int, version: str, key: str) -> str:
+        return hashlib.sha1(f"{user_id}:{version}:{key}".encode()).hexdigest()
+
+    def get(self, user_id: int, version: str, key: str) -> Optional[Tuple[object, int]]:
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is None or entry[0] != version or entry[1] < time.monotonic():
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end((user_id, key))
+            self.hits += 1
+            return entry[2]
+
+    def set(self, user_id: int, version: str, key: str, response: Tuple[object, int]) -> None:
+        with self._lock:
+            self._entries[(user_id, key)] = (version, time.monotonic() + self._ttl, response)
+            self._entries.move_to_end((user_id, key))
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+    def _get_shared(self, user_id: int) -> Optional[str]:
+        if self._shared_store is None:
+            return None
+        key = self._key_prefix + str(user_id)
+        try:
+            value = self._shared_store.get(key)
+            if value is None:
+                self._shared_store.set(key, random.getrandbits(48), nx=True)
+                value = self._shared_store.get(key)
+        except Exception as e:
+            logger.error(f"Error reading shared version: {e}")
+            return None
+
+        return value.decode() if isinstance(value, bytes) else str(value)
@@ -0,0 +1,26 @@
+import logging
+import os
+import threading
+
+logger = logging.getLogger('shared_store')
+
+redis_url = os.getenv('REDIS_URL')
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_redis():
+    global _client
+    if not redis_url:
+        return None
+
+    with _lock:
+        if _client is None:
+            try:
+                import redis
+                _client = redis.Redis.from_url(redis_url, socket_timeout=1, socket_connect_timeout=1)
+            except Exception as e:
+                logger.error(f"Error connecting to shared store: {e}")
+                return None
+        return _client
@@ -0,0 +1,31 @@
+from typing import List
+
+VIDEO_SUFFIX = '.mp4'
+PEAKS_SUFFIX = '.peaks.json'
+RENDITION_EXTENSIONS = ['opus', 'mp3', 'flac']
+LOCAL_SCHEME = 'local://'
+
+_DERIVED_SUFFIXES = [VIDEO_SUFFIX, PEAKS_SUFFIX] + [f'.{extension}' for extension in RENDITION_EXTENSIONS]
+
+
+def video_name(file_name: str) -> str:
+    return f"{file_name}{VIDEO_SUFFIX}"
+
+
+def peaks_name(file_name: str) -> str:
+    return f"{file_name}{PEAKS_SUFFIX}"
+
+
+def rendition_name(file_name: str, extension: str) -> str:
+    return f"{file_name}.{extension}"
+
+
+def artifact_names(file_name: str) -> List[str]:
+    return [file_name] + [f"{file_name}{suffix}" for suffix in _DERIVED_SUFFIXES]
+
+
+def base_name(name: str) -> str:
+    for suffix in _DERIVED_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
@@ -0,0 +1,10 @@
+from typing import List
+
+
+def normalize_tags(tags: str) -> List[str]:
+    normalized = []
+    for tag in (tags or '').split(','):
+        tag = ' '.join(tag.lower().split())
+        if tag and tag not in normalized:
+            normalized.append(tag)
+    return normalized
@@ -0,0 +1,24 @@
+import threading
+from app.main.util.counting_executor import CountingExecutor
+
+
+def test_pending_counts_queued_and_running_tasks():
+    executor = CountingExecutor(max_workers=1)
+    release = threading.Event()
+
+    futures = [executor.submit(release.wait, 5) for _ in range(3)]
+    assert executor.pending() == 3
+
+    release.set()
+    for future in futures:
+        future.result()
+    executor.shutdown(wait=True)
+    assert executor.pending() == 0
+    assert (executor.submitted, executor.finished) == (3, 3)
+
+
+def test_failed_tasks_count_as_finished():
+    executor = CountingExecutor(max_workers=1)
+    executor.submit(lambda: 1 / 0)
+    executor.shutdown(wait=True)
+    assert executor.pending() == 0
@@ -0,0 +1,17 @@
+import datetime
+import pytest
+from app.main.util import cursor
+
+
+def test_round_trip():
+    created_at = datetime.datetime(2025, 3, 1, 12, 30, 15, 123456)
+    token = cursor.encode(created_at, 17, cursor.NEXT)
+
+    assert '=' not in token
+    assert cursor.decode(token) == (created_at, 17, cursor.NEXT)
+
+
+@pytest.mark.parametrize('token', ['', 'not a cursor', 'W10', cursor.encode(datetime.datetime(2025, 1, 1), 1, 'up')])
+def test_rejects_invalid_tokens(token):
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        cursor.decode(token)
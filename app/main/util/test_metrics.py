@@ -0,0 +1,101 @@
+import pytest
+from flask import Flask
+from app.main.util import metrics
+
+
+def test_counter_renders_labelled_values():
+    counter = metrics.Counter('test_counter_total', 'A counter', ('kind',))
+    counter.inc(kind='a')
+    counter.inc(2.5, kind='a')
+    counter.inc(kind='b"\n')
+
+    assert counter.render() == [
+        '# HELP test_counter_total A counter',
+        '# TYPE test_counter_total counter',
+        'test_counter_total{kind="a"} 3.5',
+        'test_counter_total{kind="b\\"\\n"} 1'
+    ]
+
+
+def test_gauge_reads_function_on_scrape():
+    values = {('x',): 1, ('y',): 2}
+    gauge = metrics.Gauge('test_gauge', 'A gauge', ('name',), function=lambda: values)
+    assert gauge.samples() == ['test_gauge{name="x"} 1', 'test_gauge{name="y"} 2']
+
+    values = {('x',): 0.5}
+    assert gauge.samples() == ['test_gauge{name="x"} 0.5']
+
+
+def test_gauge_caches_function_result(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(metrics.time, 'monotonic', lambda: now[0])
+    calls = []
+    gauge = metrics.Gauge('test_cached_gauge', 'A gauge', function=lambda: calls.append(1) or len(calls),
+                          cache_seconds=5)
+
+    assert gauge.samples() == ['test_cached_gauge 1']
+    now[0] += 4
+    assert gauge.samples() == ['test_cached_gauge 1']
+    now[0] += 1
+    assert gauge.samples() == ['test_cached_gauge 2']
+
+
+def test_metric_must_implement_samples():
+    class Incomplete(metrics._Metric):
+        type = 'untyped'
+
+    with pytest.raises(TypeError):
+        Incomplete('test_incomplete', 'Incomplete')
+
+
+def test_gauge_skips_failing_function():
+    gauge = metrics.Gauge('test_failing_gauge', 'A gauge', function=lambda: 1 / 0)
+    assert gauge.samples() == []
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram('test_seconds', 'A histogram', buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value)
+
+    assert histogram.samples() == [
+        'test_seconds_bucket{le="0.1"} 2',
+        'test_seconds_bucket{le="1"} 3',
+        'test_seconds_bucket{le="+Inf"} 4',
+        'test_seconds_sum 3.65',
+        'test_seconds_count 4'
+    ]
+
+
+def test_timer_fills_outcome_label():
+    histogram = metrics.Histogram('test_timer_seconds', 'A histogram', ('outcome',), buckets=(60,))
+
+    @histogram.time()
+    def fail():
+        raise ValueError()
+
+    with histogram.time():
+        pass
+    with pytest.raises(ValueError):
+        fail()
+
+    samples = histogram.samples()
+    assert 'test_timer_seconds_count{outcome="success"} 1' in samples
+    assert 'test_timer_seconds_count{outcome="error"} 1' in samples
+
+
+def test_render_includes_registered_metrics():
+    metrics.Counter('test_registered_total', 'Registered').inc()
+    assert 'test_registered_total 1\n' in metrics.render()
+
+
+@pytest.mark.parametrize('token, status', [(None, 404), ('secret', 401)])
+def test_metrics_endpoint_requires_token(monkeypatch, token, status):
+    monkeypatch.setattr(metrics, 'metrics_token', token)
+    app = Flask(__name__)
+    metrics.init_app(app)
+
+    client = app.test_client()
+    assert client.get('/metrics').status_code == status
+    if token:
+        assert client.get('/metrics', headers={'Authorization': f'Bearer {token}'}).status_code == 200
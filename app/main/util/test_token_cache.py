@@ -0,0 +1,179 @@
+import threading
+import pytest
+from app.main.util import token_cache
+from app.main.util.token_cache import InvalidTokenError, TokenCache
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value.encode()
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(token_cache.time, 'monotonic', clock)
+    return clock
+
+
+def test_caches_user_id_until_ttl(clock):
+    cache = TokenCache(ttl=60)
+    calls = []
+
+    def loader(token):
+        calls.append(token)
+        return 42
+
+    assert cache.get_user_id('a', loader) == 42
+    assert cache.get_user_id('a', loader) == 42
+    assert calls == ['a']
+
+    clock.now += 61
+    assert cache.get_user_id('a', loader) == 42
+    assert calls == ['a', 'a']
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 2
+
+
+def test_caches_rejected_token_for_negative_ttl(clock):
+    cache = TokenCache(negative_ttl=30)
+    calls = []
+
+    def loader(token):
+        calls.append(token)
+        raise InvalidTokenError("Token is invalid")
+
+    for _ in range(2):
+        with pytest.raises(InvalidTokenError):
+            cache.get_user_id('bad', loader)
+    assert len(calls) == 1
+    assert cache.stats()['negative_hits'] == 1
+
+    clock.now += 31
+    with pytest.raises(InvalidTokenError):
+        cache.get_user_id('bad', loader)
+    assert len(calls) == 2
+
+
+def test_does_not_cache_other_errors(clock):
+    cache = TokenCache()
+    calls = []
+
+    def loader(token):
+        calls.append(token)
+        if len(calls) == 1:
+            raise Exception("VK API error: slow_down")
+        return 7
+
+    with pytest.raises(Exception, match='slow_down'):
+        cache.get_user_id('a', loader)
+    assert cache.get_user_id('a', loader) == 7
+    assert len(calls) == 2
+
+
+def test_evicts_least_recently_used(clock):
+    cache = TokenCache(max_size=2)
+    calls = []
+
+    def loader(token):
+        calls.append(token)
+        return len(token)
+
+    cache.get_user_id('a', loader)
+    cache.get_user_id('bb', loader)
+    cache.get_user_id('a', loader)
+    cache.get_user_id('ccc', loader)
+    assert cache.stats()['size'] == 2
+
+    cache.get_user_id('a', loader)
+    cache.get_user_id('bb', loader)
+    assert calls == ['a', 'bb', 'ccc', 'bb']
+
+
+def test_concurrent_lookups_share_one_load():
+    cache = TokenCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def loader(token):
+        calls.append(token)
+        started.set()
+        release.wait(5)
+        return 42
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_user_id('a', loader))) for _ in range(8)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == ['a']
+    assert results == [42] * 8
+    assert cache.stats()['misses'] + cache.stats()['hits'] + cache.stats()['coalesced'] == 8
+    assert cache.stats()['misses'] == 1
+
+
+def test_concurrent_lookups_share_the_leader_error():
+    cache = TokenCache()
+    started = threading.Event()
+    release = threading.Event()
+
+    def loader(token):
+        started.set()
+        release.wait(5)
+        raise Exception("VK API request error: timeout")
+
+    errors = []
+
+    def lookup():
+        try:
+            cache.get_user_id('a', loader)
+        except Exception as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=lookup) for _ in range(4)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == ["VK API request error: timeout"] * 4
+
+
+def test_shares_verified_tokens_through_store(clock):
+    store = FakeRedis()
+    first = TokenCache(shared_store=store)
+    second = TokenCache(shared_store=store)
+
+    assert first.get_user_id('a', lambda token: 42) == 42
+    assert second.get_user_id('a', lambda token: pytest.fail("loader called")) == 42
+    assert second.stats()['shared_hits'] == 1
+
+    first.invalidate('a')
+    assert not store.values
+    assert first.get_user_id('a', lambda token: 43) == 43
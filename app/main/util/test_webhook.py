@@ -0,0 +1,43 @@
+import base64
+import time
+import pytest
+from app.main.util import webhook
+
+SECRET = 'whsec_' + base64.b64encode(b'test-secret').decode()
+
+
+def headers(body, secret=SECRET, timestamp=None, webhook_id='msg_1'):
+    timestamp = str(int(time.time()) if timestamp is None else timestamp)
+    return {'webhook-id': webhook_id, 'webhook-timestamp': timestamp,
+            'webhook-signature': f"v1,{webhook.sign(secret, webhook_id, timestamp, body)}"}
+
+
+@pytest.fixture(autouse=True)
+def secret(monkeypatch):
+    monkeypatch.setattr(webhook, 'webhook_secret', SECRET)
+
+
+def test_accepts_signed_body():
+    assert webhook.verify_signature(headers(b'{}'), b'{}')
+
+
+def test_accepts_any_of_several_signatures():
+    signed = headers(b'{}')
+    signed['webhook-signature'] = f"v1,bm90LWl0 {signed['webhook-signature']}"
+    assert webhook.verify_signature(signed, b'{}')
+
+
+@pytest.mark.parametrize('signed, body', [
+    (headers(b'{}'), b'{"id": "x"}'),
+    (headers(b'{}', secret='whsec_' + base64.b64encode(b'other').decode()), b'{}'),
+    (headers(b'{}', timestamp=int(time.time()) - webhook.tolerance_seconds - 60), b'{}'),
+    (headers(b'{}', timestamp='soon'), b'{}'),
+    ({}, b'{}'),
+])
+def test_rejects_invalid_signatures(signed, body):
+    assert not webhook.verify_signature(signed, body)
+
+
+def test_rejects_everything_without_a_secret(monkeypatch):
+    monkeypatch.setattr(webhook, 'webhook_secret', None)
+    assert not webhook.verify_signature(headers(b'{}'), b'{}')
@@ -0,0 +1,170 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger('token_cache')
+
+_INVALID = '-'
+
+
+class InvalidTokenError(Exception):
+    pass
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.user_id = None
+        self.error = None
+
+
+class TokenCache:
+    """Bounded TTL cache from access token hash to VK user id.
+
+    Rejected tokens are cached for ``negative_ttl`` seconds, concurrent lookups
+    of the same token share a single ``loader`` call (counted as
+    ``coalesced``, not as hits), and an optional redis client lets all workers
+    share verified tokens.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300, negative_ttl: float = 30, shared_store=None,
+                 key_prefix: str = 'harmonia:token:'):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._shared_store = shared_store
+        self._key_prefix = key_prefix
+        self._entries = OrderedDict()
+        self._calls = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.shared_hits = 0
+        self.coalesced = 0
+
+    def get_user_id(self, token: str, loader: Callable[[str], int]) -> int:
+        key = hashlib.sha256(token.encode()).hexdigest()
+
+        with self._lock:
+            cached = self._get_local(key)
+            if cached is not None:
+                self.hits += 1
+                return self._unwrap(cached)
+
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.user_id
+
+        try:
+            value = self._get_shared(key)
+            if value is None:
+                try:
+                    value = loader(token)
+                except InvalidTokenError:
+                    value = _INVALID
+                self._set_shared(key, value)
+                shared = False
+            else:
+                shared = True
+
+            with self._lock:
+                self._set_local(key, value)
+                if shared:
+                    self.shared_hits += 1
+
+            call.user_id = self._unwrap(value)
+            return call.user_id
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def invalidate(self, token: str) -> None:
+        key = hashlib.sha256(token.encode()).hexdigest()
+        with self._lock:
+            self._entries.pop(key, None)
+        if self._shared_store is not None:
+            try:
+                self._shared_store.delete(self._key_prefix + key)
+            except Exception as e:
+                logger.error(f"Error invalidating shared token cache: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'negative_hits': self.negative_hits,
+                'shared_hits': self.shared_hits,
+                'coalesced': self.coalesced
+            }
+
+    def _unwrap(self, value):
+        if value == _INVALID:
+            raise InvalidTokenError("Token is invalid")
+        return value
+
+    def _get_local(self, key: str) -> Optional[object]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        if value == _INVALID:
+            self.negative_hits += 1
+        return value
+
+    def _set_local(self, key: str, value) -> None:
+        ttl = self._negative_ttl if value == _INVALID else self._ttl
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def _get_shared(self, key: str):
+        if self._shared_store is None:
+            return None
+        try:
+            value = self._shared_store.get(self._key_prefix + key)
+        except Exception as e:
+            logger.error(f"Error reading shared token cache: {e}")
+            return None
+
+        if value is None:
+            return None
+        value = value.decode() if isinstance(value, bytes) else value
+        return _INVALID if value == _INVALID else int(value)
+
+    def _set_shared(self, key: str, value) -> None:
+        if self._shared_store is None:
+            return
+        ttl = self._negative_ttl if value == _INVALID else self._ttl
+        try:
+            self._shared_store.set(self._key_prefix + key, str(value), ex=max(1, int(ttl)))
+        except Exception as e:
+            logger.error(f"Error writing shared token cache: {e}")
@@ -0,0 +1,34 @@
+import base64
+import hashlib
+import hmac
+import os
+import time
+
+webhook_secret = os.getenv('REPLICATE_WEBHOOK_SECRET')
+tolerance_seconds = 300
+
+
+def verify_signature(headers, body: bytes) -> bool:
+    if not webhook_secret:
+        return False
+
+    webhook_id = headers.get('webhook-id')
+    timestamp = headers.get('webhook-timestamp')
+    signatures = headers.get('webhook-signature')
+    if not webhook_id or not timestamp or not signatures:
+        return False
+
+    try:
+        if abs(time.time() - int(timestamp)) > tolerance_seconds:
+            return False
+    except ValueError:
+        return False
+
+    expected = sign(webhook_secret, webhook_id, timestamp, body)
+    return any(hmac.compare_digest(expected, signature.split(',', 1)[-1]) for signature in signatures.split())
+
+
+def sign(secret: str, webhook_id: str, timestamp: str, body: bytes) -> str:
+    key = base64.b64decode(secret.split('_', 1)[-1])
+    payload = f"{webhook_id}.{timestamp}.".encode() + body
+    return base64.b64encode(hmac.new(key, payload, hashlib.sha256).digest()).decode()
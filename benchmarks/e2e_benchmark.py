@@ -0,0 +1,386 @@
+"""End-to-end load benchmark against local stand-ins for VK, S3 and Replicate.
+
+    createdb harmonia_bench
+    python benchmarks/e2e_benchmark.py --database-uri postgresql://localhost/harmonia_bench --init-schema \\
+        --users 20 --jobs-per-user 3 --replicate-delay 2
+
+The backend runs in a subprocess with ``fake_services`` installed, so VK
+tokens are checked in-process and storage lives in a temporary directory, and
+talks to ``tools/fake_replicate.py`` for predictions. Every simulated user
+registers, opens a WebSocket and creates arrangements one after another,
+polling the REST endpoints until the socket reports the job finished, then
+downloads the result and its peaks. Postgres is still required; pass
+``--init-schema`` once to load ``sql/db.sql`` into an empty database.
+
+Reports p50/p95/p99 latency per endpoint, job latency (create request to the
+WebSocket event that finished it), jobs per minute and peak RSS. Use
+``--backends local`` to replace the predictions with the deterministic CPU
+backend, or ``--backends replicate,local --hedging`` to exercise routing.
+"""
+import argparse
+import base64
+import io
+import json
+import math
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from collections import defaultdict
+import numpy as np
+import requests
+import simple_websocket
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_services  # noqa: E402
+
+BPM = 120
+TERMINAL_STATUSES = ('COMPLETED', 'FAILED')
+
+
+def make_drums(seconds: float, frame_rate: int = 44100) -> bytes:
+    t = np.arange(int(seconds * frame_rate)) / frame_rate
+    kick = np.sin(2 * np.pi * 55 * t) * np.exp(-((t * BPM / 60) % 1) * 12)
+    samples = (np.stack([kick, kick], axis=1) * 0.6 * 32767).astype('<i2')
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(frame_rate)
+        wav.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+def percentile(values, p: float) -> float:
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+class Recorder:
+    """Collects request latencies and errors per endpoint from all user threads."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.jobs = []
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self.latencies[name].append(seconds)
+            if not ok:
+                self.errors[name] += 1
+
+    def request(self, session: requests.Session, name: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=60, **kwargs)
+        except requests.RequestException:
+            self.record(name, time.perf_counter() - start, False)
+            return None
+        self.record(name, time.perf_counter() - start, response.status_code < 400)
+        return response
+
+    def job(self, started: float, finished: float, status: str) -> None:
+        with self._lock:
+            self.jobs.append((started, finished, status))
+
+
+class EventListener:
+    """Reads a user's WebSocket and remembers when each arrangement finished."""
+
+    def __init__(self, url: str, token: str, recorder: Recorder):
+        start = time.perf_counter()
+        self.ws = simple_websocket.Client.connect(url)
+        self.ws.send(json.dumps({'access_token': token}))
+        reply = self.ws.receive(timeout=30)
+        recorder.record('ws_connect', time.perf_counter() - start,
+                        reply is not None and json.loads(reply).get('status') == 'success')
+
+        self.events = 0
+        self._finished = {}
+        self._condition = threading.Condition()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def wait(self, arrangement_id: int, timeout: float):
+        with self._condition:
+            self._condition.wait_for(lambda: arrangement_id in self._finished, timeout)
+            return self._finished.get(arrangement_id)
+
+    def close(self) -> None:
+        self.ws.close()
+
+    def _run(self):
+        while True:
+            try:
+                data = self.ws.receive()
+            except simple_websocket.ConnectionClosed:
+                return
+            if data is None:
+                continue
+
+            arrangement = json.loads(data).get('arrangement') or {}
+            with self._condition:
+                self.events += 1
+                if arrangement.get('status') in TERMINAL_STATUSES and arrangement['id'] not in self._finished:
+                    self._finished[arrangement['id']] = (arrangement['status'], time.perf_counter())
+                    self._condition.notify_all()
+
+
+def run_user(user_id: int, args, base_url: str, drums: bytes, recorder: Recorder, events: list) -> None:
+    token = fake_services.token(user_id)
+    session = requests.Session()
+    session.headers['Authorization'] = f'Bearer {token}'
+    api_url = f'{base_url}/api'
+
+    recorder.request(session, 'register', 'POST', f'{api_url}/user/register')
+    try:
+        listener = EventListener(base_url.replace('http', 'ws', 1) + '/websocket', token, recorder)
+    except Exception:
+        recorder.record('ws_connect', 0.0, False)
+        return
+
+    try:
+        for index in range(args.jobs_per_user):
+            started = time.perf_counter()
+            response = recorder.request(session, 'create', 'POST', f'{api_url}/arrangements/create',
+                                        data={'name': f'bench {user_id}-{index}', 'tags': 'lofi, bench', 'bpm': BPM},
+                                        files={'file': ('drums.wav', drums, 'audio/wav')})
+            if response is None or response.status_code != 201:
+                continue
+
+            arrangement_id = response.json()['arrangement']['id']
+            deadline = started + args.job_timeout
+            result = None
+            while result is None and time.perf_counter() < deadline:
+                recorder.request(session, 'list', 'GET', f'{api_url}/arrangements/', params={'page': 1})
+                recorder.request(session, 'get', 'GET', f'{api_url}/arrangements/{arrangement_id}')
+                result = listener.wait(arrangement_id, args.poll_interval)
+
+            if result is None:
+                recorder.job(started, time.perf_counter(), 'TIMEOUT')
+                continue
+
+            status, finished = result
+            recorder.job(started, finished, status)
+            if status == 'COMPLETED':
+                for audio_format in args.download_formats:
+                    recorder.request(session, f'file ({audio_format})', 'GET',
+                                     f'{api_url}/arrangements/file/{arrangement_id}', params={'format': audio_format})
+                recorder.request(session, 'peaks', 'GET', f'{api_url}/arrangements/peaks/{arrangement_id}')
+    finally:
+        events.append(listener.events)
+        listener.close()
+
+
+def serve(args) -> None:
+    import logging
+    fake_services.install(args.storage_dir, args.vk_delay)
+    import run
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    run.app.run(host='127.0.0.1', port=args.port, threaded=True)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def init_schema(database_uri: str) -> None:
+    from sqlalchemy import create_engine
+
+    with open(os.path.join(ROOT, 'sql', 'db.sql')) as f:
+        schema = f.read()
+    engine = create_engine(database_uri)
+    with engine.begin() as connection:
+        connection.exec_driver_sql(schema)
+    engine.dispose()
+
+
+def wait_ready(url: str, processes, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        for process in processes:
+            if process.poll() is not None:
+                raise RuntimeError(f"{process.args[1]} exited with code {process.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout} s")
+
+
+def peak_rss_mb(pid: int):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def start_services(args, work_dir: str):
+    replicate_port = free_port()
+    server_port = free_port()
+    log = open(os.path.join(work_dir, 'services.log'), 'wb')
+
+    webhook_secret = 'whsec_' + base64.b64encode(os.urandom(24)).decode()
+    replicate = subprocess.Popen([sys.executable, os.path.join(ROOT, 'tools', 'fake_replicate.py'),
+                                  '--port', str(replicate_port), '--delay', str(args.replicate_delay),
+                                  '--jitter', str(args.replicate_jitter), '--fail-rate', str(args.fail_rate),
+                                  '--webhook-secret', webhook_secret],
+                                 stdout=log, stderr=subprocess.STDOUT)
+
+    env = dict(os.environ,
+               SQLALCHEMY_DATABASE_URI=args.database_uri,
+               REPLICATE_BASE_URL=f'http://127.0.0.1:{replicate_port}',
+               REPLICATE_API_TOKEN='fake',
+               HOST_URL=f'http://127.0.0.1:{server_port}',
+               GENERATION_MODE=args.generation_mode,
+               REPLICATE_WEBHOOK_SECRET=webhook_secret,
+               GENERATION_BACKENDS=args.backends,
+               GENERATION_HEDGING=str(args.hedging).lower(),
+               GENERATION_WORKERS=str(args.workers),
+               STORAGE_CACHE_DIR=os.path.join(work_dir, 'cache'))
+    env.setdefault('ARRANGEMENTS_PER_PAGE', '10')
+    env.setdefault('AWS_BUCKET_NAME', 'harmonia-bench')
+    env.setdefault('AWS_ROOT_DIR', 'arrangements')
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', '--port', str(server_port),
+                               '--storage-dir', os.path.join(work_dir, 's3'), '--vk-delay', str(args.vk_delay)],
+                              env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    base_url = f'http://127.0.0.1:{server_port}'
+    try:
+        wait_ready(f'http://127.0.0.1:{replicate_port}/v1/predictions/ready', [replicate, server])
+        wait_ready(f'{base_url}/metrics', [replicate, server])
+    except Exception:
+        stop([replicate, server])
+        raise
+    return base_url, replicate, server
+
+
+def stop(processes) -> None:
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def report(recorder: Recorder, elapsed: float, server_rss, events: int) -> dict:
+    print(f"{'endpoint':<16}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    endpoints = {}
+    for name, values in sorted(recorder.latencies.items()):
+        endpoints[name] = {'count': len(values), 'errors': recorder.errors[name],
+                           'p50': percentile(values, 50), 'p95': percentile(values, 95),
+                           'p99': percentile(values, 99)}
+        print(f"{name:<16}{len(values):>8}{recorder.errors[name]:>8}"
+              + ''.join(f"{endpoints[name][p] * 1000:>10.1f}" for p in ('p50', 'p95', 'p99')))
+
+    statuses = defaultdict(int)
+    for _, _, status in recorder.jobs:
+        statuses[status] += 1
+    completed = [finished - started for started, finished, status in recorder.jobs if status == 'COMPLETED']
+    window = (max(finished for _, finished, _ in recorder.jobs) - min(started for started, _, _ in recorder.jobs)) \
+        if recorder.jobs else 0
+    jobs_per_minute = len(completed) / window * 60 if window else 0.0
+
+    print()
+    print(f"jobs: {dict(statuses)}, {events} WebSocket events, {elapsed:.1f} s wall time")
+    print(f"job latency: p50 {percentile(completed, 50):.2f} s, p95 {percentile(completed, 95):.2f} s, "
+          f"p99 {percentile(completed, 99):.2f} s")
+    print(f"throughput: {jobs_per_minute:.1f} jobs/min")
+
+    client_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"peak RSS: server {server_rss:.0f} MB, load generator {client_rss:.0f} MB" if server_rss is not None
+          else f"peak RSS: server n/a, load generator {client_rss:.0f} MB")
+
+    return {'endpoints': endpoints, 'jobs': dict(statuses), 'websocket_events': events, 'elapsed': elapsed,
+            'job_latency': {p: percentile(completed, int(p[1:])) for p in ('p50', 'p95', 'p99')},
+            'jobs_per_minute': jobs_per_minute, 'server_peak_rss_mb': server_rss, 'client_peak_rss_mb': client_rss}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', default=os.getenv('SQLALCHEMY_DATABASE_URI'),
+                        help='Postgres database to run against (default: $SQLALCHEMY_DATABASE_URI)')
+    parser.add_argument('--init-schema', action='store_true', help='Load sql/db.sql before starting')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--jobs-per-user', type=int, default=3)
+    parser.add_argument('--user-offset', type=int, default=int(time.time()) % 100000 * 1000,
+                        help='First simulated user id, so repeated runs do not collide')
+    parser.add_argument('--workers', type=int, default=5, help='GENERATION_WORKERS for the backend')
+    parser.add_argument('--generation-mode', default='blocking', choices=('blocking', 'async', 'webhook'))
+    parser.add_argument('--backends', default='replicate',
+                        help='GENERATION_BACKENDS for the backend, e.g. local or replicate,local')
+    parser.add_argument('--hedging', action='store_true', help='Enable GENERATION_HEDGING')
+    parser.add_argument('--replicate-delay', type=float, default=2.0, help='Seconds each fake prediction takes')
+    parser.add_argument('--replicate-jitter', type=float, default=0.5, help='Extra random prediction time')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Fraction of fake predictions that fail')
+    parser.add_argument('--vk-delay', type=float, default=0.05, help='Seconds each VK token lookup takes')
+    parser.add_argument('--drums-seconds', type=float, default=16)
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between REST polls per user')
+    parser.add_argument('--job-timeout', type=float, default=300)
+    parser.add_argument('--download-formats', default='wav,opus', type=lambda value: value.split(','))
+    parser.add_argument('--json', help='Also write the results to this file')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--storage-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    if not args.database_uri:
+        parser.error('--database-uri or SQLALCHEMY_DATABASE_URI is required')
+    if args.init_schema:
+        init_schema(args.database_uri)
+
+    work_dir = tempfile.mkdtemp(prefix='harmonia-bench-')
+    base_url, replicate, server = start_services(args, work_dir)
+    print(f"backend on {base_url}, logs in {work_dir}/services.log")
+
+    drums = make_drums(args.drums_seconds)
+    recorder = Recorder()
+    events = []
+    threads = [threading.Thread(target=run_user, args=(args.user_offset + i, args, base_url, drums, recorder, events))
+               for i in range(args.users)]
+
+    start = time.perf_counter()
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        elapsed = time.perf_counter() - start
+        server_rss = peak_rss_mb(server.pid)
+        stop([replicate, server])
+
+    results = report(recorder, elapsed, server_rss, sum(events))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
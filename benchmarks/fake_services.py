@@ -0,0 +1,167 @@
+"""In-process stand-ins for VK and Yandex S3 used by the offline benchmarks.
+
+``install()`` swaps the boto client inside ``S3Storage`` for ``LocalS3Client``,
+which keeps objects in a local directory, and replaces VK token verification
+with a stub that accepts ``bench-<user id>`` tokens. Everything above those
+two seams (caching, metrics, error handling) runs unchanged.
+"""
+import datetime
+import io
+import os
+import shutil
+import tempfile
+import time
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+TOKEN_PREFIX = 'bench-'
+LIST_PAGE_SIZE = 1000
+
+
+class LocalS3Client:
+    """The subset of the boto3 S3 client that ``S3Storage`` calls, backed by files."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            if isinstance(Body, (bytes, bytearray)):
+                f.write(Body)
+            else:
+                shutil.copyfileobj(Body, f)
+        return {'ETag': self._etag(path)}
+
+    def upload_file(self, Filename, Bucket, Key):
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(Filename, path)
+
+    def get_object(self, Bucket, Key, Range=None, IfNoneMatch=None, IfModifiedSince=None):
+        path = self._existing(Bucket, Key, 'GetObject')
+        etag = self._etag(path)
+        not_modified = IfNoneMatch == etag if IfNoneMatch else \
+            IfModifiedSince is not None and _modified(path).replace(microsecond=0) <= IfModifiedSince
+        if not_modified:
+            raise _error(304, 'NotModified', 'GetObject', etag)
+
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        size = len(data)
+        status = 200
+        content_range = None
+        if Range and Range.startswith('bytes='):
+            first, _, last = Range[len('bytes='):].partition('-')
+            start = int(first) if first else max(size - int(last), 0)
+            end = min(int(last), size - 1) if first and last else size - 1
+            if start >= size or start > end:
+                raise _error(416, 'InvalidRange', 'GetObject', etag)
+            data = data[start:end + 1]
+            status = 206
+            content_range = f'bytes {start}-{end}/{size}'
+
+        response = {
+            'Body': StreamingBody(io.BytesIO(data), len(data)),
+            'ContentLength': len(data),
+            'ETag': etag,
+            'LastModified': _modified(path),
+            'ResponseMetadata': {'HTTPStatusCode': status}
+        }
+        if content_range:
+            response['ContentRange'] = content_range
+        return response
+
+    def head_object(self, Bucket, Key):
+        path = self._existing(Bucket, Key, 'HeadObject')
+        return {'ContentLength': os.path.getsize(path), 'ETag': self._etag(path), 'LastModified': _modified(path)}
+
+    def download_file(self, Bucket, Key, Filename):
+        shutil.copyfile(self._existing(Bucket, Key, 'HeadObject'), Filename)
+
+    def delete_objects(self, Bucket, Delete):
+        for item in Delete['Objects']:
+            try:
+                os.remove(self._path(Bucket, item['Key']))
+            except FileNotFoundError:
+                pass
+        return {} if Delete.get('Quiet') else {'Deleted': [{'Key': item['Key']} for item in Delete['Objects']]}
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600):
+        return f"file://{self._path(Params['Bucket'], Params['Key'])}"
+
+    def generate_presigned_post(self, Bucket, Key, Conditions=None, ExpiresIn=3600):
+        return {'url': f"file://{os.path.join(self.directory, Bucket)}", 'fields': {'key': Key}}
+
+    def get_paginator(self, operation):
+        return _ListPaginator(self)
+
+    def _path(self, bucket, key):
+        return os.path.join(self.directory, bucket, *key.split('/'))
+
+    def _existing(self, bucket, key, operation):
+        path = self._path(bucket, key)
+        if not os.path.isfile(path):
+            raise _error(404, 'NoSuchKey', operation)
+        return path
+
+    @staticmethod
+    def _etag(path):
+        stat = os.stat(path)
+        return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+class _ListPaginator:
+    def __init__(self, client: LocalS3Client):
+        self._client = client
+
+    def paginate(self, Bucket, Prefix=''):
+        root = os.path.join(self._client.directory, Bucket)
+        keys = []
+        for directory, _, files in os.walk(root):
+            for name in files:
+                key = os.path.relpath(os.path.join(directory, name), root).replace(os.sep, '/')
+                if key.startswith(Prefix):
+                    keys.append(key)
+
+        keys.sort()
+        for start in range(0, len(keys), LIST_PAGE_SIZE):
+            yield {'Contents': [{'Key': key, 'LastModified': _modified(self._client._path(Bucket, key)),
+                                 'Size': os.path.getsize(self._client._path(Bucket, key))}
+                                for key in keys[start:start + LIST_PAGE_SIZE]]}
+
+
+def install(storage_dir: str = None, vk_delay: float = 0.0) -> str:
+    from app.main import s3_storage
+    from app.main.service import vk_api_service
+    from app.main.util.token_cache import InvalidTokenError
+
+    storage_dir = storage_dir or tempfile.mkdtemp(prefix='harmonia-bench-s3-')
+    s3_storage._storage.s3 = LocalS3Client(storage_dir)
+
+    def fetch_user_id(access_token: str) -> int:
+        if vk_delay:
+            time.sleep(vk_delay)
+        if not access_token.startswith(TOKEN_PREFIX) or not access_token[len(TOKEN_PREFIX):].isdigit():
+            raise InvalidTokenError("Token is invalid")
+        return int(access_token[len(TOKEN_PREFIX):])
+
+    vk_api_service._fetch_user_id = fetch_user_id
+    return storage_dir
+
+
+def token(user_id: int) -> str:
+    return f'{TOKEN_PREFIX}{user_id}'
+
+
+def _modified(path: str) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(os.path.getmtime(path), datetime.timezone.utc)
+
+
+def _error(status: int, code: str, operation: str, etag: str = None) -> ClientError:
+    headers = {'etag': etag} if etag else {}
+    return ClientError({'Error': {'Code': code, 'Message': code},
+                        'ResponseMetadata': {'HTTPStatusCode': status, 'HTTPHeaders': headers}}, operation)
@@ -0,0 +1,90 @@
+"""Compares the NumPy mixing engine with the pydub chain it replaced.
+
+    python benchmarks/mixing_benchmark.py --repeat 5
+
+Drums are a 30 s stereo 44.1 kHz / 16-bit loop, the melody an 8 bar stereo
+48 kHz / 24-bit stem, so both engines have to resample, convert sample width,
+loop and normalize.
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+import wave
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('ARRANGEMENTS_PER_PAGE', '10')
+
+from app.main.service import audio_mixer  # noqa: E402
+from app.main.service.music_gen_service import MusicGenerator  # noqa: E402
+
+BPM = 120
+
+
+def render(samples: np.ndarray, frame_rate: int, sample_width: int) -> bytes:
+    return audio_mixer.encode(audio_mixer.Audio(samples.astype(np.float32), frame_rate, sample_width))
+
+
+def make_drums(seconds: float, frame_rate: int = 44100) -> bytes:
+    rng = np.random.default_rng(1)
+    t = np.arange(int(seconds * frame_rate)) / frame_rate
+    beat = (t * BPM / 60) % 1
+    kick = np.sin(2 * np.pi * 55 * t) * np.exp(-beat * 12)
+    hat = rng.uniform(-1, 1, len(t)) * np.exp(-((t * BPM / 30) % 1) * 40) * 0.3
+    return render(np.stack([kick + hat, kick - hat], axis=1) * 0.6, frame_rate, 2)
+
+
+def make_melody(seconds: float, frame_rate: int = 48000) -> bytes:
+    t = np.arange(int(seconds * frame_rate)) / frame_rate
+    notes = 220 * 2 ** (np.floor(t * BPM / 60) % 8 / 12)
+    tone = np.sin(2 * np.pi * np.cumsum(notes) / frame_rate)
+    return render(np.stack([tone, np.roll(tone, 240)], axis=1) * 0.5, frame_rate, 3)
+
+
+def measure(engine, drums: bytes, melody: bytes, repeat: int):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = engine(drums, melody, BPM)
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+
+def describe(data: bytes) -> str:
+    with wave.open(io.BytesIO(data)) as wav:
+        return f"{wav.getnframes() / wav.getframerate():.2f} s, {wav.getframerate()} Hz, " \
+               f"{wav.getnchannels()} ch, {8 * wav.getsampwidth()} bit"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    drums = make_drums(30)
+    melody = make_melody(8 * 4 * 60 / BPM + 2)
+
+    results = {}
+    for name, engine in (('pydub', MusicGenerator.mix_pydub), ('numpy', audio_mixer.mix)):
+        timings, output = measure(engine, drums, melody, args.repeat)
+        results[name] = (timings, output)
+        print(f"{name:>6}: median {statistics.median(timings) * 1000:8.1f} ms, "
+              f"best {min(timings) * 1000:8.1f} ms  ({describe(output)})")
+
+    pydub_median = statistics.median(results['pydub'][0])
+    numpy_median = statistics.median(results['numpy'][0])
+    print(f"speedup: {pydub_median / numpy_median:.1f}x")
+
+    a = audio_mixer.decode(results['pydub'][1]).samples
+    b = audio_mixer.decode(results['numpy'][1]).samples
+    frames = min(len(a), len(b))
+    correlation = np.corrcoef(a[:frames].ravel(), b[:frames].ravel())[0, 1]
+    print(f"output correlation: {correlation:.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+import os
+
+# Importing any module under app builds the Flask app, which reads these at import time.
+os.environ.setdefault('ARRANGEMENTS_PER_PAGE', '10')
+os.environ.setdefault('AWS_BUCKET_NAME', 'harmonia-test')
+os.environ.setdefault('AWS_ROOT_DIR', 'test')
+os.environ.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite://')
+os.environ.setdefault('STORAGE_CACHE_MAX_MB', '0')
+os.environ.setdefault('STORAGE_REAPER', 'false')
+os.environ.setdefault('GENERATION_WORKERS', '0')
+
+# Tests that need Postgres use the database fixture and are skipped unless TEST_DATABASE_URI is set.
+# The fixture replaces the public schema of that database with sql/db.sql.
+if os.getenv('TEST_DATABASE_URI'):
+    os.environ['SQLALCHEMY_DATABASE_URI'] = os.environ['TEST_DATABASE_URI']
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def database_app():
+    if not os.getenv('TEST_DATABASE_URI'):
+        pytest.skip("TEST_DATABASE_URI is not set")
+
+    from app import blueprint
+    from app.main import app, create_app, db
+
+    create_app()
+    app.register_blueprint(blueprint)
+    with open(os.path.join(os.path.dirname(__file__), 'sql', 'db.sql')) as schema, app.app_context():
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('DROP SCHEMA public CASCADE; CREATE SCHEMA public;')
+            cursor.execute(schema.read())
+            connection.commit()
+        finally:
+            connection.close()
+    return app
+
+
+@pytest.fixture
+def database(database_app):
+    from app.main import db
+
+    with database_app.app_context():
+        yield db
+        db.session.rollback()
+        tables = ', '.join(db.session.execute(db.text(
+            "SELECT tablename FROM pg_tables WHERE schemaname = 'public'")).scalars())
+        db.session.execute(db.text(f'TRUNCATE {tables} RESTART IDENTITY CASCADE'))
+        db.session.commit()
+
+
+@pytest.fixture
+def client(database, database_app, monkeypatch):
+    from app.main.service import vk_api_service
+
+    # The bearer token is the VK user id.
+    monkeypatch.setattr(vk_api_service, 'get_user_id', lambda token: int(token))
+    return database_app.test_client()
@@ -1,9 +1,20 @@
+import os
 from app.main import create_app
 from app import blueprint
+from app.main.controller import websocket_controller
+from app.main.service import job_worker, share_service, storage_reaper
 
 app = create_app()
 app.register_blueprint(blueprint)
 app.app_context().push()
 
+websocket_controller.start_listening()
+share_service.start_sweeper(websocket_controller.share_updated)
+
+# Jobs and the storage reaper run in worker.py; set GENERATION_WORKERS to run them in the API process too.
+workers = int(os.getenv('GENERATION_WORKERS', 0))
+if workers > 0:
+    storage_reaper.start_reaper(job_worker.start_workers(workers, websocket_controller.arrangement_status_changed))
+
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=5400)
@@ -1,3 +1,5 @@
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 CREATE TYPE arrangement_status as ENUM('PENDING', 'PROCESSING', 'COMPLETED', 'FAILED');
 
 CREATE TABLE users
@@ -11,7 +13,144 @@ CREATE TABLE arrangements (
     name VARCHAR(255) NOT NULL,
     bpm FLOAT NOT NULL,
     tags VARCHAR(1000) NOT NULL,
+    tag_list VARCHAR(100)[] NOT NULL DEFAULT '{}',
     file_name VARCHAR(255),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    status arrangement_status NOT NULL
+    status arrangement_status NOT NULL,
+    peaks SMALLINT[],
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', name), 'A') || setweight(to_tsvector('simple', tags), 'B')
+    ) STORED
+);
+
+CREATE INDEX arrangements_user_created_idx ON arrangements (user_id, created_at DESC, id DESC);
+CREATE INDEX arrangements_search_idx ON arrangements USING GIN (search_vector);
+CREATE INDEX arrangements_tag_list_idx ON arrangements USING GIN (tag_list);
+CREATE INDEX arrangements_name_trgm_idx ON arrangements USING GIN (name gin_trgm_ops);
+CREATE INDEX arrangements_file_name_idx ON arrangements (file_name);
+
+CREATE TABLE arrangement_counters (
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    status arrangement_status NOT NULL,
+    count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, status)
+);
+
+CREATE FUNCTION update_arrangement_counters() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.user_id IS NOT DISTINCT FROM NEW.user_id AND OLD.status = NEW.status THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE arrangement_counters SET count = count - 1
+        WHERE user_id = OLD.user_id AND status = OLD.status;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.user_id IS NOT NULL THEN
+        INSERT INTO arrangement_counters (user_id, status, count) VALUES (NEW.user_id, NEW.status, 1)
+        ON CONFLICT (user_id, status) DO UPDATE SET count = arrangement_counters.count + 1;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER arrangements_counters_trigger
+    AFTER INSERT OR DELETE OR UPDATE OF user_id, status ON arrangements
+    FOR EACH ROW EXECUTE FUNCTION update_arrangement_counters();
+
+CREATE TYPE job_status as ENUM('QUEUED', 'RUNNING', 'WAITING', 'COMPLETED', 'FAILED');
+CREATE TYPE job_stage as ENUM('GENERATE', 'SEPARATE', 'MIX');
+
+CREATE TABLE generation_jobs (
+    id SERIAL PRIMARY KEY,
+    arrangement_id INT NOT NULL REFERENCES arrangements(id) ON DELETE CASCADE,
+    drums_file_name VARCHAR(255) NOT NULL,
+    bpm FLOAT NOT NULL,
+    tags VARCHAR(1000) NOT NULL,
+    status job_status NOT NULL DEFAULT 'QUEUED',
+    stage job_stage NOT NULL DEFAULT 'GENERATE',
+    prediction_id VARCHAR(255),
+    music_prediction_id VARCHAR(255),
+    music_url TEXT,
+    stem_prediction_id VARCHAR(255),
+    stem_url TEXT,
+    stem_file_name VARCHAR(255),
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 3,
+    locked_by VARCHAR(255),
+    locked_until TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
+
+CREATE INDEX generation_jobs_queued_idx ON generation_jobs (id) WHERE status = 'QUEUED';
+CREATE INDEX generation_jobs_running_idx ON generation_jobs (locked_until) WHERE status = 'RUNNING';
+CREATE INDEX generation_jobs_waiting_idx ON generation_jobs (updated_at) WHERE status = 'WAITING';
+CREATE UNIQUE INDEX generation_jobs_drums_file_name_idx ON generation_jobs (drums_file_name);
+CREATE INDEX generation_jobs_stem_file_name_idx ON generation_jobs (stem_file_name);
+
+CREATE TYPE share_job_status as ENUM('QUEUED', 'RENDERING', 'UPLOADING', 'COMPLETED', 'FAILED');
+
+CREATE TABLE share_jobs (
+    id SERIAL PRIMARY KEY,
+    arrangement_id INT NOT NULL REFERENCES arrangements(id) ON DELETE CASCADE,
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    upload_url TEXT NOT NULL,
+    status share_job_status NOT NULL DEFAULT 'QUEUED',
+    response TEXT,
+    response_code INT,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE storage_deletions (
+    id BIGSERIAL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    artifacts BOOLEAN NOT NULL DEFAULT FALSE,
+    attempts INT NOT NULL DEFAULT 0,
+    not_before TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc')
+);
+
+CREATE INDEX storage_deletions_due_idx ON storage_deletions (not_before);
+CREATE INDEX storage_deletions_name_idx ON storage_deletions (name);
+
+CREATE FUNCTION enqueue_arrangement_files() RETURNS TRIGGER AS $$
+BEGIN
+    IF OLD.file_name IS NOT NULL AND (TG_OP = 'DELETE' OR OLD.file_name IS DISTINCT FROM NEW.file_name) THEN
+        INSERT INTO storage_deletions (name, artifacts) VALUES (OLD.file_name, TRUE);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER arrangements_storage_trigger
+    AFTER DELETE OR UPDATE OF file_name ON arrangements
+    FOR EACH ROW EXECUTE FUNCTION enqueue_arrangement_files();
+
+CREATE FUNCTION enqueue_job_files() RETURNS TRIGGER AS $$
+BEGIN
+    IF OLD.status <> 'COMPLETED' AND (TG_OP = 'DELETE' OR NEW.status = 'COMPLETED') THEN
+        INSERT INTO storage_deletions (name) VALUES (OLD.drums_file_name);
+        IF OLD.stem_file_name IS NOT NULL THEN
+            INSERT INTO storage_deletions (name) VALUES (OLD.stem_file_name);
+        END IF;
+        -- Outputs of the local generation backend live in the same bucket.
+        INSERT INTO storage_deletions (name)
+        SELECT substr(url, length('local://') + 1) FROM unnest(ARRAY[OLD.music_url, OLD.stem_url]) AS url
+        WHERE url LIKE 'local://%';
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER generation_jobs_storage_trigger
+    AFTER DELETE OR UPDATE OF status ON generation_jobs
+    FOR EACH ROW EXECUTE FUNCTION enqueue_job_files();
@@ -0,0 +1,20 @@
+CREATE TYPE job_status as ENUM('QUEUED', 'RUNNING', 'COMPLETED', 'FAILED');
+
+CREATE TABLE generation_jobs (
+    id SERIAL PRIMARY KEY,
+    arrangement_id INT NOT NULL REFERENCES arrangements(id) ON DELETE CASCADE,
+    drums_file_name VARCHAR(255) NOT NULL,
+    bpm FLOAT NOT NULL,
+    tags VARCHAR(1000) NOT NULL,
+    status job_status NOT NULL DEFAULT 'QUEUED',
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 3,
+    locked_by VARCHAR(255),
+    locked_until TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX generation_jobs_queued_idx ON generation_jobs (id) WHERE status = 'QUEUED';
+CREATE INDEX generation_jobs_running_idx ON generation_jobs (locked_until) WHERE status = 'RUNNING';
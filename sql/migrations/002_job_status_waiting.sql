@@ -0,0 +1 @@
+ALTER TYPE job_status ADD VALUE 'WAITING' AFTER 'RUNNING';
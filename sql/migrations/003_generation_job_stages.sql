@@ -0,0 +1,9 @@
+CREATE TYPE job_stage as ENUM('GENERATE', 'SEPARATE', 'MIX');
+
+ALTER TABLE generation_jobs
+    ADD COLUMN stage job_stage NOT NULL DEFAULT 'GENERATE',
+    ADD COLUMN prediction_id VARCHAR(255),
+    ADD COLUMN music_url TEXT,
+    ADD COLUMN stem_url TEXT;
+
+CREATE INDEX generation_jobs_waiting_idx ON generation_jobs (updated_at) WHERE status = 'WAITING';
@@ -0,0 +1,14 @@
+CREATE TYPE share_job_status as ENUM('QUEUED', 'RENDERING', 'UPLOADING', 'COMPLETED', 'FAILED');
+
+CREATE TABLE share_jobs (
+    id SERIAL PRIMARY KEY,
+    arrangement_id INT NOT NULL REFERENCES arrangements(id) ON DELETE CASCADE,
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    upload_url TEXT NOT NULL,
+    status share_job_status NOT NULL DEFAULT 'QUEUED',
+    response TEXT,
+    response_code INT,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1 @@
+CREATE INDEX arrangements_user_created_idx ON arrangements (user_id, created_at DESC, id DESC);
@@ -0,0 +1,17 @@
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE arrangements
+    ADD COLUMN tag_list VARCHAR(100)[] NOT NULL DEFAULT '{}',
+    ADD COLUMN search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', name), 'A') || setweight(to_tsvector('simple', tags), 'B')
+    ) STORED;
+
+UPDATE arrangements SET tag_list = ARRAY(
+    SELECT DISTINCT lower(regexp_replace(btrim(tag), '\s+', ' ', 'g'))
+    FROM unnest(string_to_array(tags, ',')) AS tag
+    WHERE btrim(tag) <> ''
+);
+
+CREATE INDEX arrangements_search_idx ON arrangements USING GIN (search_vector);
+CREATE INDEX arrangements_tag_list_idx ON arrangements USING GIN (tag_list);
+CREATE INDEX arrangements_name_trgm_idx ON arrangements USING GIN (name gin_trgm_ops);
@@ -0,0 +1,40 @@
+BEGIN;
+
+-- Block arrangement writes until the trigger and the backfill are both in place.
+LOCK TABLE arrangements IN SHARE ROW EXCLUSIVE MODE;
+
+CREATE TABLE arrangement_counters (
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    status arrangement_status NOT NULL,
+    count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, status)
+);
+
+CREATE FUNCTION update_arrangement_counters() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.user_id IS NOT DISTINCT FROM NEW.user_id AND OLD.status = NEW.status THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE arrangement_counters SET count = count - 1
+        WHERE user_id = OLD.user_id AND status = OLD.status;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.user_id IS NOT NULL THEN
+        INSERT INTO arrangement_counters (user_id, status, count) VALUES (NEW.user_id, NEW.status, 1)
+        ON CONFLICT (user_id, status) DO UPDATE SET count = arrangement_counters.count + 1;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER arrangements_counters_trigger
+    AFTER INSERT OR DELETE OR UPDATE OF user_id, status ON arrangements
+    FOR EACH ROW EXECUTE FUNCTION update_arrangement_counters();
+
+INSERT INTO arrangement_counters (user_id, status, count)
+SELECT user_id, status, COUNT(*) FROM arrangements WHERE user_id IS NOT NULL GROUP BY user_id, status;
+
+COMMIT;
@@ -0,0 +1,43 @@
+CREATE INDEX arrangements_file_name_idx ON arrangements (file_name);
+CREATE INDEX generation_jobs_drums_file_name_idx ON generation_jobs (drums_file_name);
+
+CREATE TABLE storage_deletions (
+    id BIGSERIAL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    artifacts BOOLEAN NOT NULL DEFAULT FALSE,
+    attempts INT NOT NULL DEFAULT 0,
+    not_before TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX storage_deletions_due_idx ON storage_deletions (not_before);
+CREATE INDEX storage_deletions_name_idx ON storage_deletions (name);
+
+CREATE FUNCTION enqueue_arrangement_files() RETURNS TRIGGER AS $$
+BEGIN
+    IF OLD.file_name IS NOT NULL AND (TG_OP = 'DELETE' OR OLD.file_name IS DISTINCT FROM NEW.file_name) THEN
+        INSERT INTO storage_deletions (name, artifacts) VALUES (OLD.file_name, TRUE);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER arrangements_storage_trigger
+    AFTER DELETE OR UPDATE OF file_name ON arrangements
+    FOR EACH ROW EXECUTE FUNCTION enqueue_arrangement_files();
+
+CREATE FUNCTION enqueue_drums_file() RETURNS TRIGGER AS $$
+BEGIN
+    IF OLD.status <> 'COMPLETED' AND (TG_OP = 'DELETE' OR NEW.status = 'COMPLETED') THEN
+        INSERT INTO storage_deletions (name) VALUES (OLD.drums_file_name);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER generation_jobs_storage_trigger
+    AFTER DELETE OR UPDATE OF status ON generation_jobs
+    FOR EACH ROW EXECUTE FUNCTION enqueue_drums_file();
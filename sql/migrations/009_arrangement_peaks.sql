@@ -0,0 +1 @@
+ALTER TABLE arrangements ADD COLUMN peaks SMALLINT[];
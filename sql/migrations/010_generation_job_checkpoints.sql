@@ -0,0 +1,26 @@
+ALTER TABLE generation_jobs
+    ADD COLUMN music_prediction_id VARCHAR(255),
+    ADD COLUMN stem_prediction_id VARCHAR(255),
+    ADD COLUMN stem_file_name VARCHAR(255);
+
+CREATE INDEX generation_jobs_stem_file_name_idx ON generation_jobs (stem_file_name);
+
+DROP TRIGGER generation_jobs_storage_trigger ON generation_jobs;
+DROP FUNCTION enqueue_drums_file();
+
+CREATE FUNCTION enqueue_job_files() RETURNS TRIGGER AS $$
+BEGIN
+    IF OLD.status <> 'COMPLETED' AND (TG_OP = 'DELETE' OR NEW.status = 'COMPLETED') THEN
+        INSERT INTO storage_deletions (name) VALUES (OLD.drums_file_name);
+        IF OLD.stem_file_name IS NOT NULL THEN
+            INSERT INTO storage_deletions (name) VALUES (OLD.stem_file_name);
+        END IF;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER generation_jobs_storage_trigger
+    AFTER DELETE OR UPDATE OF status ON generation_jobs
+    FOR EACH ROW EXECUTE FUNCTION enqueue_job_files();
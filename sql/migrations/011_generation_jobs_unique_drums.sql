@@ -0,0 +1,2 @@
+DROP INDEX generation_jobs_drums_file_name_idx;
+CREATE UNIQUE INDEX generation_jobs_drums_file_name_idx ON generation_jobs (drums_file_name);
@@ -0,0 +1,3 @@
+ALTER TABLE storage_deletions
+    ALTER COLUMN not_before SET DEFAULT (now() AT TIME ZONE 'utc'),
+    ALTER COLUMN created_at SET DEFAULT (now() AT TIME ZONE 'utc');
@@ -0,0 +1,16 @@
+CREATE OR REPLACE FUNCTION enqueue_job_files() RETURNS TRIGGER AS $$
+BEGIN
+    IF OLD.status <> 'COMPLETED' AND (TG_OP = 'DELETE' OR NEW.status = 'COMPLETED') THEN
+        INSERT INTO storage_deletions (name) VALUES (OLD.drums_file_name);
+        IF OLD.stem_file_name IS NOT NULL THEN
+            INSERT INTO storage_deletions (name) VALUES (OLD.stem_file_name);
+        END IF;
+        -- Outputs of the local generation backend live in the same bucket.
+        INSERT INTO storage_deletions (name)
+        SELECT substr(url, length('local://') + 1) FROM unnest(ARRAY[OLD.music_url, OLD.stem_url]) AS url
+        WHERE url LIKE 'local://%';
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
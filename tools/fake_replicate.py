@@ -0,0 +1,175 @@
+"""Minimal stand-in for the Replicate predictions API.
+
+Run it locally and point the backend at it:
+
+    python tools/fake_replicate.py --port 5401 --delay 3
+    REPLICATE_BASE_URL=http://localhost:5401 REPLICATE_API_TOKEN=fake python run.py
+
+Predictions move from ``starting`` to ``processing`` to ``succeeded`` after
+``--delay`` seconds (plus up to ``--jitter`` more), serve one of a few canned
+WAV stems as output and, when created with a webhook, post
+``start``/``completed`` events signed like Replicate does.
+"""
+import argparse
+import base64
+import datetime
+import functools
+import hashlib
+import hmac
+import io
+import json
+import math
+import random
+import struct
+import threading
+import time
+import uuid
+import wave
+import requests
+from flask import Flask, Response, abort, jsonify, request
+
+MUSIC_GEN_VERSION = "f8140d0457c2b39ad8728a80736fea9a67a0ec0cd37b35f40b68cce507db2366"
+
+app = Flask(__name__)
+predictions = {}
+lock = threading.Lock()
+settings = {'delay': 3.0, 'jitter': 0.0, 'fail_rate': 0.0, 'secret': None, 'base_url': None}
+
+
+@functools.lru_cache(maxsize=64)
+def render_wav(seconds: float, frequency: float, frame_rate: int = 32000) -> bytes:
+    frames = bytearray()
+    for i in range(int(seconds * frame_rate)):
+        sample = int(12000 * math.sin(2 * math.pi * frequency * i / frame_rate))
+        frames += struct.pack('<hh', sample, sample)
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(frame_rate)
+        wav.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+def now() -> str:
+    return datetime.datetime.utcnow().isoformat() + 'Z'
+
+
+def send_webhook(prediction: dict) -> None:
+    url = prediction.get('webhook')
+    if not url:
+        return
+
+    body = json.dumps(prediction).encode()
+    webhook_id = f"msg_{uuid.uuid4().hex}"
+    timestamp = str(int(time.time()))
+    headers = {'Content-Type': 'application/json', 'webhook-id': webhook_id, 'webhook-timestamp': timestamp}
+    if settings['secret']:
+        key = base64.b64decode(settings['secret'].split('_', 1)[-1])
+        digest = hmac.new(key, f"{webhook_id}.{timestamp}.".encode() + body, hashlib.sha256).digest()
+        headers['webhook-signature'] = f"v1,{base64.b64encode(digest).decode()}"
+
+    try:
+        requests.post(url, data=body, headers=headers, timeout=10)
+    except requests.RequestException as e:
+        app.logger.error(f"Webhook delivery to {url} failed: {e}")
+
+
+def run_prediction(prediction_id: str) -> None:
+    with lock:
+        prediction = predictions[prediction_id]
+        prediction['status'] = 'processing'
+        prediction['started_at'] = now()
+        snapshot = dict(prediction)
+    send_webhook(snapshot)
+
+    time.sleep(settings['delay'] + random.uniform(0, settings['jitter']))
+
+    with lock:
+        if prediction['status'] == 'canceled':
+            return
+        failed = (hash(prediction_id) % 1000) / 1000 < settings['fail_rate']
+        prediction['status'] = 'failed' if failed else 'succeeded'
+        prediction['completed_at'] = now()
+        if failed:
+            prediction['error'] = 'Fake prediction failure'
+        else:
+            file_url = f"{settings['base_url']}/files/{prediction_id}.wav"
+            is_music_gen = prediction['version'] == MUSIC_GEN_VERSION
+            prediction['output'] = {'variation_01': file_url} if is_music_gen else {'other': file_url}
+        snapshot = dict(prediction)
+    send_webhook(snapshot)
+
+
+@app.post('/v1/predictions')
+def create_prediction():
+    data = request.get_json()
+    prediction_id = uuid.uuid4().hex[:26]
+    prediction = {
+        'id': prediction_id,
+        'model': 'fake/model',
+        'version': data.get('version'),
+        'input': data.get('input', {}),
+        'output': None,
+        'logs': '',
+        'error': None,
+        'status': 'starting',
+        'created_at': now(),
+        'webhook': data.get('webhook'),
+        'urls': {
+            'get': f"{settings['base_url']}/v1/predictions/{prediction_id}",
+            'cancel': f"{settings['base_url']}/v1/predictions/{prediction_id}/cancel"
+        }
+    }
+    with lock:
+        predictions[prediction_id] = prediction
+    threading.Thread(target=run_prediction, args=(prediction_id,), daemon=True).start()
+    return jsonify(prediction), 201
+
+
+@app.get('/v1/predictions/<prediction_id>')
+def get_prediction(prediction_id):
+    with lock:
+        if prediction_id not in predictions:
+            abort(404)
+        return jsonify(predictions[prediction_id])
+
+
+@app.post('/v1/predictions/<prediction_id>/cancel')
+def cancel_prediction(prediction_id):
+    with lock:
+        if prediction_id not in predictions:
+            abort(404)
+        prediction = predictions[prediction_id]
+        if prediction['status'] not in ('succeeded', 'failed', 'canceled'):
+            prediction['status'] = 'canceled'
+            prediction['completed_at'] = now()
+        return jsonify(prediction)
+
+
+@app.get('/files/<prediction_id>.wav')
+def get_file(prediction_id):
+    with lock:
+        prediction = predictions.get(prediction_id)
+    if prediction is None or prediction['status'] != 'succeeded':
+        abort(404)
+
+    bpm = float(prediction['input'].get('bpm', 120))
+    seconds = prediction['input'].get('max_duration', math.ceil(60 / bpm * 16) + 2)
+    return Response(render_wav(seconds, 220 * 2 ** (hash(prediction_id) % 12 / 12)), mimetype='audio/wav')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5401)
+    parser.add_argument('--delay', type=float, default=3.0, help='Seconds each prediction spends processing')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random processing time, in seconds')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Fraction of predictions that fail')
+    parser.add_argument('--webhook-secret', help='whsec_... secret used to sign webhooks')
+    args = parser.parse_args()
+
+    settings.update(delay=args.delay, jitter=args.jitter, fail_rate=args.fail_rate, secret=args.webhook_secret,
+                    base_url=f"http://{args.host}:{args.port}")
+    app.run(host=args.host, port=args.port, threaded=True)
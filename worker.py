@@ -0,0 +1,18 @@
+import os
+import signal
+from app.main import create_app
+from app.main.controller import websocket_controller
+from app.main.service import job_worker, storage_reaper
+from app.main.util import metrics
+
+app = create_app()
+
+if __name__ == '__main__':
+    stop_event = job_worker.start_workers(int(os.getenv('GENERATION_WORKERS', 5)), websocket_controller.arrangement_status_changed)
+    storage_reaper.start_reaper(stop_event)
+    if os.getenv('METRICS_PORT'):
+        metrics.start_server(int(os.getenv('METRICS_PORT')))
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    while not stop_event.is_set():
+        stop_event.wait(1)